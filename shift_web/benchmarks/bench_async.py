@@ -0,0 +1,122 @@
+"""同時に多数の画像がアップロードされた場合の，同期の処理と非同期の処理のスループットを比較する負荷試験
+
+遅延を設定した偽のVision API(同期版・非同期版)とGoogleカレンダーを使い，
+JobManagerにuploads件のジョブを一度に登録してから全て終わるまでの時間を計測する．
+
+- sync: スレッドのワーカー(--workers)でmainを実行する(従来の処理)
+- async: 専用のイベントループでmain_asyncを実行する．Vision APIの応答はイベントループ上で待ち，
+  Googleカレンダーへの書き込みは上限付きのスレッドプール(ASYNC_CALENDAR_WORKERS)で行う
+
+Usage:
+    shift_webディレクトリで実行する
+    $ python -m benchmarks.bench_async --uploads 64 --vision-latency 0.5
+"""
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from google.auth.credentials import AnonymousCredentials
+from google.cloud import vision
+
+from benchmarks.synthetic import make_image, make_response_dict
+from src.calendar_client import CalendarClient
+from src.client_registry import registry
+from src.image_processor.ocr_cache import OcrCache
+from src.image_processor.vision_client import VisionClient
+from src.job_manager import JobManager
+from src.main import main as run_sync, main_async
+from src.testing.fake_calendar import FakeCalendarHttp
+from src.testing.fake_vision import FakeImageAnnotatorAsyncClient, FakeImageAnnotatorClient
+
+
+def register_fakes(args: argparse.Namespace) -> tuple[FakeImageAnnotatorClient, FakeImageAnnotatorAsyncClient, FakeCalendarHttp]:
+    """プロセス内で共有するクライアントを偽のVision API・Googleカレンダーを使うものに置き換える関数
+    Returns:
+        tuple: (同期版のVision API，非同期版のVision API，Googleカレンダー)
+    """
+    response = vision.AnnotateImageResponse(make_response_dict(row_count=31, chars_per_row=24))
+    sync_client = FakeImageAnnotatorClient(lambda content: response, latency=args.vision_latency)
+    async_client = FakeImageAnnotatorAsyncClient(lambda content: response, latency=args.vision_latency)
+    fake_http = FakeCalendarHttp(latency=args.calendar_latency)
+    registry.register(
+        "vision",
+        lambda: VisionClient(
+            ocr_cache=OcrCache(ttl=0),
+            save_response=False,
+            client=sync_client,
+            async_client_factory=lambda: async_client,
+        ),
+    )
+    registry.register(
+        "calendar",
+        lambda: CalendarClient(http_factory=lambda: fake_http, credentials=AnonymousCredentials()),
+    )
+
+    return sync_client, async_client, fake_http
+
+
+def run_load(manager: JobManager, paths: list[str]) -> tuple[float, int, int]:
+    """全てのジョブを一度に登録し，終わるまでの時間を計測する関数
+    Returns:
+        tuple[float, int, int]: (経過時間(秒)，成功したジョブの数，実行中のスレッドの数の最大値)
+    """
+    peak_threads = threading.active_count()
+    start = time.perf_counter()
+    job_ids = [manager.submit(path) for path in paths]
+    jobs = list()
+    for job_id in job_ids:
+        while (job := manager.wait(job_id, timeout=0.05)).status not in ("succeeded", "failed"):
+            peak_threads = max(peak_threads, threading.active_count())
+        jobs.append(job)
+    elapsed = time.perf_counter() - start
+    manager.shutdown()
+
+    return elapsed, sum(job.status == "succeeded" for job in jobs), peak_threads
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--uploads", type=int, default=64, help="同時にアップロードされる画像の数")
+    parser.add_argument("--workers", type=int, default=2, help="同期の処理のワーカーの数")
+    parser.add_argument("--max-async-jobs", type=int, default=64, help="非同期の処理で同時に実行するジョブの上限")
+    parser.add_argument("--vision-latency", type=float, default=0.5, help="Vision APIの応答の遅延(秒)")
+    parser.add_argument("--calendar-latency", type=float, default=0.05, help="Googleカレンダーの1リクエストあたりの遅延(秒)")
+    parser.add_argument("--modes", nargs="+", choices=("sync", "async"), default=["sync", "async"], help="計測する処理")
+    args = parser.parse_args()
+
+    # 成果物は残さず，予定はバッチリクエストで追加する(同じシフトを繰り返し追加しても衝突しない)
+    os.environ["SHIFT_ARTIFACTS"] = "0"
+    os.environ["CALENDAR_WRITE_MODE"] = "batch"
+    os.environ.setdefault("GOOGLE_CALENDAR_ID", "bench@example.com")
+    sync_client, async_client, fake_http = register_fakes(args)
+
+    print(f"{'mode':>6}{'uploads':>9}{'time[s]':>9}{'jobs/s':>8}{'ok':>5}{'threads':>9}{'vision_in_flight':>18}{'calendar_rt':>13}")
+    with tempfile.TemporaryDirectory() as work_dir:
+        paths = list()
+        for i in range(args.uploads):
+            path = os.path.join(work_dir, f"upload_{i}.jpg")
+            with open(path, "wb") as f:
+                f.write(make_image(row_count=31, seed=i))
+            paths.append(path)
+
+        for mode in args.modes:
+            round_trips = fake_http.round_trips
+            if mode == "sync":
+                manager = JobManager(runner=run_sync, max_workers=args.workers)
+                in_flight = args.workers
+            else:
+                manager = JobManager(runner=run_sync, async_runner=main_async, max_async_jobs=args.max_async_jobs)
+            elapsed, succeeded, threads = run_load(manager, paths)
+            if mode == "async":
+                in_flight = async_client.max_in_flight
+            print(
+                f"{mode:>6}{args.uploads:>9}{elapsed:>9.2f}{args.uploads / elapsed:>8.1f}{succeeded:>5}{threads:>9}"
+                f"{in_flight:>18}{fake_http.round_trips - round_trips:>13}"
+            )
+
+
+if __name__ == "__main__":
+    main()
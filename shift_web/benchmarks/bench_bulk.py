@@ -0,0 +1,85 @@
+"""フォルダ内の画像をまとめて処理する場合(src/bulk.py)の，同時に抽出する数と変換するプロセスの数によるスループットを計測するベンチマーク
+
+遅延を設定した偽のVision APIとGoogleカレンダーを使い，--images枚の画像を設定ごとに処理して
+所要時間・1秒あたりの画像の数・段階ごとの合計時間を表示する．最後に同じマニフェストで再実行し，
+全ての画像が処理済みとして飛ばされることを確かめる．
+
+Usage:
+    shift_webディレクトリで実行する
+    $ python -m benchmarks.bench_bulk --images 48 --vision-latency 0.3 --configs 1/0 8/0 8/4
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+
+from google.auth.credentials import AnonymousCredentials
+from google.cloud import vision
+
+from benchmarks.synthetic import make_image, make_response_dict
+from src.bulk import Manifest, run_bulk
+from src.calendar_client import CalendarClient
+from src.image_processor.ocr_cache import OcrCache
+from src.image_processor.vision_client import VisionClient
+from src.testing.fake_calendar import FakeCalendarHttp
+from src.testing.fake_vision import FakeImageAnnotatorClient
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", type=int, default=48, help="処理する画像の枚数")
+    parser.add_argument("--rows", type=int, default=31, help="1枚あたりのシフト表の行数")
+    parser.add_argument("--vision-latency", type=float, default=0.3, help="Vision APIの1リクエストあたりの遅延(秒)")
+    parser.add_argument("--calendar-latency", type=float, default=0.05, help="Googleカレンダーの1リクエストあたりの遅延(秒)")
+    parser.add_argument("--configs", nargs="+", default=["1/0", "8/0", "8/4"], help="同時に抽出する数/変換するプロセスの数")
+    parser.add_argument("--calendar", action="store_true", help="Googleカレンダーにも書き込む")
+    args = parser.parse_args()
+
+    os.environ.setdefault("GOOGLE_CALENDAR_ID", "bench@example.com")
+    logging.disable(logging.WARNING)
+    response = vision.AnnotateImageResponse(make_response_dict(row_count=args.rows, chars_per_row=24))
+    vision_client = VisionClient(
+        ocr_cache=OcrCache(ttl=0),
+        save_response=False,
+        client=FakeImageAnnotatorClient(lambda content: response, latency=args.vision_latency),
+    )
+    fake_http = FakeCalendarHttp(latency=args.calendar_latency)
+    calendar_client = (
+        CalendarClient(http_factory=lambda: fake_http, credentials=AnonymousCredentials(), max_concurrency=8)
+        if args.calendar
+        else None
+    )
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        images = list()
+        for index in range(args.images):
+            path = os.path.join(work_dir, f"{index:04}.jpg")
+            with open(path, "wb") as f:
+                f.write(make_image(row_count=args.rows, seed=index))
+            images.append(path)
+
+        print(f"{'ocr':>4}{'proc':>6}{'time[s]':>9}{'img/s':>8}{'prep[s]':>8}{'ocr[s]':>8}{'parse[s]':>10}{'cal[s]':>8}{'shifts':>8}{'skipped':>9}")
+        for config in args.configs:
+            ocr_concurrency, processes = (int(value) for value in config.split("/"))
+            manifest_path = os.path.join(work_dir, f"manifest-{ocr_concurrency}-{processes}.jsonl")
+            for _ in range(2):
+                # 2回目は同じマニフェストで再実行する(全て飛ばされる)
+                report = run_bulk(
+                    images,
+                    vision_client,
+                    manifest=Manifest(manifest_path),
+                    calendar_client=calendar_client,
+                    calendar_mode="batch",
+                    ocr_concurrency=ocr_concurrency,
+                    processes=processes,
+                )
+                print(
+                    f"{ocr_concurrency:>4}{processes:>6}{report.elapsed:>9.2f}{report.images_per_second:>8.1f}"
+                    f"{report.prepare_seconds:>8.1f}{report.ocr_seconds:>8.1f}{report.parse_seconds:>10.1f}{report.calendar_seconds:>8.1f}"
+                    f"{report.shifts:>8}{report.skipped:>9}"
+                )
+
+
+if __name__ == "__main__":
+    main()
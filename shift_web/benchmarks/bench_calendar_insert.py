@@ -0,0 +1,68 @@
+"""Googleカレンダーへ1件ずつ予定を追加する処理(create_events)の同時実行数と流量制限への対応を計測するベンチマーク
+
+遅延と同時に受け付ける数の上限(流量制限)を設定した偽のGoogleカレンダーに対し，
+同時に送る数の上限(--concurrency)ごとに1か月分のシフトを追加し，時間・通信回数・流量制限を受けた回数・
+偽のGoogleカレンダーが同時に処理した数の最大値・調整後の同時に送る数の上限を表示する．
+同じクライアントで--rounds回続けて追加し，2回目以降に流量制限を受けにくくなることも確かめる．
+
+Usage:
+    shift_webディレクトリで実行する
+    $ python -m benchmarks.bench_calendar_insert --shifts 30 --latency 0.1 --server-limits 0 10
+"""
+
+import argparse
+import os
+import time
+
+from google.auth.credentials import AnonymousCredentials
+
+from src.calendar_client import CalendarClient
+from src.dataclass.shift import Shift
+from src.testing.fake_calendar import FakeCalendarHttp
+
+
+def make_shifts(count: int) -> list[Shift]:
+    """1日1件のシフトデータを作成する関数"""
+    return [
+        Shift(
+            summary="バイト",
+            start_datetime=f"2025-{4 + day // 28:02}-{day % 28 + 1:02}T17:00:00+09:00",
+            end_datetime=f"2025-{4 + day // 28:02}-{day % 28 + 1:02}T21:00:00+09:00",
+            timezone="Asia/Tokyo",
+        )
+        for day in range(count)
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shifts", type=int, default=30, help="追加するシフトの数")
+    parser.add_argument("--latency", type=float, default=0.1, help="Googleカレンダーの1リクエストあたりの遅延(秒)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 32], help="同時に送る数の上限")
+    parser.add_argument("--server-limits", type=int, nargs="+", default=[0, 10], help="偽のGoogleカレンダーが同時に受け付ける数(0の場合は制限なし)")
+    parser.add_argument("--rounds", type=int, default=2, help="同じクライアントで続けて追加する回数")
+    args = parser.parse_args()
+
+    os.environ.setdefault("GOOGLE_CALENDAR_ID", "bench@example.com")
+    shifts = make_shifts(args.shifts)
+    print(f"{'server':>7}{'conc':>6}{'round':>6}{'time[s]':>9}{'added':>7}{'requests':>10}{'throttled':>10}{'in_flight':>10}{'limit':>7}")
+    for server_limit in args.server_limits:
+        for concurrency in args.concurrency:
+            fake_http = FakeCalendarHttp(latency=args.latency, max_concurrency=server_limit or None)
+            client = CalendarClient(
+                http_factory=lambda: fake_http, credentials=AnonymousCredentials(), max_concurrency=concurrency
+            )
+            for round_index in range(args.rounds):
+                round_trips, throttled = fake_http.round_trips, fake_http.throttled
+                start = time.perf_counter()
+                results = client.create_events(shifts)
+                elapsed = time.perf_counter() - start
+                print(
+                    f"{server_limit or '-':>7}{concurrency:>6}{round_index + 1:>6}{elapsed:>9.2f}{len(results):>7}"
+                    f"{fake_http.round_trips - round_trips:>10}{fake_http.throttled - throttled:>10}"
+                    f"{fake_http.max_in_flight:>10}{client._limiter.limit:>7.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""1リクエストあたりのクライアント作成コストを計測するベンチマーク
+
+Controllerを作成するたびにVision APIとGoogleカレンダーのクライアントを作り直す場合(cold)と，
+プロセス内で共有したクライアントを使う場合(warm)を比較する．
+
+Usage:
+    shift_webディレクトリで実行する
+    $ python -m benchmarks.bench_client_setup --repeat 20
+
+Notes:
+    GOOGLE_CLOUD_API_KEY_PATHが設定されていない場合は，鍵ファイルの読み込みを
+    匿名の認証情報に置き換えて計測する．通信は発生しないため，TLSハンドシェイクの時間は含まない
+"""
+
+import argparse
+import os
+import statistics
+import time
+from contextlib import ExitStack
+from unittest.mock import patch
+
+from src.client_registry import _create_default_registry
+from src.controller import Controller
+
+
+def _measure(create_controller, repeat: int) -> list[float]:
+    """Controllerの作成にかかる時間をrepeat回計測する関数
+    Args:
+        create_controller (Callable[[], Controller]): Controllerを作成する関数
+        repeat (int): 計測回数
+    Returns:
+        list[float]: 計測結果(ミリ秒)
+    """
+    timings = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        create_controller()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20, help="計測回数")
+    args = parser.parse_args()
+
+    with ExitStack() as stack:
+        if not os.getenv("GOOGLE_CLOUD_API_KEY_PATH"):
+            from google.auth.credentials import AnonymousCredentials
+
+            stack.enter_context(
+                patch(
+                    "google.oauth2.service_account.Credentials.from_service_account_file",
+                    side_effect=lambda *args, **kwargs: AnonymousCredentials(),
+                )
+            )
+
+        # cold: リクエストごとにクライアントを作り直す
+        cold = _measure(
+            lambda: Controller("result/bench", registry=_create_default_registry()),
+            args.repeat,
+        )
+
+        # warm: 共有のレジストリから取得する(初回の作成は計測に含めない)
+        shared_registry = _create_default_registry()
+        Controller("result/bench", registry=shared_registry)
+        warm = _measure(
+            lambda: Controller("result/bench", registry=shared_registry),
+            args.repeat,
+        )
+
+    print(f"{'':6}{'mean[ms]':>10}{'median[ms]':>12}{'max[ms]':>10}")
+    for name, timings in (("cold", cold), ("warm", warm)):
+        print(
+            f"{name:6}{statistics.mean(timings):>10.2f}"
+            f"{statistics.median(timings):>12.2f}{max(timings):>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
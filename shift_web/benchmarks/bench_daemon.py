@@ -0,0 +1,121 @@
+"""パイプラインのワーカーを--workers個起動するまでの時間と，ワーカー全体のメモリ使用量(PSS)を計測するベンチマーク
+
+- spawn: ワーカーごとに新しいPythonのプロセスでモジュールを読み込む(Webのワーカーがそれぞれ読み込む場合に相当)
+- fork: PipelineDaemonが親プロセスで1度だけ読み込み，gc.freezeの後にワーカーをforkする
+
+どちらもワーカーの準備ができた後に1度GCを実行してから，親プロセスを含む全てのプロセスのPSS
+(共有しているページはプロセス数で割って数えたメモリ使用量)の合計を/proc/[pid]/smaps_rollupから読む．
+
+Usage:
+    shift_webディレクトリで実行する(Linuxのみ)
+    $ python -m benchmarks.bench_daemon --workers 4
+"""
+
+import argparse
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from src.job_queue import SpoolQueue
+from src.pipeline_daemon import PipelineDaemon, init_worker, preload
+
+# spawnの各ワーカーで実行するコード
+SPAWN_SCRIPT = """
+import gc, logging, sys, time
+logging.disable(logging.WARNING)
+from src.pipeline_daemon import init_worker, preload
+preload()
+init_worker()
+gc.collect()
+open(sys.argv[1], "w").close()
+time.sleep(600)
+"""
+
+
+def pss_kib(pid: int) -> int:
+    """プロセスのPSS(KiB)を返す関数"""
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            if line.startswith("Pss:"):
+                return int(line.split()[1])
+
+    return 0
+
+
+def wait_ready(ready_dir: str, count: int) -> None:
+    """ready_dirにcount個のファイルができるまで待つ関数"""
+    while len(os.listdir(ready_dir)) < count:
+        time.sleep(0.01)
+
+
+def run_spawn(workers: int, ready_dir: str) -> tuple[float, int]:
+    """ワーカーごとに新しいプロセスで読み込み，(全てのワーカーの準備ができるまでの秒数，PSSの合計(KiB))を返す関数"""
+    start = time.perf_counter()
+    processes = [
+        subprocess.Popen([sys.executable, "-c", SPAWN_SCRIPT, os.path.join(ready_dir, str(i))])
+        for i in range(workers)
+    ]
+    try:
+        wait_ready(ready_dir, workers)
+        elapsed = time.perf_counter() - start
+        total = sum(pss_kib(process.pid) for process in processes)
+    finally:
+        for process in processes:
+            process.kill()
+            process.wait()
+
+    return elapsed, total
+
+
+def run_fork(workers: int, ready_dir: str, spool_dir: str) -> tuple[float, int]:
+    """PipelineDaemonでワーカーをforkし，(全てのワーカーの準備ができるまでの秒数，PSSの合計(KiB))を返す関数"""
+    import gc
+
+    def init() -> None:
+        init_worker()
+        gc.collect()
+        open(os.path.join(ready_dir, str(os.getpid())), "w").close()
+
+    daemon = PipelineDaemon(SpoolQueue(spool_dir), runner=lambda path: [], workers=workers, init_worker=init)
+    result = dict()
+
+    def measure() -> None:
+        wait_ready(ready_dir, workers)
+        result["elapsed"] = time.perf_counter() - start
+        pids = [os.getpid()] + [int(name) for name in os.listdir(ready_dir)]
+        result["pss"] = sum(pss_kib(pid) for pid in pids)
+        daemon.stop()
+
+    start = time.perf_counter()
+    threading.Thread(target=measure, daemon=True).start()
+    daemon.run()
+
+    return result["elapsed"], result["pss"]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4, help="ワーカーの数")
+    parser.add_argument("--modes", nargs="+", default=["spawn", "fork"], choices=["spawn", "fork"], help="計測する方法")
+    args = parser.parse_args()
+
+    # 認証情報がない環境ではクライアントを作成できない旨の警告を表示しない
+    logging.disable(logging.WARNING)
+    print(f"{'mode':>6}{'workers':>9}{'ready[s]':>10}{'pss[MiB]':>10}")
+    for mode in args.modes:
+        with tempfile.TemporaryDirectory() as work_dir:
+            ready_dir = os.path.join(work_dir, "ready")
+            os.makedirs(ready_dir)
+            if mode == "spawn":
+                elapsed, total = run_spawn(args.workers, ready_dir)
+            else:
+                elapsed, total = run_fork(args.workers, ready_dir, os.path.join(work_dir, "spool"))
+        print(f"{mode:>6}{args.workers:>9}{elapsed:>10.2f}{total / 1024:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
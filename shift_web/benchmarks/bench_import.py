@@ -0,0 +1,88 @@
+"""Djangoのワーカーが起動時に読み込むモジュールの読み込み時間と，最大メモリ使用量を計測するベンチマーク
+
+モジュールごとに新しいPythonのプロセスを`python -X importtime`で--repeat回起動し，
+読み込み時間(累積)の中央値・最大常駐メモリ(maxrss)・読み込みに時間がかかったパッケージを表示する．
+--checkを指定した場合は，src.mainの読み込み時に重いモジュール(FORBIDDEN)を読み込んでいれば失敗する．
+
+Usage:
+    shift_webディレクトリで実行する
+    $ python -m benchmarks.bench_import --repeat 5 --check
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+
+# src.mainの読み込み時(Djangoのワーカーの起動時)に読み込んではいけないモジュール
+FORBIDDEN = (
+    "google.cloud.vision",
+    "googleapiclient",
+    "google.oauth2.service_account",
+    "numpy",
+    "PIL",
+    "unittest.mock",
+    "dotenv",
+)
+
+# 子プロセスで実行するコード．読み込み後の最大常駐メモリ(KiB)を標準出力に表示する
+SCRIPT = "import resource, {module}; print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"
+
+
+def measure(module: str) -> tuple[float, int, dict[str, float]]:
+    """新しいプロセスでモジュールを読み込み，読み込み時間を計測する関数
+    Args:
+        module (str): 読み込むモジュール名
+    Returns:
+        tuple[float, int, dict[str, float]]: (読み込み時間(ミリ秒)，最大常駐メモリ(KiB)，モジュール名と累積の読み込み時間(ミリ秒)の辞書)
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", SCRIPT.format(module=module)],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    # 形式: "import time: self [us] | cumulative | imported package"
+    loaded = dict()
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        loaded[name.strip()] = int(cumulative) / 1000
+
+    return loaded[module], int(completed.stdout.strip()), loaded
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modules", nargs="+", default=["src.main", "src.job_manager", "src.controller"], help="計測するモジュール")
+    parser.add_argument("--repeat", type=int, default=5, help="モジュールごとにプロセスを起動する回数")
+    parser.add_argument("--top", type=int, default=5, help="表示する時間がかかったパッケージの数")
+    parser.add_argument("--check", action="store_true", help="src.mainの読み込み時に重いモジュールを読み込んでいれば失敗する")
+    args = parser.parse_args()
+
+    print(f"{'module':<18}{'median[ms]':>11}{'maxrss[MiB]':>12}  heaviest")
+    violations = list()
+    for module in args.modules:
+        results = [measure(module) for _ in range(args.repeat)]
+        loaded = results[-1][2]
+        # 最上位のパッケージごとの累積時間
+        top_level = sorted(
+            ((name, elapsed) for name, elapsed in loaded.items() if "." not in name and name != module),
+            key=lambda item: item[1],
+            reverse=True,
+        )[: args.top]
+        print(
+            f"{module:<18}{statistics.median(r[0] for r in results):>11.1f}"
+            f"{statistics.median(r[1] for r in results) / 1024:>12.1f}  "
+            + ", ".join(f"{name} {elapsed:.0f}ms" for name, elapsed in top_level)
+        )
+        if module == "src.main":
+            violations = [name for name in FORBIDDEN if name in loaded]
+
+    if args.check and violations:
+        sys.exit(f"src.mainの読み込み時に読み込まれたモジュール: {', '.join(violations)}")
+
+
+if __name__ == "__main__":
+    main()
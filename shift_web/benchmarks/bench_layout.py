@@ -0,0 +1,61 @@
+"""行のまとめ方(geometry / breaks)ごとに，文字を行ごとにまとめる時間を計測するベンチマーク
+
+geometryは1文字ずつ座標から行にまとめる．breaksはVision APIが検出したセルの末尾の区切りで
+文字列に分けてから行にまとめる．区切りがない抽出結果(breaks(fallback))では，
+breaksが区切りを確認した後にgeometryと同じ処理を行うため，その追加の時間も計測する．
+
+Usage:
+    shift_webディレクトリで実行する
+    $ python -m benchmarks.bench_layout --rows 30 600 3000
+"""
+
+import argparse
+import time
+
+from benchmarks.synthetic import make_response_dict, make_rows
+from src.dataclass.ocr_result import OcrResult
+from src.image_processor.shift_parser import LAYOUT_BREAKS, LAYOUT_GEOMETRY, ShiftParser
+
+
+def measure(parser: ShiftParser, ocr_result: OcrResult, repeat: int) -> tuple[list[str], float]:
+    """行ごとの文字列と，実行時間の最小値(ミリ秒)を返す関数"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        lines = parser._build_lines(ocr_result)
+        best = min(best, time.perf_counter() - start)
+
+    return lines, best * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[30, 600, 3000], help="シフト表の行数")
+    parser.add_argument("--repeat", type=int, default=5, help="計測回数")
+    args = parser.parse_args()
+
+    geometry = ShiftParser(layout=LAYOUT_GEOMETRY)
+    breaks = ShiftParser(layout=LAYOUT_BREAKS)
+    print(
+        f"{'symbols':>8}{'geometry[ms]':>14}{'breaks[ms]':>12}{'speedup':>9}"
+        f"{'breaks(fallback)[ms]':>22}"
+    )
+    for rows in args.rows:
+        with_breaks = OcrResult.from_response_dict(
+            make_response_dict(row_count=rows, cell_breaks=True)
+        )
+        without_breaks = OcrResult.from_response_dict(make_response_dict(row_count=rows))
+        expected = make_rows(rows)
+
+        geometry_lines, geometry_ms = measure(geometry, with_breaks, args.repeat)
+        breaks_lines, breaks_ms = measure(breaks, with_breaks, args.repeat)
+        fallback_lines, fallback_ms = measure(breaks, without_breaks, args.repeat)
+        assert geometry_lines == breaks_lines == fallback_lines == expected
+        print(
+            f"{len(with_breaks.texts):>8}{geometry_ms:>14.2f}{breaks_ms:>12.2f}"
+            f"{geometry_ms / breaks_ms:>8.1f}x{fallback_ms:>22.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""解像度や傾きの異なる画像で，文字を行ごとにまとめる精度と時間を計測するベンチマーク
+
+固定の閾値(10ピクセル)で行を分ける方法(fixed)と，文字の高さと傾きから閾値と基準線を
+求める方法(adaptive)を比較する．精度は，シフト表の行のうち文字列が完全に一致した行の割合とする．
+
+Usage:
+    shift_webディレクトリで実行する
+    $ python -m benchmarks.bench_line_clustering --rows 60
+"""
+
+import argparse
+import time
+from collections import Counter
+
+from benchmarks.synthetic import make_response_dict, make_rows
+from src.dataclass.ocr_result import OcrResult
+from src.image_processor.shift_parser import ShiftParser, SymbolTable
+
+
+# (名前, 1文字の高さ)．幅・行の間隔・揺らぎは高さに比例させる
+RESOLUTIONS = [
+    ("thumbnail", 8),
+    ("scan", 30),
+    ("12MP photo", 120),
+]
+SKEWS = [0.0, 0.05, 0.15]
+
+
+def make_corpus(row_count: int, seed: int) -> list[tuple[str, float, OcrResult, list[str]]]:
+    """解像度と傾きの組み合わせごとに抽出結果を作成する関数
+    Args:
+        row_count (int): 行数
+        seed (int): 乱数のシード
+    Returns:
+        list[tuple[str, float, OcrResult, list[str]]]: (解像度の名前，傾き，抽出結果，正解の行)
+    """
+    corpus = list()
+    for name, char_height in RESOLUTIONS:
+        for skew in SKEWS:
+            response_dict = make_response_dict(
+                row_count=row_count,
+                char_width=char_height * 2 // 3,
+                char_height=char_height,
+                row_pitch=char_height * 3 // 2,
+                seed=seed,
+                jitter=max(1, char_height // 6),
+                skew=skew,
+            )
+            corpus.append(
+                (
+                    name,
+                    skew,
+                    OcrResult.from_response_dict(response_dict),
+                    make_rows(row_count, seed),
+                )
+            )
+
+    return corpus
+
+
+def accuracy(lines: list[str], expected: list[str]) -> float:
+    """正解の行のうち，まとめた行と完全に一致した行の割合を返す関数"""
+    matched = Counter(lines) & Counter(expected)
+
+    return sum(matched.values()) / len(expected)
+
+
+def measure(parser: ShiftParser, ocr_result: OcrResult, repeat: int) -> tuple[list[str], float]:
+    """行ごとの文字列と，実行時間の最小値(ミリ秒)を返す関数"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        lines = parser._assemble_lines(SymbolTable.from_ocr_result(ocr_result))
+        best = min(best, time.perf_counter() - start)
+
+    return lines, best * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=60, help="シフト表の行数")
+    parser.add_argument("--seed", type=int, default=0, help="乱数のシード")
+    parser.add_argument("--repeat", type=int, default=5, help="計測回数")
+    args = parser.parse_args()
+
+    parsers = [("fixed", ShiftParser(line_threshold=10)), ("adaptive", ShiftParser())]
+    print(
+        f"{'resolution':<12}{'skew':>6}"
+        + "".join(f"{name + '[acc]':>15}{name + '[ms]':>14}" for name, _ in parsers)
+    )
+    for name, skew, ocr_result, expected in make_corpus(args.rows, args.seed):
+        row = f"{name:<12}{skew:>6.2f}"
+        for _, shift_parser in parsers:
+            lines, ms = measure(shift_parser, ocr_result, args.repeat)
+            row += f"{accuracy(lines, expected):>15.0%}{ms:>14.2f}"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
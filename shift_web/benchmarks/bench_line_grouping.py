@@ -0,0 +1,93 @@
+"""ShiftParserで文字を行ごとにまとめる処理の時間を計測するベンチマーク
+
+1文字ごとのOcrSymbolから辞書を作りPythonでソート・グループ化する従来の方法(python)と，
+列ごとにまとめた座標をNumPyの配列としてまとめて計算する方法(numpy)を比較する．
+両者の結果が一致することも確認する．
+
+Usage:
+    shift_webディレクトリで実行する
+    $ python -m benchmarks.bench_line_grouping --rows 30 600 3000
+"""
+
+import argparse
+import time
+
+from benchmarks.synthetic import make_response_dict
+from src.dataclass.ocr_result import OcrResult, OcrSymbol
+from src.image_processor.shift_parser import ShiftParser, SymbolTable
+
+
+def assemble_lines_python(symbols: list[OcrSymbol]) -> list[str]:
+    """従来の方法で行ごとの文字列を作成する関数(変更前のShiftParserと同じ処理)"""
+    processed_context = list()
+    for symbol in symbols:
+        vertices = symbol.vertices
+        processed_context.append(
+            {
+                "text": symbol.text,
+                "coordinate": (
+                    (vertices[0][0] + vertices[1][0] + vertices[2][0] + vertices[3][0]) / 4,
+                    (vertices[0][1] + vertices[1][1] + vertices[2][1] + vertices[3][1]) / 4,
+                ),
+            }
+        )
+    sorted_processed_context = sorted(processed_context, key=lambda x: x["coordinate"][1])
+
+    line_context = list()
+    current_line = [sorted_processed_context[0]]
+    current_y = sorted_processed_context[0]["coordinate"][1]
+    for d in sorted_processed_context[1:]:
+        if abs(d["coordinate"][1] - current_y) < 10:
+            current_line.append(d)
+        else:
+            line_context.append(current_line)
+            current_line = [d]
+        current_y = d["coordinate"][1]
+    line_context.append(current_line)
+
+    lines = list()
+    for line in line_context:
+        sorted_line = sorted(line, key=lambda x: x["coordinate"][0])
+        lines.append("".join(t["text"] for t in sorted_line))
+
+    return lines
+
+
+def assemble_lines_numpy(ocr_result: OcrResult) -> list[str]:
+    """NumPyを使う方法で行ごとの文字列を作成する関数"""
+    return ShiftParser()._assemble_lines(SymbolTable.from_ocr_result(ocr_result))
+
+
+def measure(func, data, repeat: int) -> float:
+    """func(data)の実行時間の最小値(ミリ秒)を計測する関数"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(data)
+        best = min(best, time.perf_counter() - start)
+
+    return best * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[30, 600, 3000], help="シフト表の行数")
+    parser.add_argument("--repeat", type=int, default=5, help="計測回数")
+    args = parser.parse_args()
+
+    print(f"{'symbols':>8}{'python[ms]':>12}{'numpy[ms]':>11}{'speedup':>9}")
+    for rows in args.rows:
+        ocr_result = OcrResult.from_response_dict(make_response_dict(row_count=rows))
+        # 従来の方法は変更前と同じく1文字ずつのOcrSymbolを入力とする
+        symbols = ocr_result.symbols
+        assert assemble_lines_python(symbols) == assemble_lines_numpy(ocr_result)
+        python_ms = measure(assemble_lines_python, symbols, args.repeat)
+        numpy_ms = measure(assemble_lines_numpy, ocr_result, args.repeat)
+        print(
+            f"{len(symbols):>8}{python_ms:>12.2f}{numpy_ms:>11.2f}"
+            f"{python_ms / numpy_ms:>8.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
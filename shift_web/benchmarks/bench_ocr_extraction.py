@@ -0,0 +1,74 @@
+"""Vision APIのレスポンスから文字と座標を取り出す処理の時間とメモリを計測するベンチマーク
+
+to_dictで辞書型に変換してから取り出す従来の方法(to_dict)と，
+protobufのメッセージを直接走査する方法(lean)を比較する．
+
+Usage:
+    shift_webディレクトリで実行する
+    $ python -m benchmarks.bench_ocr_extraction --rows 30 300 3000
+"""
+
+import argparse
+import gc
+import time
+import tracemalloc
+
+from google.cloud import vision
+
+from benchmarks.synthetic import make_response
+from src.dataclass.ocr_result import OcrResult
+
+
+def extract_with_to_dict(response) -> OcrResult:
+    """従来の方法: レスポンス全体を辞書型に変換してから取り出す"""
+    return OcrResult.from_response_dict(vision.AnnotateImageResponse.to_dict(response))
+
+
+def extract_lean(response) -> OcrResult:
+    """protobufのメッセージから直接取り出す"""
+    return OcrResult.from_response(response)
+
+
+def measure(func, response, repeat: int) -> tuple[float, float]:
+    """funcの実行時間(最小値)とピークメモリを計測する関数
+    Args:
+        func (Callable): 計測する関数
+        response (vision.AnnotateImageResponse): レスポンス
+        repeat (int): 実行時間の計測回数
+    Returns:
+        tuple[float, float]: (実行時間[ms], ピークメモリ[MB])
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func(response)
+        best = min(best, time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    func(response)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return best * 1000, peak / 1024 / 1024
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[30, 300, 3000], help="シフト表の行数")
+    parser.add_argument("--repeat", type=int, default=5, help="計測回数")
+    args = parser.parse_args()
+
+    print(f"{'symbols':>8}{'method':>9}{'time[ms]':>10}{'peak[MB]':>10}")
+    for rows in args.rows:
+        response = make_response(row_count=rows)
+        symbols = len(extract_lean(response).symbols)
+        assert extract_lean(response) == extract_with_to_dict(response)
+        for name, func in (("to_dict", extract_with_to_dict), ("lean", extract_lean)):
+            elapsed, peak = measure(func, response, args.repeat)
+            print(f"{symbols:>8}{name:>9}{elapsed:>10.2f}{peak:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""Vision APIに送る前の画像の前処理(縮小・再圧縮・表の切り抜き)による送信量とシフトデータの精度を計測するベンチマーク
+
+合成レスポンスの文字の位置に文字の形を描いた画像(撮影時のノイズ入り)を作成し，
+前処理の前後のバイト数と処理時間を比較する．--deskを指定すると，表の周りに机を模した余白と
+机の上の物の文字(表と無関係な文字)を加え，表の切り抜きの有無も比較する．
+精度は，前処理した画像に対するVision APIの結果を「送る範囲に含まれる文字の座標を縮小して整数に丸めたもの」と
+みなし，元の画像の座標に戻してから作成したシフトデータが，前処理しない場合と一致する割合で評価する．
+縮小後の文字の高さがMIN_CHAR_HEIGHT未満の場合は読み取れないものとして一致しない扱いにする．
+
+Usage:
+    shift_webディレクトリで実行する
+    $ python -m benchmarks.bench_preprocess --rows 31 --scales 1 2 4 --max-edges 1024 2048 4096
+    $ python -m benchmarks.bench_preprocess --desk 0.6 --scales 2
+"""
+
+import argparse
+import io
+import random
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from benchmarks.synthetic import STRAY_TEXT, make_response_dict
+from src.dataclass.ocr_result import OcrResult, OcrSymbol
+from src.image_processor.preprocess import ImagePreprocessor, PreprocessedImage
+from src.image_processor.shift_parser import ShiftParser
+
+
+# Vision APIが文字を読み取れる高さの目安(ピクセル)
+MIN_CHAR_HEIGHT = 10
+# 机の上の物(マグカップやメモ)に書かれた文字とその数
+CLUTTER_TEXT = "珈琲メモ" + STRAY_TEXT
+CLUTTER_SYMBOLS = 40
+
+
+def place_on_desk(ocr_result: OcrResult, desk: float, seed: int = 0) -> tuple[OcrResult, tuple[int, int], tuple[int, int, int, int]]:
+    """表を机の上に置いた画像の座標に変換し，机の上の物の文字を加える関数
+    Args:
+        ocr_result (OcrResult): 表の抽出結果
+        desk (float): 表の幅・高さに対する，片側の机の余白の割合
+        seed (int): 乱数のシード
+    Returns:
+        tuple: (机の上の物の文字を含む抽出結果，画像の大きさ，紙の範囲(左，上，右，下))
+    """
+    rng = random.Random(seed)
+    coords = ocr_result.coords
+    paper_width = max(coords[0::2]) + 60
+    paper_height = max(coords[1::2]) + 40
+    margin_x, margin_y = round(paper_width * desk), round(paper_height * desk)
+    size = (paper_width + 2 * margin_x, paper_height + 2 * margin_y)
+    paper = (margin_x, margin_y, margin_x + paper_width, margin_y + paper_height)
+    symbols = ocr_result.scaled(1.0, 1.0, margin_x, margin_y).symbols
+    char_height = coords[7] - coords[1]
+    for i in range(CLUTTER_SYMBOLS if desk else 0):
+        # 机の左右の余白に置く
+        left = rng.choice([rng.randint(0, max(0, margin_x - char_height)), rng.randint(paper[2], size[0] - char_height)])
+        top = rng.randint(0, size[1] - char_height)
+        vertices = ((left, top), (left + char_height, top), (left + char_height, top + char_height), (left, top + char_height))
+        symbols.append(OcrSymbol(CLUTTER_TEXT[i % len(CLUTTER_TEXT)], vertices))
+
+    return OcrResult.from_symbols(symbols), size, paper
+
+
+def render_image(ocr_result: OcrResult, size: tuple[int, int], paper: tuple[int, int, int, int], seed: int = 0) -> bytes:
+    """抽出結果の文字の位置に文字の形を描いた画像(JPEG)を作成する関数
+    Args:
+        ocr_result (OcrResult): 抽出結果
+        size (tuple[int, int]): 画像の大きさ
+        paper (tuple[int, int, int, int]): 紙の範囲．範囲外は暗い机とする
+        seed (int): 乱数のシード
+    Returns:
+        bytes: 撮影した写真に近いJPEG(品質95・カラー・ノイズ入り)
+    """
+    rng = random.Random(seed)
+    width, height = size
+    # 机の木目と，紙の色むらとセンサーのノイズ
+    noise_rng = np.random.default_rng(seed)
+    grain = 110 + 15 * np.sin(np.arange(height) / 7.0)[:, None, None]
+    base = np.broadcast_to(grain, (height, width, 1)).copy()
+    left, top, right, bottom = paper
+    base[top:bottom, left:right] = 235
+    noise = base + noise_rng.normal(0, 6, (height, width, 1))
+    background = np.clip(noise * np.array([1.0, 0.95, 0.88]), 0, 255).astype(np.uint8)
+    image = Image.fromarray(background, "RGB")
+    draw = ImageDraw.Draw(image)
+    coords = ocr_result.coords
+    for i in range(len(ocr_result.texts)):
+        left, top, right, _, _, _, _, bottom = coords[i * 8:(i + 1) * 8]
+        stroke = max(1, (bottom - top) // 10)
+        # 文字の代わりに数本の線を描く
+        for _ in range(3):
+            points = [(rng.randint(left, right), rng.randint(top, bottom)) for _ in range(3)]
+            draw.line(points, fill=(40, 40, 50), width=stroke)
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=95)
+
+    return buffer.getvalue()
+
+
+def simulate_ocr(ocr_result: OcrResult, prepared: PreprocessedImage) -> OcrResult:
+    """前処理した画像に対する抽出結果を模したデータを作成する関数
+    Notes:
+        送る範囲(切り抜いた範囲)に含まれる文字のみを残し，座標を縮小して整数に丸める
+    """
+    content_width, content_height = Image.open(io.BytesIO(prepared.content)).size
+    right = prepared.offset_x + content_width * prepared.scale_x
+    bottom = prepared.offset_y + content_height * prepared.scale_y
+    inside = [
+        symbol
+        for symbol in ocr_result.symbols
+        if all(prepared.offset_x <= x <= right and prepared.offset_y <= y <= bottom for x, y in symbol.vertices)
+    ]
+
+    return OcrResult.from_symbols(inside).scaled(
+        1 / prepared.scale_x,
+        1 / prepared.scale_y,
+        round(-prepared.offset_x / prepared.scale_x),
+        round(-prepared.offset_y / prepared.scale_y),
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=31, help="シフト表の行数")
+    parser.add_argument("--scales", type=float, nargs="+", default=[1, 2, 4], help="撮影した画像の解像度の倍率")
+    parser.add_argument("--max-edges", type=int, nargs="+", default=[1024, 2048, 4096], help="前処理の長辺の最大値")
+    parser.add_argument("--quality", type=int, default=85, help="再圧縮するJPEGの品質")
+    parser.add_argument("--desk", type=float, default=0.0, help="表の周りの机の余白の割合(0の場合は余白なし)")
+    parser.add_argument("--repeat", type=int, default=3, help="処理時間の計測回数")
+    args = parser.parse_args()
+
+    shift_parser = ShiftParser()
+    crops = (False, True) if args.desk else (False,)
+    print(f"{'scale':>6}{'size':>12}{'max_edge':>9}{'crop':>5}{'bytes':>10}{'sent':>10}{'ratio':>7}"
+          f"{'time[ms]':>10}{'char_h':>7}{'symbols':>8}{'match':>7}")
+    for scale in args.scales:
+        table = OcrResult.from_response_dict(
+            make_response_dict(row_count=args.rows, scale=scale, skew=0.02, chars_per_row=24, cell_breaks=True)
+        )
+        expected = shift_parser.parse_ocr_result(table)
+        ocr_result, size, paper = place_on_desk(table, args.desk)
+        content = render_image(ocr_result, size, paper)
+        char_height = table.coords[7] - table.coords[1]
+        for max_edge in args.max_edges:
+            for crop in crops:
+                preprocessor = ImagePreprocessor(
+                    max_edge=max_edge, quality=args.quality, grayscale=True, enabled=True, crop=crop
+                )
+                best = float("inf")
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    prepared = preprocessor.process(content)
+                    best = min(best, time.perf_counter() - start)
+
+                sent = simulate_ocr(ocr_result, prepared)
+                scaled_height = char_height / prepared.scale_y
+                if scaled_height < MIN_CHAR_HEIGHT:
+                    match = 0.0
+                else:
+                    restored = sent.scaled(*prepared[1:])
+                    shifts = shift_parser.parse_ocr_result(restored)
+                    matched = sum(a == b for a, b in zip(shifts, expected))
+                    match = matched / max(len(expected), len(shifts), 1)
+                print(
+                    f"{scale:>6g}{'x'.join(map(str, size)):>12}{max_edge:>9}{'on' if crop else 'off':>5}"
+                    f"{len(content):>10}{len(prepared.content):>10}{len(prepared.content) / len(content):>7.2f}"
+                    f"{best * 1000:>10.1f}{scaled_height:>7.1f}{len(sent.texts):>8}{match:>7.0%}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""複数のワーカープロセスが最初のAPI呼び出しでアクセストークンを待つ時間と，トークンの発行回数を計測するベンチマーク
+
+遅延を設定した偽のサービスアカウントの認証情報を使い，--workers個のプロセスを同時に起動して
+最初のリクエストの前処理(before_request)にかかる時間を計測する．
+
+- none: ワーカーごとに認証情報を作成する(従来の処理)．全てのワーカーがトークンを発行する
+- cache: トークンをファイルで共有する(CachedCredentials)．1つのワーカーだけが発行し，他は待つか読むだけ
+
+それぞれ空のキャッシュで起動する場合(cold)と，前のワーカーが発行したトークンが残っている場合(warm)を計測する．
+
+Usage:
+    shift_webディレクトリで実行する
+    $ python -m benchmarks.bench_token_cache --workers 8 --latency 0.3
+"""
+
+import argparse
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+
+from src.testing.fake_credentials import FakeServiceAccountCredentials
+from src.token_cache import CachedCredentials, TokenCache
+
+
+def first_call(mode: str, cache_path: str, latency: float) -> tuple[float, int]:
+    """ワーカープロセスで認証情報を作成し，最初のリクエストの前処理にかかる時間を計測する関数
+    Returns:
+        tuple[float, int]: (時間(秒)，このワーカーがトークンを発行した回数)
+    """
+    inner = FakeServiceAccountCredentials(latency=latency)
+    credentials = inner if mode == "none" else CachedCredentials(inner, TokenCache(cache_path), auto_refresh=False)
+    start = time.perf_counter()
+    credentials.before_request(None, "POST", "https://www.googleapis.com/calendar/v3", dict())
+
+    return time.perf_counter() - start, inner.refresh_count
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=8, help="ワーカープロセスの数")
+    parser.add_argument("--latency", type=float, default=0.3, help="トークンの発行にかかる時間(秒)")
+    args = parser.parse_args()
+
+    print(f"{'mode':>6}{'start':>7}{'median[ms]':>12}{'max[ms]':>9}{'tokens':>8}")
+    with tempfile.TemporaryDirectory() as work_dir, multiprocessing.Pool(args.workers) as pool:
+        for mode in ("none", "cache"):
+            cache_path = os.path.join(work_dir, f"{mode}.json")
+            for wave in ("cold", "warm"):
+                results = pool.starmap(first_call, [(mode, cache_path, args.latency)] * args.workers)
+                timings = [elapsed * 1000 for elapsed, _ in results]
+                print(
+                    f"{mode:>6}{wave:>7}{statistics.median(timings):>12.1f}{max(timings):>9.1f}"
+                    f"{sum(count for _, count in results):>8}"
+                )
+
+
+if __name__ == "__main__":
+    main()
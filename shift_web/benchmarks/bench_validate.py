@@ -0,0 +1,73 @@
+"""Vision APIに送る前の画像の判定(ImageValidator)の処理時間と判定結果を計測するベンチマーク
+
+合成したシフト表の画像と，ぼやけた・暗い・小さい・縦横比が極端・真っ白などの不合格にすべき画像を
+複数の解像度で作成し，判定にかかる時間(最小値)と判定結果(合格またはreason)を表示する．
+
+Usage:
+    shift_webディレクトリで実行する
+    $ python -m benchmarks.bench_validate --sizes 1200x1600 3024x4032 6000x8000
+"""
+
+import argparse
+import io
+import time
+
+from PIL import Image, ImageEnhance, ImageFilter
+
+from benchmarks.synthetic import make_image
+from src.image_processor.image_validator import ImageRejectedError, ImageValidator
+
+
+def make_cases(width: int, height: int) -> dict[str, bytes]:
+    """判定する画像を作成する関数
+    Args:
+        width (int): 幅
+        height (int): 高さ
+    Returns:
+        dict[str, bytes]: 画像の種類と内容の対応表
+    """
+    roster = Image.open(io.BytesIO(make_image(row_count=31, width=width, height=height)))
+    blur = max(2, width // 300)
+    variants = {
+        "roster": roster,
+        "blurry": roster.filter(ImageFilter.GaussianBlur(blur)),
+        "dark": ImageEnhance.Brightness(roster).enhance(0.12),
+        "blank": Image.new("L", roster.size, 250),
+        "tiny": roster.resize((width // 8, height // 8)),
+        "banner": roster.crop((0, 0, width, width // 5)),
+    }
+    cases = dict()
+    for name, image in variants.items():
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=90)
+        cases[name] = buffer.getvalue()
+    cases["not_image"] = b"%PDF-1.4" + bytes(1024)
+
+    return cases
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", default=["1200x1600", "3024x4032", "6000x8000"], help="画像の大きさ(幅x高さ)")
+    parser.add_argument("--repeat", type=int, default=5, help="計測回数")
+    args = parser.parse_args()
+
+    validator = ImageValidator()
+    print(f"{'size':>10}{'case':>11}{'bytes':>10}{'time[ms]':>10}  result")
+    for size in args.sizes:
+        width, height = map(int, size.split("x"))
+        for name, content in make_cases(width, height).items():
+            best = float("inf")
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                try:
+                    validator.validate(content)
+                    result = "ok"
+                except ImageRejectedError as e:
+                    result = e.reason
+                best = min(best, time.perf_counter() - start)
+            print(f"{size:>10}{name:>11}{len(content):>10}{best * 1000:>10.2f}  {result}")
+
+
+if __name__ == "__main__":
+    main()
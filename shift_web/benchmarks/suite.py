@@ -0,0 +1,250 @@
+"""シフト表の解析・カレンダーへの追加・アプリケーション全体の時間とメモリ使用量を計測するベンチマーク
+
+合成したVision APIのレスポンスと，遅延を設定できる偽のVision API・Googleカレンダーを使い，
+以下の処理を行数ごと(small / medium / huge)に計測する．
+
+- parse: ShiftParser.parse_data_to_shifts(response.jsonの読み込みから)
+- create_events: CalendarClient.create_events(1件ずつ追加)
+- controller_run: Controller.run(画像の読み込みからカレンダーへの同期まで)
+
+時間は1回目を除いたrepeat回の中央値，メモリはtracemallocで計測したピーク値とする．
+保存済みの基準値(baseline.json)と比較し，許容範囲を超えて悪化した項目を表示する．
+
+Usage:
+    shift_webディレクトリで実行する
+    $ python -m benchmarks.suite                  # 計測して基準値と比較する
+    $ python -m benchmarks.suite --save-baseline  # 計測結果を基準値として保存する
+    $ python -m benchmarks.suite --sizes small medium --cases parse --check
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable
+
+from google.auth.credentials import AnonymousCredentials
+from google.cloud import vision
+
+from benchmarks.synthetic import make_image, make_response_dict
+from src.calendar_client import CalendarClient
+from src.client_registry import ClientRegistry
+from src.controller import Controller
+from src.dataclass.ocr_result import OcrResult
+from src.image_processor.ocr_cache import OcrCache
+from src.image_processor.shift_parser import ShiftParser
+from src.image_processor.vision_client import VisionClient
+from src.testing.fake_calendar import FakeCalendarHttp
+from src.testing.fake_vision import FakeImageAnnotatorClient
+
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+# 行数(1か月分，10か月分，100か月分)
+SIZES = {"small": 31, "medium": 310, "huge": 3100}
+CASES = ("parse", "create_events", "controller_run")
+
+
+def _response_kwargs(rows: int) -> dict:
+    """計測に使う合成レスポンスの設定を返す関数(罫線の誤認識・余白の汚れ・傾きを含む)"""
+    return dict(
+        row_count=rows,
+        chars_per_row=24,
+        noise=0.3,
+        stray_symbols=rows // 10,
+        skew=0.02,
+        cell_breaks=True,
+    )
+
+
+def _setup_parse(rows: int, work_dir: str, args: argparse.Namespace) -> Callable[[], Any]:
+    """parseの準備をし，計測対象の関数を返す関数"""
+    result_dir = os.path.join(work_dir, f"parse_{rows}")
+    os.makedirs(result_dir, exist_ok=True)
+    with open(os.path.join(result_dir, "response.json"), "w", encoding="utf-8") as f:
+        json.dump(make_response_dict(**_response_kwargs(rows)), f, ensure_ascii=False)
+    parser = ShiftParser()
+
+    return lambda: parser.parse_data_to_shifts(result_dir)
+
+
+def _setup_create_events(
+    rows: int, work_dir: str, args: argparse.Namespace
+) -> Callable[[], Any]:
+    """create_eventsの準備をし，計測対象の関数を返す関数"""
+    shifts = ShiftParser().parse_ocr_result(
+        OcrResult.from_response_dict(make_response_dict(**_response_kwargs(rows)))
+    )
+    fake_http = FakeCalendarHttp(latency=args.calendar_latency)
+    calendar_client = CalendarClient(
+        http_factory=lambda: fake_http, credentials=AnonymousCredentials()
+    )
+
+    return lambda: calendar_client.create_events(shifts)
+
+
+def _setup_controller_run(
+    rows: int, work_dir: str, args: argparse.Namespace
+) -> Callable[[], Any]:
+    """controller_runの準備をし，計測対象の関数を返す関数
+    Notes:
+        抽出結果はキャッシュせず(ttl=0)，response.jsonも書き出さない
+    """
+    result_dir = os.path.join(work_dir, f"controller_{rows}")
+    os.makedirs(result_dir, exist_ok=True)
+    with open(os.path.join(result_dir, "shift.jpg"), "wb") as f:
+        f.write(make_image(row_count=min(rows, 31)))
+    response = vision.AnnotateImageResponse(make_response_dict(**_response_kwargs(rows)))
+    fake_http = FakeCalendarHttp(latency=args.calendar_latency)
+
+    registry = ClientRegistry()
+    registry.register(
+        "vision",
+        lambda: VisionClient(
+            ocr_cache=OcrCache(ttl=0),
+            save_response=False,
+            client=FakeImageAnnotatorClient(
+                lambda content: response, latency=args.vision_latency
+            ),
+        ),
+    )
+    registry.register(
+        "calendar",
+        lambda: CalendarClient(
+            http_factory=lambda: fake_http, credentials=AnonymousCredentials()
+        ),
+    )
+    controller = Controller(result_dir, registry=registry, calendar_mode="sync")
+
+    return controller.run
+
+
+SETUPS = {
+    "parse": _setup_parse,
+    "create_events": _setup_create_events,
+    "controller_run": _setup_controller_run,
+}
+
+
+def measure(setup: Callable[[], Callable[[], Any]], repeat: int) -> dict:
+    """計測対象の時間(中央値)とメモリ使用量(ピーク値)を計測する関数
+    Args:
+        setup (Callable[[], Callable[[], Any]]): 準備をし，計測対象の関数を返す関数(計測ごとに呼ぶ)
+        repeat (int): 時間の計測回数
+    Returns:
+        dict: {"time_ms": 時間(ミリ秒), "peak_kib": メモリ使用量のピーク値(KiB)}
+    """
+    # 初回の呼び出しはモジュールの読み込みなどを含むため計測しない
+    setup()()
+    timings = list()
+    for _ in range(repeat):
+        func = setup()
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    # tracemallocは処理を遅くするため，時間とは別に1回だけ計測する
+    func = setup()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {"time_ms": round(statistics.median(timings), 3), "peak_kib": round(peak / 1024, 1)}
+
+
+def compare(
+    results: dict, baseline: dict, time_tolerance: float, memory_tolerance: float
+) -> list[str]:
+    """計測結果と基準値を比較し，結果を表示する関数
+    Args:
+        results (dict): 計測結果(項目名と計測値の対応表)
+        baseline (dict): 基準値(項目名と計測値の対応表)
+        time_tolerance (float): 時間の悪化の許容割合
+        memory_tolerance (float): メモリ使用量の悪化の許容割合
+    Returns:
+        list[str]: 許容範囲を超えて悪化した項目名
+    Examples:
+        >>> compare({"parse/small": {"time_ms": 1.3, "peak_kib": 100.0}}, {"parse/small": {"time_ms": 1.0, "peak_kib": 100.0}}, 0.25, 0.1)
+        case                         time[ms]   base[ms]   ratio  peak[KiB]  base[KiB]   ratio
+        parse/small                      1.30       1.00   1.30x      100.0      100.0   1.00x  REGRESSION
+        ['parse/small']
+    """
+    print(
+        f"{'case':<25}{'time[ms]':>12}{'base[ms]':>11}{'ratio':>8}"
+        f"{'peak[KiB]':>11}{'base[KiB]':>11}{'ratio':>8}"
+    )
+    regressions = list()
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<25}{result['time_ms']:>12.2f}{'-':>11}{'':>8}{result['peak_kib']:>11.1f}{'-':>11}")
+            continue
+        time_ratio = result["time_ms"] / base["time_ms"] if base["time_ms"] else 1.0
+        memory_ratio = result["peak_kib"] / base["peak_kib"] if base["peak_kib"] else 1.0
+        regressed = time_ratio > 1 + time_tolerance or memory_ratio > 1 + memory_tolerance
+        if regressed:
+            regressions.append(name)
+        print(
+            f"{name:<25}{result['time_ms']:>12.2f}{base['time_ms']:>11.2f}{time_ratio:>7.2f}x"
+            f"{result['peak_kib']:>11.1f}{base['peak_kib']:>11.1f}{memory_ratio:>7.2f}x"
+            + ("  REGRESSION" if regressed else "")
+        )
+
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=list(SIZES), help="計測する行数の区分")
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=list(CASES), help="計測する処理")
+    parser.add_argument("--repeat", type=int, default=3, help="時間の計測回数")
+    parser.add_argument("--vision-latency", type=float, default=0.05, help="Vision APIの応答の遅延(秒)")
+    parser.add_argument("--calendar-latency", type=float, default=0.002, help="Googleカレンダーの1リクエストあたりの遅延(秒)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="基準値のファイル")
+    parser.add_argument("--save-baseline", action="store_true", help="計測結果を基準値として保存する")
+    parser.add_argument("--time-tolerance", type=float, default=0.25, help="時間の悪化の許容割合")
+    parser.add_argument("--memory-tolerance", type=float, default=0.20, help="メモリ使用量の悪化の許容割合")
+    parser.add_argument("--check", action="store_true", help="悪化した項目がある場合は終了コード1で終了する")
+    args = parser.parse_args()
+
+    os.environ.setdefault("GOOGLE_CALENDAR_ID", "bench@example.com")
+    settings = {"vision_latency": args.vision_latency, "calendar_latency": args.calendar_latency}
+
+    results = dict()
+    with tempfile.TemporaryDirectory() as work_dir:
+        for case in args.cases:
+            for size in args.sizes:
+                rows = SIZES[size]
+                results[f"{case}/{size}"] = measure(
+                    lambda: SETUPS[case](rows, work_dir, args), args.repeat
+                )
+
+    baseline = dict()
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            stored = json.load(f)
+        if stored.get("settings") != settings:
+            print(f"基準値の計測条件が異なります: {stored.get('settings')}", file=sys.stderr)
+        baseline = stored.get("results", dict())
+
+    regressions = compare(results, baseline, args.time_tolerance, args.memory_tolerance)
+
+    if args.save_baseline:
+        baseline.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"settings": settings, "results": baseline}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"基準値を保存しました: {args.baseline}")
+
+    if args.check and regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
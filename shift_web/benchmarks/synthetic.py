@@ -0,0 +1,216 @@
+"""ベンチマーク用にVision APIのレスポンスを模したデータを作成するモジュール"""
+
+import random
+from typing import Optional
+
+
+WEEKDAYS = "月火水木金土日"
+# Vision APIが表のセルの末尾に付ける区切りの種類(EOL_SURE_SPACE)
+CELL_BREAK = 3
+# 備考欄の文字と，余白に散らばる汚れなどを誤認識した文字
+NOTE_TEXT = "備考交代希望あり"
+STRAY_TEXT = "・ー。"
+
+
+def make_rows(row_count: int, seed: int = 0) -> list[str]:
+    """シフト表の行の文字列を作成する関数
+    Args:
+        row_count (int): 行数
+        seed (int): 乱数のシード
+    Returns:
+        list[str]: 行の文字列(例: "9/1月17時00分21時30分")
+    Examples:
+        >>> make_rows(2)
+        ['9/1月17時00分21時30分', '9/2火15時00分18時30分']
+    """
+    rng = random.Random(seed)
+    rows = list()
+    for i in range(row_count):
+        day = i % 30 + 1
+        weekday = WEEKDAYS[i % 7]
+        if i == 0:
+            start, end = "17時00分", "21時30分"
+        elif rng.random() < 0.4:
+            start, end = "00時00分", "00時00分"
+        else:
+            start_hour = rng.randint(9, 20)
+            end_hour = start_hour + rng.randint(3, 8)
+            end = (
+                f"翌日{end_hour - 24:02}時00分" if end_hour >= 24 else f"{end_hour}時30分"
+            )
+            start = f"{start_hour}時00分"
+        rows.append(f"9/{day}{weekday}{start}{end}")
+
+    return rows
+
+
+def make_response_dict(
+    row_count: int = 30,
+    char_width: int = 20,
+    char_height: int = 30,
+    row_pitch: int = 60,
+    seed: int = 0,
+    jitter: int = 2,
+    skew: float = 0.0,
+    cell_breaks: bool = False,
+    scale: float = 1.0,
+    chars_per_row: Optional[int] = None,
+    noise: float = 0.0,
+    stray_symbols: int = 0,
+) -> dict:
+    """シフト表を撮影した画像に対するVision APIのレスポンス(辞書型)を模したデータを作成する関数
+    Args:
+        row_count (int): 行数
+        char_width (int): 1文字の幅(ピクセル)
+        char_height (int): 1文字の高さ(ピクセル)
+        row_pitch (int): 行の間隔(ピクセル)
+        seed (int): 乱数のシード
+        jitter (int): 文字ごとのy座標の揺らぎの最大値(ピクセル)
+        skew (float): 画像の傾き(xが1増えたときのyの増分)
+        cell_breaks (bool): 日付・開始時刻・終了時刻のセルの末尾の文字に行末の区切りを付けるかどうか
+        scale (float): 解像度の倍率(文字の大きさ・行の間隔・揺らぎ・余白に掛ける)
+        chars_per_row (int | None): 1行の文字数．行の文字列より多い場合は右側に備考欄の文字を足す
+        noise (float): 行ごとに，罫線を誤認識した文字(|やI)を1文字挟む確率
+        stray_symbols (int): 表の右側の余白に散らばる，汚れなどを誤認識した文字の数
+    Returns:
+        dict: vision.AnnotateImageResponse.to_dictと同じ形式のデータ
+    Examples:
+        >>> response_dict = make_response_dict(row_count=1, jitter=0, skew=0.1)
+        >>> response_dict["full_text_annotation"]["pages"][0]["blocks"][0]["paragraphs"][0]["words"][0]["symbols"][1]
+        {'text': '/', 'bounding_box': {'vertices': [{'x': 52, 'y': 25}, {'x': 72, 'y': 27}, {'x': 72, 'y': 57}, {'x': 52, 'y': 55}]}}
+        >>> words = make_response_dict(row_count=2, chars_per_row=24, noise=1.0, stray_symbols=3)["full_text_annotation"]["pages"][0]["blocks"][0]["paragraphs"][0]["words"]
+        >>> ["".join(symbol["text"] for symbol in word["symbols"]) for word in words]
+        ['9/1月17時00分21時I30分備考交代希望あ', '9/I2火15時00分18時30分備考交代希望あ', '・ー。']
+    """
+    rng = random.Random(seed)
+    char_width = round(char_width * scale)
+    char_height = round(char_height * scale)
+    row_pitch = round(row_pitch * scale)
+    jitter = round(jitter * scale)
+    margin_top = round(20 * scale)
+    margin_left = round(30 * scale)
+    gap = round(2 * scale)
+
+    words = list()
+    right_edge = margin_left
+    for row_index, row in enumerate(make_rows(row_count, seed)):
+        top = margin_top + row_index * row_pitch
+        left = margin_left
+        symbols = list()
+        # (文字，セルの末尾かどうか)の一覧．曜日(最初に現れる曜日の文字)と「分」がセルの末尾
+        weekday_index = next(i for i, c in enumerate(row) if c in WEEKDAYS)
+        cells = [(c, i == weekday_index or c == "分") for i, c in enumerate(row)]
+        if noise and rng.random() < noise:
+            cells.insert(rng.randint(1, len(cells) - 1), (rng.choice("|I"), False))
+        if chars_per_row is not None and chars_per_row > len(cells):
+            cells += [(NOTE_TEXT[i % len(NOTE_TEXT)], False) for i in range(chars_per_row - len(cells))]
+        for index, (char, cell_end) in enumerate(cells):
+            # 文字ごとに数ピクセルの揺らぎを入れ，傾きに合わせてy座標をずらす
+            y = top + rng.randint(-jitter, jitter)
+            symbols.append(_make_symbol(char, left, y, char_width, char_height, skew))
+            if cell_breaks and cell_end:
+                symbols[-1]["property"] = {"detected_break": {"type_": CELL_BREAK}}
+            left += char_width + gap
+        right_edge = max(right_edge, left)
+        words.append({"symbols": symbols})
+
+    if stray_symbols:
+        # 汚れなどは表の右側の余白に散らばっているものとする
+        height = margin_top + row_count * row_pitch
+        strays = [
+            _make_symbol(
+                STRAY_TEXT[i % len(STRAY_TEXT)],
+                right_edge + char_width * rng.randint(3, 10),
+                rng.randint(0, height),
+                char_width,
+                char_height,
+                skew,
+            )
+            for i in range(stray_symbols)
+        ]
+        words.append({"symbols": strays})
+
+    return {
+        "full_text_annotation": {
+            "pages": [{"blocks": [{"paragraphs": [{"words": words}]}]}]
+        }
+    }
+
+
+def _make_symbol(
+    text: str, left: int, top: int, char_width: int, char_height: int, skew: float
+) -> dict:
+    """1文字分のsymbolを作成する関数
+    Args:
+        text (str): 文字
+        left (int): 左端のx座標
+        top (int): 上端のy座標(傾ける前)
+        char_width (int): 文字の幅
+        char_height (int): 文字の高さ
+        skew (float): 画像の傾き
+    Returns:
+        dict: symbol
+    """
+    right = left + char_width
+    return {
+        "text": text,
+        "bounding_box": {
+            "vertices": [
+                {"x": left, "y": round(top + skew * left)},
+                {"x": right, "y": round(top + skew * right)},
+                {"x": right, "y": round(top + char_height + skew * right)},
+                {"x": left, "y": round(top + char_height + skew * left)},
+            ]
+        },
+    }
+
+
+def make_response(**kwargs):
+    """make_response_dictと同じ内容のvision.AnnotateImageResponseを作成する関数
+    Args:
+        **kwargs: make_response_dictに渡す引数
+    Returns:
+        vision.AnnotateImageResponse: Vision APIのレスポンス
+    """
+    from google.cloud import vision
+
+    return vision.AnnotateImageResponse(make_response_dict(**kwargs))
+
+
+def make_image(row_count: int = 30, width: int = 1200, height: int = 1600, seed: int = 0) -> bytes:
+    """シフト表を撮影した画像を模したJPEGを作成する関数
+    Args:
+        row_count (int): 行数
+        width (int): 幅(ピクセル)
+        height (int): 高さ(ピクセル)
+        seed (int): 乱数のシード
+    Returns:
+        bytes: 画像の内容(ImageValidatorの判定に合格するもの)
+    Examples:
+        >>> import io
+        >>> from PIL import Image
+        >>> Image.open(io.BytesIO(make_image())).size
+        (1200, 1600)
+    """
+    import io
+
+    from PIL import Image, ImageDraw
+
+    image = Image.new("L", (width, height), 235)
+    draw = ImageDraw.Draw(image)
+    row_pitch = max(1, (height - 80) // max(1, row_count))
+    font_size = max(8, row_pitch * 2 // 3)
+    for index, row in enumerate(make_rows(row_count, seed)):
+        # 日本語のフォントがない環境でも描けるよう，数字と記号のみを描く
+        text = "".join(c if c.isascii() else " " for c in row)
+        draw.text((40, 40 + index * row_pitch), text, fill=20, font_size=font_size)
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=90)
+
+    return buffer.getvalue()
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
@@ -2,10 +2,11 @@
 """Django's command-line utility for administrative tasks."""
 
 import sys
-from dotenv import load_dotenv
 import os
 
-load_dotenv("src/.env")
+from src.config import load_env
+
+load_env()
 
 
 def main():
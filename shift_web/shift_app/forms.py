@@ -1,7 +1,17 @@
 from django import forms
+from django.conf import settings
 from .models import Image
 
 class ImageForm(forms.ModelForm):
     class Meta:
         model = Image
         fields = ['image', 'title']
+
+    def clean_image(self):
+        # 大きすぎる画像はワーカーのメモリを圧迫するため受け付けない
+        image = self.cleaned_data['image']
+        if image is not None and image.size > settings.SHIFT_UPLOAD_MAX_BYTES:
+            raise forms.ValidationError(
+                f"画像のサイズは{settings.SHIFT_UPLOAD_MAX_BYTES // (1024 * 1024)}MB以下にしてください。"
+            )
+        return image
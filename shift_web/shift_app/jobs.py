@@ -0,0 +1,28 @@
+"""Webアプリケーションで共有するジョブ管理オブジェクトを定義するモジュール"""
+
+from django.conf import settings
+
+from src.artifact_store import get_default_artifact_store
+
+# プロセス内で共有するジョブ管理オブジェクト
+if settings.SHIFT_PIPELINE_DAEMON:
+    # ジョブは常駐するデーモン(python manage.py pipeline_daemon)が実行し，Webのワーカーはキューに追加するだけとする
+    from src.job_queue import SpoolQueue
+
+    job_manager = SpoolQueue(settings.SHIFT_SPOOL_DIR, max_jobs=settings.SHIFT_JOB_MAX_RECORDS)
+else:
+    from src.job_manager import JobManager
+    from src.main import main, main_async
+
+    job_manager = JobManager(
+        runner=main,
+        max_workers=settings.SHIFT_JOB_MAX_WORKERS,
+        max_jobs=settings.SHIFT_JOB_MAX_RECORDS,
+        # Vision APIとGoogleカレンダーの応答を待つ間に他のジョブを進める
+        async_runner=main_async if settings.SHIFT_ASYNC_PIPELINE else None,
+        max_async_jobs=settings.SHIFT_ASYNC_MAX_JOBS,
+    )
+
+# 古い成果物を定期的に削除する
+if settings.SHIFT_ARTIFACT_GC_INTERVAL:
+    get_default_artifact_store().start_gc_thread(settings.SHIFT_ARTIFACT_GC_INTERVAL)
@@ -0,0 +1,44 @@
+"""古い成果物(ジョブごとの画像のコピー・抽出結果・ログ)を削除する管理コマンド
+
+Usage:
+    $ python manage.py gc_artifacts --max-age-days 30 --max-mb 1024
+    $ python manage.py gc_artifacts --max-age-days 7 --dry-run
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from src.artifact_store import ArtifactStore, get_default_artifact_store
+
+
+class Command(BaseCommand):
+    help = "保持期間を過ぎた成果物や，合計サイズの上限を超えた分の古い成果物を削除します。"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--root", help="成果物を保存するディレクトリ(既定は環境変数SHIFT_ARTIFACT_ROOT)")
+        parser.add_argument("--max-age-days", type=float, help="成果物を残す日数(既定は環境変数SHIFT_ARTIFACT_MAX_AGE)")
+        parser.add_argument("--max-mb", type=float, help="成果物の合計サイズの上限(MB)(既定は環境変数SHIFT_ARTIFACT_MAX_BYTES)")
+        parser.add_argument("--dry-run", action="store_true", help="削除せずに対象のディレクトリを表示する")
+
+    def handle(self, *args, **options):
+        default_store = get_default_artifact_store()
+        store = ArtifactStore(
+            root=options["root"] or default_store.root,
+            max_age=default_store.max_age,
+            max_bytes=default_store.max_bytes,
+        )
+        max_age = options["max_age_days"] * 24 * 60 * 60 if options["max_age_days"] is not None else None
+        max_bytes = int(options["max_mb"] * 1024 * 1024) if options["max_mb"] is not None else None
+        if (max_age if max_age is not None else store.max_age) is None and (
+            max_bytes if max_bytes is not None else store.max_bytes
+        ) is None:
+            raise CommandError("--max-age-daysか--max-mb(または環境変数)を指定してください。")
+
+        result = store.gc(max_age=max_age, max_bytes=max_bytes, dry_run=options["dry_run"])
+        if options["dry_run"]:
+            for path in result.removed:
+                self.stdout.write(path)
+        self.stdout.write(
+            f"{'削除対象' if options['dry_run'] else '削除'}: {len(result.removed)}件 "
+            f"({result.freed_bytes / 1024 / 1024:.1f}MB), "
+            f"残り: {result.kept}件 ({result.kept_bytes / 1024 / 1024:.1f}MB)"
+        )
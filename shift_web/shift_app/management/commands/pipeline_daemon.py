@@ -0,0 +1,45 @@
+"""画像処理のパイプラインを常駐させ，Webアプリケーションから追加されたジョブを実行する管理コマンド
+
+設定SHIFT_PIPELINE_DAEMONを有効にしたWebアプリケーションは，ジョブをスプールディレクトリに追加するだけとなり，
+Vision API・Googleカレンダー・画像処理のモジュールを読み込まない．
+
+Usage:
+    $ SHIFT_PIPELINE_DAEMON=1 python manage.py pipeline_daemon --workers 4
+"""
+
+import os
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from src.job_queue import SpoolQueue
+from src.main import main
+from src.pipeline_daemon import PipelineDaemon
+
+
+class Command(BaseCommand):
+    help = "モジュールを読み込んだ後にワーカーをforkし，スプールディレクトリのジョブを実行し続けます。SIGTERMかCtrl+Cで停止します。"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, help="ワーカープロセスの数(既定は環境変数SHIFT_DAEMON_WORKERS)")
+        parser.add_argument("--spool-dir", help="スプールディレクトリ(既定は設定SHIFT_SPOOL_DIR)")
+
+    def handle(self, *args, **options):
+        if not hasattr(os, "fork"):
+            raise CommandError("このコマンドはfork可能な環境(Linux・macOS)でのみ実行できます。")
+        if not settings.SHIFT_PIPELINE_DAEMON:
+            self.stderr.write("設定SHIFT_PIPELINE_DAEMONが無効のため，Webアプリケーションはこのデーモンにジョブを渡しません。")
+
+        # 終了済みジョブの削除はデーモンが行うため，Webアプリケーションと同じ上限を使う
+        queue = SpoolQueue(
+            options["spool_dir"] or settings.SHIFT_SPOOL_DIR,
+            max_jobs=settings.SHIFT_JOB_MAX_RECORDS,
+        )
+        daemon = PipelineDaemon(queue, main, workers=options["workers"])
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda signum, frame: daemon.stop())
+
+        self.stdout.write(f"ワーカー{daemon.workers}個でジョブを待ちます: {queue.root}")
+        daemon.run()
+        self.stdout.write("全てのワーカーが終了しました。")
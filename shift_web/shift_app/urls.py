@@ -5,5 +5,7 @@ app_name = "shift_app"
 
 urlpatterns = [
     path("upload/", views.upload, name="upload"),
-    path("result/", views.result, name="result"),
+    path("result/<str:job_id>/", views.result, name="result"),
+    path("status/<str:job_id>/", views.status, name="status"),
+    path("metrics/", views.metrics, name="metrics"),
 ]
@@ -1,42 +1,29 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404, HttpResponse, JsonResponse
 from django.shortcuts import render, redirect
 from .models import Image
 from .forms import ImageForm
-from src.main import main
+from .jobs import job_manager
+from src.dataclass.shift import Shift
+from src import metrics as shift_metrics
 
 # Create your views here.
 
 
-def upload(request):
+async def upload(request):
+    # ASGIではフォームの検証と保存(ファイルとデータベースへの書き込み)の間もイベントループを止めない
     # データが送信された場合
     if request.method == "POST":
         form = ImageForm(request.POST, request.FILES)
-        if form.is_valid():
-            saved_instance = form.save()
+        if await sync_to_async(form.is_valid)():
+            saved_instance = await sync_to_async(form.save)()
             image_file_path = saved_instance.image.path
 
-            # アプリを起動
-            shifts = main(image_file_path)
-
-            # 結果を文字列にする
-            shifts_text = "以下のシフトをGoogleカレンダーに予定として追加しました。"
-            for shift in shifts:
-                shift_dict = shift.to_dict()
-                tmp = (
-                    "\n・ "
-                    + shift_dict["start_datetime"][:10]
-                    + " "
-                    + shift_dict["start_datetime"][11:16]
-                    + " ~ "
-                    + shift_dict["end_datetime"][:10]
-                    + " "
-                    + shift_dict["end_datetime"][11:16]
-                )
-                shifts_text += tmp
-
-            # アプリでの処理結果をセッションに保存
-            request.session["shifts_text"] = shifts_text
-
-            return redirect("shift_app:result")
+            # アプリの処理をジョブとして登録し，完了を待たずに結果ページへ移動
+            job_id = job_manager.submit(image_file_path)
+
+            return redirect("shift_app:result", job_id=job_id)
 
     # ページが初めて開かれた時(request.method == "GET")
     else:
@@ -49,7 +36,58 @@ def upload(request):
     return render(request, "shift_app/upload.html", context)
 
 
-def result(request):
-    shifts_text = request.session.pop("shifts_text")
-    context = {"shifts_text": shifts_text}
+def result(request, job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise Http404("指定されたジョブが見つかりません。")
+
+    context = {
+        "job": job,
+        "shifts_text": _format_shifts(job.shifts) if job.status == "succeeded" else "",
+    }
     return render(request, "shift_app/result.html", context)
+
+
+def status(request, job_id):
+    # 結果ページからのポーリング用にジョブの状態をJSONで返す
+    job = job_manager.get(job_id)
+    if job is None:
+        raise Http404("指定されたジョブが見つかりません。")
+
+    return JsonResponse(job.to_dict())
+
+
+def metrics(request):
+    # 処理の段階ごとの所要時間や件数をPrometheusのテキスト形式で返す
+    registry = shift_metrics.registry
+    if settings.SHIFT_PIPELINE_DAEMON:
+        # 画像処理はデーモンのプロセスで実行されるため，各プロセスが書き出した指標と合わせる
+        registry = shift_metrics.MetricsRegistry()
+        registry.merge(shift_metrics.registry.snapshot())
+        for snapshot in job_manager.collect_metrics():
+            registry.merge(snapshot)
+
+    return HttpResponse(
+        registry.render(),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+def _format_shifts(shifts: list[Shift]) -> str:
+    # 結果を文字列にする
+    shifts_text = "以下のシフトをGoogleカレンダーに予定として追加しました。"
+    for shift in shifts:
+        shift_dict = shift.to_dict()
+        tmp = (
+            "\n・ "
+            + shift_dict["start_datetime"][:10]
+            + " "
+            + shift_dict["start_datetime"][11:16]
+            + " ~ "
+            + shift_dict["end_datetime"][:10]
+            + " "
+            + shift_dict["end_datetime"][11:16]
+        )
+        shifts_text += tmp
+
+    return shifts_text
@@ -10,8 +10,14 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from src.config import load_env
+
+# src/.envの環境変数を読み込む(wsgi.py・asgi.pyから起動した場合も含め，プロセス内で1度だけ)
+load_env()
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -135,3 +141,16 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # 画像アップロード
 IMAGE_ROOT = BASE_DIR.joinpath(BASE_DIR, 'images')
 IMAGE_URL = '/images/'
+SHIFT_UPLOAD_MAX_BYTES = 20 * 1024 * 1024  # アップロードできる画像のサイズの上限
+
+# バックグラウンドジョブ
+# SHIFT_PIPELINE_DAEMONが無効の場合，ジョブはプロセス内(JobManager)に保持されるため，Webサーバは1プロセスで起動すること
+SHIFT_JOB_MAX_WORKERS = 2  # 同時に実行するジョブの上限
+SHIFT_JOB_MAX_RECORDS = 1000  # プロセス内に保持するジョブの上限
+SHIFT_ASYNC_PIPELINE = os.getenv('SHIFT_ASYNC_PIPELINE', '0') != '0'  # ジョブをイベントループ上で非同期に実行するかどうか
+SHIFT_ASYNC_MAX_JOBS = 32  # 非同期の場合に同時に実行するジョブの上限
+SHIFT_PIPELINE_DAEMON = os.getenv('SHIFT_PIPELINE_DAEMON', '0') != '0'  # ジョブを常駐するデーモン(manage.py pipeline_daemon)に渡すかどうか
+SHIFT_SPOOL_DIR = os.getenv('SHIFT_SPOOL_DIR') or str(BASE_DIR / 'src' / 'spool')  # デーモンとジョブを受け渡すディレクトリ
+
+# ジョブごとの成果物(保存先・保持期間・上限は環境変数SHIFT_ARTIFACT_*で設定する)
+SHIFT_ARTIFACT_GC_INTERVAL = 60 * 60  # 古い成果物を削除する間隔(秒)．0の場合は削除しない
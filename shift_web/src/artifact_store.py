@@ -0,0 +1,295 @@
+"""ジョブごとの成果物(画像のコピー・抽出結果・ログ)を保存するディレクトリを管理するモジュール"""
+
+import contextlib
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from typing import Iterator, Optional
+
+from src.dataclass.gc_result import GcResult
+
+
+# 成果物を保存するディレクトリの既定値(実行時のカレントディレクトリによらない)
+DEFAULT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "result")
+# 作成・更新されてからこの秒数が経っていないディレクトリは削除しない(実行中のジョブを守るため)
+GC_GRACE_SECONDS = 10 * 60
+
+
+class ArtifactStore:
+    """ジョブIDのハッシュ値の先頭2文字で分けたディレクトリに成果物を保存し，古いものを削除するクラス
+    Attributes:
+        root (str): 成果物を保存するディレクトリ
+        enabled (bool): 成果物を保存するかどうか．Falseの場合は一時ディレクトリを使い，ジョブの終了時に削除する
+        max_age (float | None): 成果物を残す秒数．Noneの場合は期限なし
+        max_bytes (int | None): 成果物の合計サイズの上限．Noneの場合は上限なし
+        _active (set[str]): 実行中のジョブのディレクトリへのパス
+        _lock (:obj:`threading.Lock`): _activeを保護するロック
+    """
+
+    def __init__(
+        self,
+        root: Optional[str] = None,
+        enabled: bool = True,
+        max_age: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+    ):
+        self.root = root if root is not None else DEFAULT_ROOT
+        self.enabled = enabled
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self._active: set[str] = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def new_job_id() -> str:
+        """重複しないジョブIDを作成するメソッド
+        Returns:
+            str: ジョブID(UUID4の16進数表記)
+        """
+        return uuid.uuid4().hex
+
+    def path_for(self, job_id: str) -> str:
+        """ジョブの成果物を保存するディレクトリへのパスを返すメソッド
+        Args:
+            job_id (str): ジョブID
+        Returns:
+            str: root/ハッシュ値の先頭2文字/ジョブID
+        Examples:
+            >>> ArtifactStore(root="/tmp/result").path_for("20250901170000")
+            '/tmp/result/9d/20250901170000'
+        """
+        shard = hashlib.sha256(job_id.encode("utf-8")).hexdigest()[:2]
+
+        return os.path.join(self.root, shard, job_id)
+
+    @contextlib.contextmanager
+    def open_job(
+        self, job_id: Optional[str] = None, enabled: Optional[bool] = None
+    ) -> Iterator[str]:
+        """ジョブの成果物を保存するディレクトリを作成するコンテキストマネージャ
+        Args:
+            job_id (str | None): ジョブID．Noneの場合は新しく作成する
+            enabled (bool | None): 成果物を保存するかどうか．Noneの場合はself.enabledに従う
+        Yields:
+            str: ディレクトリへのパス
+        Raises:
+            FileExistsError: 同じジョブIDのディレクトリが既にある場合
+        Notes:
+            保存しない場合は一時ディレクトリを渡し，ブロックを抜けるときに削除する
+        Examples:
+            >>> test_store = ArtifactStore(root=tempfile.mkdtemp())
+            >>> with test_store.open_job("job-1") as result_dir:
+            ...     result_dir == test_store.path_for("job-1")
+            True
+            >>> os.path.isdir(result_dir)
+            True
+            >>> with test_store.open_job(enabled=False) as tmp_dir:
+            ...     tmp_dir.startswith(test_store.root)
+            False
+            >>> os.path.exists(tmp_dir)
+            False
+        """
+        if not (self.enabled if enabled is None else enabled):
+            with tempfile.TemporaryDirectory(prefix="shift-") as tmp_dir:
+                yield tmp_dir
+            return
+
+        path = self.path_for(job_id if job_id is not None else self.new_job_id())
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.mkdir(path)
+        with self._lock:
+            self._active.add(path)
+        try:
+            yield path
+        finally:
+            with self._lock:
+                self._active.discard(path)
+
+    def gc(
+        self,
+        max_age: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+        now: Optional[float] = None,
+        dry_run: bool = False,
+    ) -> GcResult:
+        """古い成果物のディレクトリを削除するメソッド
+        Args:
+            max_age (float | None): 成果物を残す秒数．Noneの場合はself.max_ageを使う
+            max_bytes (int | None): 成果物の合計サイズの上限．Noneの場合はself.max_bytesを使う
+            now (float | None): 現在時刻(time.time)．Noneの場合は実行時の時刻
+            dry_run (bool): Trueの場合は削除せず，削除する予定のディレクトリのみを返す
+        Returns:
+            GcResult: 削除結果
+        Notes:
+            max_ageより古いものを削除した後，合計サイズがmax_bytesを超えていれば古い順に削除する．
+            実行中のジョブと，更新からGC_GRACE_SECONDS秒以内のディレクトリは削除しない．
+            以前の形式(root直下の日時のディレクトリ)も対象とする
+        Examples:
+            >>> test_store = ArtifactStore(root=tempfile.mkdtemp())
+            >>> for job_id, age in [("old", 30), ("mid", 20), ("new", 10)]:
+            ...     with test_store.open_job(job_id) as result_dir:
+            ...         with open(f"{result_dir}/shift.jpg", "wb") as f:
+            ...             _ = f.write(b"x" * 100)
+            ...     mtime = time.time() - age * 24 * 60 * 60
+            ...     os.utime(f"{result_dir}/shift.jpg", (mtime, mtime))
+            ...     os.utime(result_dir, (mtime, mtime))
+            >>> result = test_store.gc(max_age=25 * 24 * 60 * 60, max_bytes=150)
+            >>> [os.path.basename(path) for path in result.removed], result.freed_bytes, result.kept
+            (['old', 'mid'], 200, 1)
+        """
+        max_age = max_age if max_age is not None else self.max_age
+        max_bytes = max_bytes if max_bytes is not None else self.max_bytes
+        now = now if now is not None else time.time()
+        logger = logging.getLogger("__main__").getChild("artifact_store")
+
+        # 削除には時間がかかるため，実行中のジョブの一覧のみをロック内で取得する
+        with self._lock:
+            active = set(self._active)
+        result = GcResult()
+        entries = sorted(self._scan())
+        total = sum(size for _, size, _ in entries)
+        for mtime, size, path in entries:
+            expired = max_age is not None and now - mtime >= max_age
+            oversize = max_bytes is not None and total > max_bytes
+            if not (expired or oversize) or path in active or now - mtime < GC_GRACE_SECONDS:
+                result.kept += 1
+                result.kept_bytes += size
+                continue
+            if not dry_run:
+                shutil.rmtree(path, ignore_errors=True)
+            result.removed.append(path)
+            result.freed_bytes += size
+            total -= size
+
+        if result.removed:
+            logger.info(
+                "成果物を%d件(%dバイト)削除しました。",
+                len(result.removed),
+                result.freed_bytes,
+            )
+
+        return result
+
+    def start_gc_thread(self, interval: float) -> threading.Event:
+        """gcを一定間隔で実行するスレッドを開始するメソッド
+        Args:
+            interval (float): 実行間隔(秒)
+        Returns:
+            threading.Event: setするとスレッドを停止するイベント
+        """
+        stopped = threading.Event()
+
+        def loop():
+            while not stopped.wait(interval):
+                try:
+                    self.gc()
+                except Exception:
+                    logging.getLogger("__main__").getChild("artifact_store").exception(
+                        "成果物の削除に失敗しました。"
+                    )
+
+        threading.Thread(target=loop, name="artifact-gc", daemon=True).start()
+
+        return stopped
+
+    def _scan(self) -> list[tuple[float, int, str]]:
+        """ジョブのディレクトリを(最終更新時刻，合計サイズ，パス)のリストで返すメソッド
+        Notes:
+            最終更新時刻はディレクトリとその中のファイルのうち最も新しいものとする
+        """
+        entries = list()
+        try:
+            top_entries = list(os.scandir(self.root))
+        except FileNotFoundError:
+            return entries
+        for top in top_entries:
+            if not top.is_dir(follow_symlinks=False):
+                continue
+            # 2文字のディレクトリはハッシュ値で分けたもの，それ以外は以前の形式のジョブのディレクトリ
+            if len(top.name) == 2:
+                job_dirs = [e.path for e in os.scandir(top.path) if e.is_dir(follow_symlinks=False)]
+            else:
+                job_dirs = [top.path]
+            for job_dir in job_dirs:
+                mtime, size = _tree_stat(job_dir)
+                entries.append((mtime, size, job_dir))
+
+        return entries
+
+
+def _tree_stat(path: str) -> tuple[float, int]:
+    """ディレクトリ以下の最終更新時刻と合計サイズを返す関数
+    Args:
+        path (str): ディレクトリへのパス
+    Returns:
+        tuple[float, int]: (最終更新時刻，合計サイズ)
+    Notes:
+        他の場所からもハードリンクされているファイル(アップロードされた画像のshift.jpg)は，
+        ディレクトリを削除しても容量が空かないため合計サイズに含めない
+    Examples:
+        >>> import tempfile
+        >>> upload_dir, job_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+        >>> with open(os.path.join(upload_dir, "upload.jpg"), "wb") as f:
+        ...     _ = f.write(b"x" * 1000)
+        >>> os.link(os.path.join(upload_dir, "upload.jpg"), os.path.join(job_dir, "shift.jpg"))
+        >>> with open(os.path.join(job_dir, "log.log"), "w") as f:
+        ...     _ = f.write("y" * 10)
+        >>> _tree_stat(job_dir)[1]
+        10
+    """
+    try:
+        mtime = os.stat(path).st_mtime
+    except FileNotFoundError:
+        return 0.0, 0
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                stat = os.stat(os.path.join(root, name))
+            except FileNotFoundError:
+                continue
+            mtime = max(mtime, stat.st_mtime)
+            if stat.st_nlink <= 1:
+                size += stat.st_size
+
+    return mtime, size
+
+
+_default_store: Optional[ArtifactStore] = None
+_default_store_lock = threading.Lock()
+
+
+def get_default_artifact_store() -> ArtifactStore:
+    """環境変数の設定に従って，プロセス内で共有する成果物の保存先を取得する関数
+    Returns:
+        ArtifactStore: 成果物の保存先
+    Notes:
+        - SHIFT_ARTIFACT_ROOT: 成果物を保存するディレクトリ(未設定の場合はsrc/result)
+        - SHIFT_ARTIFACTS: 0の場合は成果物を保存しない
+        - SHIFT_ARTIFACT_MAX_AGE: 成果物を残す秒数(未設定の場合は期限なし)
+        - SHIFT_ARTIFACT_MAX_BYTES: 成果物の合計サイズの上限(未設定の場合は上限なし)
+    """
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            max_age = os.getenv("SHIFT_ARTIFACT_MAX_AGE")
+            max_bytes = os.getenv("SHIFT_ARTIFACT_MAX_BYTES")
+            _default_store = ArtifactStore(
+                root=os.getenv("SHIFT_ARTIFACT_ROOT") or None,
+                enabled=os.getenv("SHIFT_ARTIFACTS", "1") != "0",
+                max_age=float(max_age) if max_age else None,
+                max_bytes=int(max_bytes) if max_bytes else None,
+            )
+
+        return _default_store
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
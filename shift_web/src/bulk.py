@@ -0,0 +1,532 @@
+"""フォルダ内のシフト表の画像をまとめて処理するモジュール(src/main.pyからコマンドとして実行する)
+
+CPUを使う画像の判定・前処理とシフトデータへの変換はプロセスプールで行い，応答を待つだけの
+Vision APIでの文字の抽出は上限付きのスレッドで並行して行う．Googleカレンダーへの書き込みは指定した場合のみ行う．
+処理した画像は1枚ずつマニフェスト(JSON Lines)に記録するため，中断しても同じマニフェストを指定して
+再実行すれば，成功した画像を飛ばして続きから処理する．
+
+Usage:
+    shift_webディレクトリで実行する
+    $ python -m src.main images/2025 --manifest backfill.jsonl --report report.json
+    $ python -m src.main "images/**/*.jpg" --calendar --ocr-concurrency 8 --processes 4
+"""
+
+import argparse
+import dataclasses
+import glob
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import wait as wait_futures
+from typing import Callable, Optional
+
+from src.artifact_store import get_default_artifact_store
+from src.dataclass.bulk_report import BulkReport
+from src.dataclass.ocr_result import OcrResult
+from src.dataclass.shift import Shift
+from src.image_processor.image_source import ImageSource, link_or_copy
+from src.image_processor.image_validator import ImageRejectedError
+from src.utils import job_context, wait_for_background
+
+# 対象とする画像の拡張子(ディレクトリを指定した場合)
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+# 文字の抽出を同時に行う数の上限
+OCR_CONCURRENCY = int(os.getenv("BULK_OCR_CONCURRENCY", 8))
+# Googleカレンダーへの書き込みを同時に行う数の上限
+CALENDAR_CONCURRENCY = int(os.getenv("BULK_CALENDAR_CONCURRENCY", 2))
+
+# 処理結果の種類
+RESULT_SUCCEEDED = "succeeded"
+RESULT_REJECTED = "rejected"
+RESULT_FAILED = "failed"
+
+
+def find_images(inputs: list[str], recursive: bool = False) -> list[str]:
+    """ディレクトリ・globのパターン・ファイルへのパスから，処理する画像へのパスを集める関数
+    Args:
+        inputs (list[str]): ディレクトリ・globのパターン(**を含む場合は下の階層も探す)・ファイルへのパス
+        recursive (bool): ディレクトリの下の階層も探すかどうか
+    Returns:
+        list[str]: 画像へのパス(重複を除き，名前順)
+    Examples:
+        >>> import tempfile
+        >>> root = tempfile.mkdtemp()
+        >>> for name in ("2025-04.jpg", "2025-05.PNG", "memo.txt", "old/2024-12.jpg"):
+        ...     os.makedirs(os.path.dirname(os.path.join(root, name)), exist_ok=True)
+        ...     open(os.path.join(root, name), "w").close()
+        >>> [os.path.relpath(path, root) for path in find_images([root])]
+        ['2025-04.jpg', '2025-05.PNG']
+        >>> [os.path.relpath(path, root) for path in find_images([root], recursive=True)]
+        ['2025-04.jpg', '2025-05.PNG', 'old/2024-12.jpg']
+        >>> [os.path.relpath(path, root) for path in find_images([os.path.join(root, "**", "2024-*.jpg"), os.path.join(root, "2025-04.jpg")])]
+        ['2025-04.jpg', 'old/2024-12.jpg']
+    """
+    paths = set()
+    for value in inputs:
+        if os.path.isdir(value):
+            pattern = os.path.join(value, "**", "*") if recursive else os.path.join(value, "*")
+            paths.update(
+                path
+                for path in glob.glob(pattern, recursive=recursive)
+                if os.path.isfile(path) and path.lower().endswith(IMAGE_EXTENSIONS)
+            )
+        elif os.path.isfile(value):
+            paths.add(value)
+        else:
+            paths.update(path for path in glob.glob(value, recursive=True) if os.path.isfile(path))
+
+    return sorted(paths)
+
+
+class Manifest:
+    """処理した画像を1行ずつ記録するJSON Linesファイルを管理するクラス
+    Attributes:
+        path (str | None): ファイルへのパス．Noneの場合は記録しない
+        _done (set[tuple[str, int, int]]): 成功した画像のキー(パス・サイズ・更新日時)
+        _lock (:obj:`threading.Lock`): ファイルへの追記を直列化するロック
+    Notes:
+        画像の内容が変わった(サイズか更新日時が異なる)場合は，成功していても処理し直す
+    Examples:
+        >>> import tempfile
+        >>> work_dir = tempfile.mkdtemp()
+        >>> image_path = os.path.join(work_dir, "shift.jpg")
+        >>> open(image_path, "w").close()
+        >>> manifest = Manifest(os.path.join(work_dir, "manifest.jsonl"))
+        >>> manifest.is_done(Manifest.key(image_path))
+        False
+        >>> manifest.record(Manifest.key(image_path), RESULT_SUCCEEDED, shifts=[], events=None, error=None, seconds=0.1)
+        >>> # 同じファイルを読み直すと，成功した画像は処理済みとなる
+        >>> Manifest(manifest.path).is_done(Manifest.key(image_path))
+        True
+    """
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self._done: set[tuple[str, int, int]] = set()
+        self._lock = threading.Lock()
+        if path is None or not os.path.exists(path):
+            return
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 書き込みの途中で中断された行は無視する
+                    continue
+                key = (record["path"], record["size"], record["mtime_ns"])
+                if record["result"] == RESULT_SUCCEEDED:
+                    self._done.add(key)
+                else:
+                    self._done.discard(key)
+
+    @staticmethod
+    def key(path: str) -> tuple[str, int, int]:
+        """画像を識別するキーを返すメソッド
+        Args:
+            path (str): 画像へのパス
+        Returns:
+            tuple[str, int, int]: (絶対パス，サイズ，更新日時(ナノ秒))
+        """
+        stat = os.stat(path)
+
+        return os.path.abspath(path), stat.st_size, stat.st_mtime_ns
+
+    def is_done(self, key: tuple[str, int, int]) -> bool:
+        """画像が処理済み(成功)かを返すメソッド
+        Args:
+            key (tuple[str, int, int]): keyの戻り値
+        Returns:
+            bool: 処理済みの場合はTrue
+        """
+        return key in self._done
+
+    def record(
+        self,
+        key: tuple[str, int, int],
+        result: str,
+        shifts: list[Shift],
+        events: Optional[int],
+        error: Optional[str],
+        seconds: float,
+    ) -> None:
+        """画像の処理結果を1行追記するメソッド
+        Args:
+            key (tuple[str, int, int]): keyの戻り値
+            result (str): 処理結果(succeeded・rejected・failed)
+            shifts (list[Shift]): 作成したシフトデータ
+            events (int | None): Googleカレンダーに追加した予定の数．書き込まない場合はNone
+            error (str | None): 失敗した場合のエラーメッセージ
+            seconds (float): 画像の処理にかかった時間(秒)
+        Returns:
+            None
+        """
+        if result == RESULT_SUCCEEDED:
+            self._done.add(key)
+        if self.path is None:
+            return
+        record = {
+            "path": key[0],
+            "size": key[1],
+            "mtime_ns": key[2],
+            "result": result,
+            "shifts": [shift.to_dict() for shift in shifts],
+            "events": events,
+            "error": error,
+            "seconds": round(seconds, 3),
+        }
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+@dataclasses.dataclass
+class _BulkItem:
+    """処理中の画像の状態を記録するクラス
+    Attributes:
+        path (str): 画像へのパス
+        key (tuple[str, int, int]): Manifest.keyの戻り値
+        started (float): 処理を始めた時刻(time.perf_counter)
+        transform (tuple | None): 抽出結果の座標を元の画像に戻すOcrResult.scaledの引数
+        shifts (list[Shift]): 作成したシフトデータ
+        events (int | None): Googleカレンダーに追加した予定の数
+    """
+    path: str
+    key: tuple[str, int, int]
+    started: float
+    transform: Optional[tuple] = None
+    shifts: list[Shift] = dataclasses.field(default_factory=list)
+    events: Optional[int] = None
+
+
+def run_bulk(
+    images: list[str],
+    vision_client,
+    manifest: Optional[Manifest] = None,
+    calendar_client=None,
+    calendar_mode: str = "sync",
+    ocr_concurrency: Optional[int] = None,
+    processes: Optional[int] = None,
+    save_artifacts: bool = False,
+    progress: Optional[Callable[[str], None]] = None,
+) -> BulkReport:
+    """画像をまとめて処理する関数
+    Args:
+        images (list[str]): 画像へのパス
+        vision_client (VisionClient): 文字の抽出を行うクライアント
+        manifest (Manifest | None): 処理結果を記録するマニフェスト．成功済みの画像は飛ばす
+        calendar_client (CalendarClient | None): Googleカレンダーのクライアント．Noneの場合は書き込まない
+        calendar_mode (str): Googleカレンダーへの書き込み方法(controller.write_calendarを参照)
+        ocr_concurrency (int | None): 文字の抽出を同時に行う数の上限．Noneの場合はOCR_CONCURRENCY
+        processes (int | None): 画像の判定・前処理とシフトデータへの変換を行うプロセスの数．Noneの場合はCPUの数．
+            0の場合はプロセスプールを使わず，このプロセスのスレッドで行う
+        save_artifacts (bool): 画像ごとに画像のコピーと抽出結果を成果物として残すかどうか
+        progress (Callable[[str], None] | None): 画像ごとの進捗を表す文字列を受け取る関数
+    Returns:
+        BulkReport: 処理結果と処理速度
+    Examples:
+        >>> import tempfile
+        >>> from PIL import Image
+        >>> work_dir = tempfile.mkdtemp()
+        >>> images = [os.path.join(work_dir, name) for name in ("a.jpg", "broken.jpg", "c.jpg")]
+        >>> for path in images:
+        ...     Image.effect_noise((1200, 1600), 64).save(path, "JPEG")
+        >>> with open(images[1], "wb") as f:
+        ...     _ = f.write(b"dummy image data")
+        >>> class FakeVisionClient:
+        ...     def extract_data_from_image(self, result_dir, image=None):
+        ...         return OcrResult()
+        >>> manifest = Manifest(os.path.join(work_dir, "manifest.jsonl"))
+        >>> report = run_bulk(images, FakeVisionClient(), manifest, processes=0)
+        >>> report.total, report.succeeded, report.rejected, report.failed, report.skipped
+        (3, 2, 1, 0, 0)
+        >>> # 同じマニフェストで再実行すると，成功した画像は飛ばし，不合格だった画像のみを処理し直す
+        >>> report = run_bulk(images, FakeVisionClient(), Manifest(manifest.path), processes=0)
+        >>> report.skipped, report.processed
+        (2, 1)
+        >>>
+        >>> # Googleカレンダーに書き込めなかったシフトがある画像は失敗として記録し，再実行で処理し直す
+        >>> from unittest.mock import patch
+        >>> from src.dataclass.event_result import EventResult
+        >>> shift = Shift(summary="バイト", start_datetime="2025-04-02T17:00:00+09:00:00", end_datetime="2025-04-02T21:30:00+09:00:00", timezone="Asia/Tokyo")
+        >>> class FakeCalendarClient:
+        ...     def __init__(self, error):
+        ...         self.error = error
+        ...     def create_events_batch(self, shifts):
+        ...         return [EventResult(shift=shift, event_id=None if self.error else "a", error=self.error) for shift in shifts]
+        >>> manifest = Manifest(os.path.join(work_dir, "calendar.jsonl"))
+        >>> with patch.object(sys.modules[__name__], "_parse", return_value=([shift], 0.0)):
+        ...     for error in ("Rate Limit Exceeded", None):
+        ...         report = run_bulk(images[:1], FakeVisionClient(), Manifest(manifest.path), FakeCalendarClient(error), "batch", processes=0)
+        ...         print(report.succeeded, report.failed, report.skipped, report.events)
+        0 1 0 0
+        1 0 0 1
+    """
+    logger = logging.getLogger("__main__").getChild("bulk")
+    manifest = manifest if manifest is not None else Manifest(None)
+    ocr_concurrency = ocr_concurrency if ocr_concurrency is not None else OCR_CONCURRENCY
+    processes = processes if processes is not None else (os.cpu_count() or 1)
+    report = BulkReport(total=len(images), ocr_concurrency=ocr_concurrency, processes=processes)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(ocr_concurrency, thread_name_prefix="shift-bulk-ocr") as ocr_pool, \
+            _create_process_pool(processes) as process_pool, \
+            ThreadPoolExecutor(CALENDAR_CONCURRENCY, thread_name_prefix="shift-bulk-calendar") as calendar_pool:
+        futures: dict[Future, tuple[str, _BulkItem]] = dict()
+        todo = list()
+        for path in images:
+            key = Manifest.key(path)
+            if manifest.is_done(key):
+                report.skipped += 1
+            else:
+                todo.append((path, key))
+        remaining = iter(todo)
+
+        def submit_next() -> None:
+            for path, key in remaining:
+                item = _BulkItem(path=path, key=key, started=time.perf_counter())
+                futures[process_pool.submit(_prepare, path)] = ("prepare", item)
+                return
+
+        def finish(item: _BulkItem, result: str, error: Optional[str] = None) -> None:
+            seconds = time.perf_counter() - item.started
+            setattr(report, result, getattr(report, result) + 1)
+            if result == RESULT_SUCCEEDED:
+                report.shifts += len(item.shifts)
+            # 失敗した画像でも，書き込めた予定はGoogleカレンダーに追加されている
+            report.events += item.events or 0
+            manifest.record(item.key, result, item.shifts, item.events, error, seconds)
+            if progress is not None:
+                done = report.processed
+                rate = done / (time.perf_counter() - start)
+                progress(
+                    f"[{done}/{len(todo)}] {result:<9} {item.path} "
+                    f"({len(item.shifts)}件, {seconds:.1f}秒, {rate:.2f}枚/秒)"
+                    + (f": {error}" if error else "")
+                )
+            submit_next()
+
+        # 前処理した画像がメモリに溜まらないよう，同時に処理中とする画像の数を制限する
+        for _ in range(ocr_concurrency * 2 + max(processes, 1)):
+            submit_next()
+
+        while futures:
+            done_futures, _ = wait_futures(futures, return_when=FIRST_COMPLETED)
+            for future in done_futures:
+                stage, item = futures.pop(future)
+                try:
+                    value, seconds = future.result()
+                except ImageRejectedError as e:
+                    finish(item, RESULT_REJECTED, str(e))
+                    continue
+                except Exception as e:
+                    logger.warning("%sの処理に失敗しました。(%s): %s", item.path, stage, e)
+                    finish(item, RESULT_FAILED, str(e) or type(e).__name__)
+                    continue
+
+                if stage == "prepare":
+                    report.prepare_seconds += seconds
+                    image, item.transform = value
+                    future = ocr_pool.submit(_extract, vision_client, item.path, image, save_artifacts)
+                    futures[future] = ("ocr", item)
+                elif stage == "ocr":
+                    report.ocr_seconds += seconds
+                    futures[process_pool.submit(_parse, value, item.transform)] = ("parse", item)
+                elif stage == "parse":
+                    report.parse_seconds += seconds
+                    item.shifts = value
+                    if calendar_client is None:
+                        finish(item, RESULT_SUCCEEDED)
+                    else:
+                        future = calendar_pool.submit(_write, calendar_client, item.shifts, calendar_mode)
+                        futures[future] = ("calendar", item)
+                else:
+                    report.calendar_seconds += seconds
+                    written, error = value
+                    item.events = len(written)
+                    if len(written) < len(item.shifts):
+                        # マニフェストで飛ばさず，次回の実行で書き込み直すよう失敗として記録する
+                        finish(item, RESULT_FAILED, error or f"{len(item.shifts) - len(written)}件の予定を追加できませんでした。")
+                    else:
+                        finish(item, RESULT_SUCCEEDED)
+    report.elapsed = time.perf_counter() - start
+
+    return report
+
+
+def _create_process_pool(processes: int) -> Executor:
+    """画像の判定・前処理とシフトデータへの変換を行うプロセスプールを作成する関数
+    Args:
+        processes (int): プロセスの数．0の場合は1つのスレッドで行う
+    Returns:
+        Executor: プロセスプール
+    Notes:
+        gRPCのスレッドを持つこのプロセスからforkしないよう，forkserverから起動する．
+        forkserverには画像処理のモジュールを読み込ませておき，各プロセスの起動を速くする
+    """
+    if processes == 0:
+        return ThreadPoolExecutor(1, thread_name_prefix="shift-bulk-cpu")
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["src.image_processor.image_processor"])
+    else:
+        context = multiprocessing.get_context("spawn")
+
+    return ProcessPoolExecutor(processes, mp_context=context)
+
+
+_image_processor = None
+
+
+def _get_image_processor():
+    """プロセス内で共有するImageProcessorを取得する関数(Vision APIのクライアントは作成しない)
+    Returns:
+        ImageProcessor: 画像の判定・前処理とシフトデータへの変換を行うオブジェクト
+    """
+    global _image_processor
+    if _image_processor is None:
+        from src.image_processor.image_processor import ImageProcessor
+
+        _image_processor = ImageProcessor()
+
+    return _image_processor
+
+
+def _prepare(path: str) -> tuple[tuple[ImageSource, Optional[tuple]], float]:
+    """1枚の画像を判定・前処理する関数(プロセスプールで実行する)
+    Args:
+        path (str): 画像へのパス
+    Returns:
+        tuple: ((Vision APIに送る画像，座標を元の画像に戻す引数)，かかった時間(秒))
+    Raises:
+        ImageRejectedError: 画像がシフト表として読み取れない場合
+    """
+    start = time.perf_counter()
+    prepared = _get_image_processor().prepare(os.path.dirname(path), image=path)
+
+    return prepared, time.perf_counter() - start
+
+
+def _extract(vision_client, path: str, image: ImageSource, save_artifacts: bool) -> tuple[OcrResult, float]:
+    """Vision APIで文字を抽出する関数(スレッドで実行する)
+    Args:
+        vision_client (VisionClient): 文字の抽出を行うクライアント
+        path (str): 元の画像へのパス(成果物として残す場合にコピーする)
+        image (ImageSource): Vision APIに送る画像(_prepareの戻り値)
+        save_artifacts (bool): 成果物を残すかどうか
+    Returns:
+        tuple[OcrResult, float]: (抽出結果，かかった時間(秒))
+    """
+    start = time.perf_counter()
+    artifact_store = get_default_artifact_store()
+    job_id = artifact_store.new_job_id()
+    with job_context(job_id), artifact_store.open_job(job_id, enabled=save_artifacts) as result_dir:
+        try:
+            if save_artifacts:
+                link_or_copy(path, f"{result_dir}/shift.jpg")
+            ocr_result = vision_client.extract_data_from_image(result_dir, image=image)
+        finally:
+            # 一時ディレクトリを削除する前に，抽出結果の書き出しを待つ
+            if not save_artifacts:
+                wait_for_background()
+
+    return ocr_result, time.perf_counter() - start
+
+
+def _parse(ocr_result: OcrResult, transform: Optional[tuple]) -> tuple[list[Shift], float]:
+    """抽出結果の座標を元の画像に戻し，シフトデータに変換する関数(プロセスプールで実行する)
+    Args:
+        ocr_result (OcrResult): 抽出結果
+        transform (tuple | None): OcrResult.scaledの引数．Noneの場合は座標を変えない
+    Returns:
+        tuple[list[Shift], float]: (シフトデータ，かかった時間(秒))
+    """
+    start = time.perf_counter()
+
+    return _get_image_processor().to_shifts(ocr_result, transform), time.perf_counter() - start
+
+
+def _write(
+    calendar_client, shifts: list[Shift], mode: str
+) -> tuple[tuple[list[Shift], Optional[str]], float]:
+    """シフトデータをGoogleカレンダーに書き込む関数(スレッドで実行する)
+    Returns:
+        tuple: ((追加に成功したシフトデータ，失敗したシフトがある場合のエラーメッセージ)，かかった時間(秒))
+    """
+    from src.controller import CalendarWriteError, write_calendar
+
+    start = time.perf_counter()
+    try:
+        written, error = write_calendar(calendar_client, shifts, mode), None
+    except CalendarWriteError as e:
+        written, error = e.shifts, str(e)
+
+    return (written, error), time.perf_counter() - start
+
+
+def cli(argv: Optional[list[str]] = None) -> int:
+    """コマンドラインから画像をまとめて処理する関数
+    Args:
+        argv (list[str] | None): コマンドライン引数．Noneの場合はsys.argv[1:]
+    Returns:
+        int: 終了コード(失敗した画像がない場合は0)
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m src.main", description="フォルダ内のシフト表の画像をまとめて処理します。"
+    )
+    parser.add_argument("inputs", nargs="+", help="画像のあるディレクトリ・globのパターン・画像へのパス")
+    parser.add_argument("--recursive", action="store_true", help="ディレクトリの下の階層も探す")
+    parser.add_argument("--manifest", help="処理結果を記録するJSON Linesファイル．同じファイルを指定すると続きから処理する")
+    parser.add_argument("--report", help="処理結果と処理速度を書き出すJSONファイル")
+    parser.add_argument("--ocr-concurrency", type=int, default=OCR_CONCURRENCY, help="文字の抽出を同時に行う数の上限")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="画像の判定・前処理とシフトデータへの変換を行うプロセスの数(0の場合はプロセスを分けない)")
+    parser.add_argument("--calendar", action="store_true", help="作成したシフトデータをGoogleカレンダーに追加する")
+    parser.add_argument("--calendar-mode", choices=("sync", "batch", "insert"), default=os.getenv("CALENDAR_WRITE_MODE", "sync"), help="Googleカレンダーへの書き込み方法")
+    parser.add_argument("--save-artifacts", action="store_true", help="画像ごとに画像のコピーと抽出結果を成果物として残す")
+    parser.add_argument("--quiet", action="store_true", help="画像ごとの進捗を表示しない")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    images = find_images(args.inputs, recursive=args.recursive)
+    if not images:
+        parser.error("画像が見つかりません。")
+
+    # クライアントは必要になった時点で作成する(Googleカレンダーは書き込む場合のみ)
+    from src.client_registry import registry
+
+    calendar_client = registry.get("calendar") if args.calendar else None
+    report = run_bulk(
+        images,
+        registry.get("vision"),
+        manifest=Manifest(args.manifest),
+        calendar_client=calendar_client,
+        calendar_mode=args.calendar_mode,
+        ocr_concurrency=args.ocr_concurrency,
+        processes=args.processes,
+        save_artifacts=args.save_artifacts,
+        progress=None if args.quiet else lambda line: print(line, file=sys.stderr, flush=True),
+    )
+
+    print(
+        f"画像: {report.total}枚 (成功 {report.succeeded}, 不合格 {report.rejected}, 失敗 {report.failed}, "
+        f"処理済みのため省略 {report.skipped})\n"
+        f"シフト: {report.shifts}件, Googleカレンダーへの追加: {report.events}件\n"
+        f"所要時間: {report.elapsed:.1f}秒 ({report.images_per_second:.2f}枚/秒, {report.shifts_per_second:.1f}件/秒)\n"
+        f"段階ごとの合計: 前処理 {report.prepare_seconds:.1f}秒, 抽出 {report.ocr_seconds:.1f}秒, "
+        f"変換 {report.parse_seconds:.1f}秒, "
+        f"書き込み {report.calendar_seconds:.1f}秒"
+    )
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report.to_dict(), f, ensure_ascii=False, indent=2)
+
+    return 1 if report.failed else 0
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
@@ -1,15 +1,41 @@
 """Googleカレンダーとアプリケーション間のやり取りを行うモジュール"""
 
-from dotenv import load_dotenv
+import contextvars
+import hashlib
+import json
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Optional
 
-load_dotenv("src/.env")
-from google.oauth2 import service_account
+import google_auth_httplib2
 import googleapiclient.discovery
+import httplib2
 
 from src.dataclass.shift import Shift
+from src.dataclass.event_result import EventResult
+from src.dataclass.sync_result import SyncResult
+from src.concurrency_limiter import AimdLimiter, backoff_delay
+from src.token_cache import CALENDAR_SCOPES, load_credentials
+from src import metrics
 
-from unittest.mock import MagicMock, patch
+# Googleカレンダーのバッチリクエストに含められる予定の上限
+BATCH_SIZE_LIMIT = 50
+# 同期で追加した予定のIDの接頭辞と，予定に付与する非公開の拡張プロパティ
+SYNC_EVENT_ID_PREFIX = "shift"
+SYNC_PROPERTY_KEY = "shiftConversion"
+SYNC_PROPERTY_VALUE = "1"
+# create_eventsで同時に送る予定の追加リクエストの上限
+INSERT_CONCURRENCY = int(os.getenv("CALENDAR_INSERT_CONCURRENCY", 32))
+# 流量制限を受けたリクエストを再試行する回数の上限
+INSERT_MAX_RETRIES = int(os.getenv("CALENDAR_INSERT_MAX_RETRIES", 6))
+# 再試行までの待機時間の基準と上限(秒)
+BACKOFF_BASE = float(os.getenv("CALENDAR_BACKOFF_BASE", 0.5))
+BACKOFF_MAX = 32.0
+# 流量制限を表す403の理由
+RATE_LIMIT_REASONS = ("rateLimitExceeded", "userRateLimitExceeded")
 
 
 class CalendarClient:
@@ -17,26 +43,72 @@ class CalendarClient:
     Attributes:
         _api_key (str): Googleカレンダーを利用するための鍵のパス
         _calendar_id (str): 対象GoogleカレンダーのID
-        _creds (:obj:`google.oauth2.service_account.Credentials`): 認証情報
+        _creds (:obj:`google.auth.credentials.Credentials`): 認証情報(アクセストークンはプロセス間で共有する)
         _service (:obj:`googleapiclient.discovery.Resource`): Googleカレンダーとのやりとりを担うオブジェクト
+        _http_factory (Callable[[], httplib2.Http]): スレッドごとのHTTP接続を作成する関数
+        _local (:obj:`threading.local`): スレッドごとのHTTP接続を保持するオブジェクト
+        _limiter (:obj:`AimdLimiter`): create_eventsで同時に送るリクエストの数を調整するオブジェクト
+        _executor (:obj:`ThreadPoolExecutor` | None): create_eventsのリクエストを送るワーカー(初回利用時に作成)
+        _executor_lock (:obj:`threading.Lock`): _executorの作成を直列化するロック
+    Notes:
+        httplib2の接続はスレッドセーフではないため，_serviceは共有しつつ
+        リクエストの送信にはスレッドごとのHTTP接続を使う
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        http_factory: Optional[Callable[[], httplib2.Http]] = None,
+        credentials: Optional["google.auth.credentials.Credentials"] = None,
+        max_concurrency: Optional[int] = None,
+    ):
         self._api_key = os.getenv("GOOGLE_CLOUD_API_KEY_PATH")
         self._calendar_id = os.getenv("GOOGLE_CALENDAR_ID")
-        self._creds = service_account.Credentials.from_service_account_file(
-            self._api_key
-        )
+        # 認証情報が渡されない場合は鍵ファイルから読み込む
+        if credentials is None:
+            credentials = load_credentials(self._api_key, CALENDAR_SCOPES)
+        self._creds = credentials
         self._service = googleapiclient.discovery.build(
             "calendar", "v3", credentials=self._creds
         )
+        self._http_factory = http_factory if http_factory is not None else httplib2.Http
+        self._local = threading.local()
+        # 流量制限を受けて下げた上限は，同じクライアントを使う以降の呼び出しにも引き継ぐ
+        self._limiter = AimdLimiter(
+            max_limit=max_concurrency if max_concurrency is not None else INSERT_CONCURRENCY
+        )
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+
+    def _get_http(self) -> "google_auth_httplib2.AuthorizedHttp":
+        """呼び出し元のスレッド専用のHTTP接続を取得するメソッド
+        Args:
+            None
+        Returns:
+            google_auth_httplib2.AuthorizedHttp: 認証情報付きのHTTP接続
+        """
+        http = getattr(self._local, "http", None)
+        if http is None:
+            http = google_auth_httplib2.AuthorizedHttp(
+                self._creds, http=self._http_factory()
+            )
+            self._local.http = http
 
-    def create_events(self, shifts: list[Shift]) -> None:
+        return http
+
+    def create_events(self, shifts: list[Shift]) -> list[EventResult]:
         """Googleカレンダーにシフトデータを予定として追加するメソッド
         Args:
             shift (list[Shift]): シフトデータ
         Returns:
-            None
+            list[EventResult]: シフトデータと同じ順序の登録結果
+        Raises:
+            googleapiclient.errors.HttpError: 流量制限以外の理由で追加に失敗した場合，
+                または流量制限による再試行がINSERT_MAX_RETRIES回を超えた場合
+        Notes:
+            バッチリクエストを使わず，1件ずつのリクエストを最大INSERT_CONCURRENCY件同時に送る．
+            同時に送る数はAIMDで調整し，流量制限(403 rateLimitExceeded，429)を受けた場合は上限を半分にして，
+            ジッター付きの指数バックオフの後に再試行する．
+            流量制限以外で失敗した場合は，まだ送っていない予定の追加をやめて最初の例外を送出する
         Examples:
             >>> from unittest.mock import patch, MagicMock, call
             >>> from dataclass.shift import Shift
@@ -69,7 +141,7 @@ class CalendarClient:
             ...
             ...     # --- テスト対象の実行 ---
             ...     test_client = CalendarClient()
-            ...     test_client.create_events(shifts=dummy_shifts)
+            ...     results = test_client.create_events(shifts=dummy_shifts)
             ...
             >>> # --- 検証 ---
             >>> mock_from_file.assert_called_once_with(dummy_key_path)
@@ -87,23 +159,550 @@ class CalendarClient:
             >>>
             >>> # execute()も2回呼ばれたことを確認
             >>> assert mock_service.events().insert().execute.call_count == 2
+            >>>
+            >>> # --- 4. 遅延と流量制限のある偽のGoogleカレンダーでの実行 ---
+            >>> import time
+            >>> from google.auth.credentials import AnonymousCredentials
+            >>> from src.testing.fake_calendar import FakeCalendarHttp
+            >>> month_shifts = [
+            ...     Shift(summary="バイト", start_datetime=f"2025-04-{day:02}T17:00:00+09:00", end_datetime=f"2025-04-{day:02}T21:00:00+09:00", timezone="Asia/Tokyo")
+            ...     for day in range(1, 31)
+            ... ]
+            >>> # 1往復0.2秒の場合，30件を順に送ると6秒かかるが，同時に送ると1往復分程度で終わる
+            >>> fake_http = FakeCalendarHttp(latency=0.2)
+            >>> with patch.dict("os.environ", {"GOOGLE_CALENDAR_ID": "dummy@outlook.jp"}):
+            ...     test_client = CalendarClient(http_factory=lambda: fake_http, credentials=AnonymousCredentials())
+            >>> start = time.perf_counter()
+            >>> results = test_client.create_events(shifts=month_shifts)
+            >>> time.perf_counter() - start < 0.6, len(fake_http.events), all(result.succeeded for result in results)
+            (True, 30, True)
+            >>>
+            >>> # 同時に10件までしか受け付けない場合は，流量制限を受けた分を再試行して全て追加する
+            >>> fake_http = FakeCalendarHttp(latency=0.2, max_concurrency=10)
+            >>> with patch.dict("os.environ", {"GOOGLE_CALENDAR_ID": "dummy@outlook.jp"}):
+            ...     test_client = CalendarClient(http_factory=lambda: fake_http, credentials=AnonymousCredentials())
+            >>> results = test_client.create_events(shifts=month_shifts)
+            >>> len(fake_http.events), fake_http.throttled > 0, fake_http.max_in_flight
+            (30, True, 10)
+            >>> # 同時に送る数の上限は流量制限に合わせて下がっている
+            >>> test_client._limiter.limit < 32
+            True
+        """
+        # リクエストの作成は呼び出し元のスレッドで順に行い，送信のみをワーカーで行う
+        requests = [
+            self._service.events().insert(
+                calendarId=self._calendar_id, body=self._to_event(shift)
+            )
+            for shift in shifts
+        ]
+        aborted = threading.Event()
+
+        def insert(request) -> Optional[dict]:
+            if aborted.is_set():
+                return None
+            try:
+                return self._execute_with_backoff(request)
+            except Exception:
+                aborted.set()
+                raise
+
+        # ジョブIDなどのコンテキストを引き継ぐ(Contextは同時に複数のスレッドで使えないため1件ずつ複製する)
+        executor = self._get_executor()
+        futures = [
+            executor.submit(contextvars.copy_context().run, insert, request)
+            for request in requests
+        ]
+        results = list()
+        error = None
+        for shift, future in zip(shifts, futures):
+            try:
+                response = future.result()
+            except Exception as e:
+                error = error or e
+                continue
+            if response is not None:
+                results.append(EventResult(shift=shift, event_id=response.get("id")))
+        if error is not None:
+            raise error
+
+        return results
+
+    def _execute_with_backoff(self, request) -> dict:
+        """流量制限を受けた場合は再試行しながらリクエストを送信するメソッド
+        Args:
+            request (googleapiclient.http.HttpRequest): 送信するリクエスト
+        Returns:
+            dict: 応答
+        Raises:
+            googleapiclient.errors.HttpError: create_eventsを参照
         """
+        for attempt in range(INSERT_MAX_RETRIES + 1):
+            epoch = self._limiter.acquire()
+            try:
+                with metrics.registry.span("calendar_insert"):
+                    response = request.execute(http=self._get_http())
+            except Exception as e:
+                throttled = _is_rate_limited(e)
+                self._limiter.release(epoch, throttled=throttled)
+                _count_api_error(e)
+                if not throttled or attempt == INSERT_MAX_RETRIES:
+                    raise
+                metrics.registry.inc(metrics.CALENDAR_THROTTLED)
+                time.sleep(backoff_delay(attempt, BACKOFF_BASE, BACKOFF_MAX))
+                continue
+            self._limiter.release(epoch)
+
+            return response
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """create_eventsのリクエストを送るワーカーを取得するメソッド
+        Notes:
+            ワーカーのスレッドは使い回すため，スレッドごとのHTTP接続も呼び出しをまたいで再利用される
+        """
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self._limiter.max_limit,
+                    thread_name_prefix="shift-calendar-insert",
+                )
+
+            return self._executor
+
+    def create_events_batch(
+        self, shifts: list[Shift], batch_size: int = BATCH_SIZE_LIMIT
+    ) -> list[EventResult]:
+        """バッチリクエストを使ってGoogleカレンダーにシフトデータを予定として追加するメソッド
+        Args:
+            shifts (list[Shift]): シフトデータ
+            batch_size (int): 1回のバッチリクエストに含める予定の数(最大BATCH_SIZE_LIMIT)
+        Returns:
+            list[EventResult]: シフトデータと同じ順序の登録結果
+        Notes:
+            一部の予定の登録に失敗しても，残りの予定の登録は続ける
+        Examples:
+            >>> from unittest.mock import patch
+            >>> from google.auth.credentials import AnonymousCredentials
+            >>> from dataclass.shift import Shift
+            >>> from src.testing.fake_calendar import FakeCalendarHttp
+            >>>
+            >>> # --- 1. ダミーデータの設定 ---
+            >>> dummy_shifts = [
+            ...     Shift(summary="バイト", start_datetime=f"2025-04-0{day}T17:00:00+09:00", end_datetime=f"2025-04-0{day}T21:00:00+09:00", timezone="Asia/Tokyo")
+            ...     for day in range(1, 6)
+            ... ]
+            >>> # 4月3日の予定だけ登録に失敗させる
+            >>> fake_http = FakeCalendarHttp(fail_when=lambda event: 403 if event["start"]["dateTime"].startswith("2025-04-03") else None)
+            >>>
+            >>> # --- 2. 外部依存を置き換えてテストを実行 ---
+            >>> with patch.dict("os.environ", {"GOOGLE_CLOUD_API_KEY_PATH": "dummy/key.json", "GOOGLE_CALENDAR_ID": "dummy@outlook.jp"}), \\
+            ...      patch("google.oauth2.service_account.Credentials.from_service_account_file", return_value=AnonymousCredentials()):
+            ...     test_client = CalendarClient(http_factory=lambda: fake_http)
+            ...     results = test_client.create_events_batch(shifts=dummy_shifts, batch_size=2)
+            ...
+            >>> # --- 3. 検証 ---
+            >>> # 5件を2件ずつのバッチで送るので通信は3回
+            >>> fake_http.round_trips
+            3
+            >>> [result.succeeded for result in results]
+            [True, True, False, True, True]
+            >>> len(fake_http.events)
+            4
+            >>> [result.shift for result in results] == dummy_shifts
+            True
+        """
+        # 応答には予定IDのみを含めさせる
+        requests = [
+            self._service.events().insert(
+                calendarId=self._calendar_id,
+                body=self._to_event(shift),
+                fields="id",
+            )
+            for shift in shifts
+        ]
+        results = list()
+        for shift, (response, exception) in zip(
+            shifts, self._execute_batches(requests, batch_size)
+        ):
+            if exception is not None:
+                results.append(EventResult(shift=shift, error=str(exception)))
+            else:
+                results.append(EventResult(shift=shift, event_id=response["id"]))
+
+        return results
+
+    def sync_events(
+        self, shifts: list[Shift], batch_size: int = BATCH_SIZE_LIMIT
+    ) -> SyncResult:
+        """シフト表の期間の予定をシフトデータと一致させるメソッド
+        Args:
+            shifts (list[Shift]): シフトデータ
+            batch_size (int): 1回のバッチリクエストに含める予定の数(最大BATCH_SIZE_LIMIT)
+        Returns:
+            SyncResult: 追加・更新・削除の結果
+        Notes:
+            - 予定IDはシフトデータから決まるため，同じシフト表を何度送っても予定は重複しない
+            - 削除するのはこのアプリケーションが追加した予定のみ
+            - 既存の予定の取得は期間全体で1回(ページ分割された場合を除く)だけ行う
+        Examples:
+            >>> from unittest.mock import patch
+            >>> from google.auth.credentials import AnonymousCredentials
+            >>> from dataclass.shift import Shift
+            >>> from src.testing.fake_calendar import FakeCalendarHttp
+            >>>
+            >>> # --- 1. ダミーデータの設定 ---
+            >>> def make_shift(day, end_hour=21):
+            ...     return Shift(summary="バイト", start_datetime=f"2025-04-{day:02}T17:00:00+09:00:00", end_datetime=f"2025-04-{day:02}T{end_hour}:00:00+09:00:00", timezone="Asia/Tokyo")
+            >>> first_shifts = [make_shift(1), make_shift(2), make_shift(3)]
+            >>> # 2日の終了時刻を修正し，3日を削除し，4日を追加したシフト表
+            >>> corrected_shifts = [make_shift(1), make_shift(2, end_hour=22), make_shift(4)]
+            >>> fake_http = FakeCalendarHttp()
+            >>>
+            >>> # --- 2. 外部依存を置き換えてテストを実行 ---
+            >>> with patch.dict("os.environ", {"GOOGLE_CLOUD_API_KEY_PATH": "dummy/key.json", "GOOGLE_CALENDAR_ID": "dummy@outlook.jp"}), \\
+            ...      patch("google.oauth2.service_account.Credentials.from_service_account_file", return_value=AnonymousCredentials()):
+            ...     test_client = CalendarClient(http_factory=lambda: fake_http)
+            ...     first = test_client.sync_events(first_shifts)
+            ...     again = test_client.sync_events(first_shifts)
+            ...     corrected = test_client.sync_events(corrected_shifts)
+            ...
+            >>> # --- 3. 検証 ---
+            >>> len(first.inserted), len(first.patched), len(first.deleted), len(first.unchanged)
+            (3, 0, 0, 0)
+            >>> # 同じシフト表を再度送っても何も変更しない
+            >>> len(again.inserted), len(again.patched), len(again.deleted), len(again.unchanged)
+            (0, 0, 0, 3)
+            >>> len(corrected.inserted), len(corrected.patched), len(corrected.deleted), len(corrected.unchanged)
+            (1, 1, 1, 1)
+            >>> sorted(event["start"]["dateTime"][:10] for event in fake_http.events.values())
+            ['2025-04-01', '2025-04-02', '2025-04-04']
+            >>> # 1回目: 取得+追加, 2回目: 取得のみ, 3回目: 取得+変更
+            >>> fake_http.round_trips
+            5
+        """
+        result = SyncResult()
+        if not shifts:
+            return result
+
+        desired = self._to_sync_events(shifts)
+        existing = self._list_synced_events(shifts)
+
+        # 既存の予定との差分を計算する
+        inserts, patches = list(), list()
+        for event_id, (shift, event) in desired.items():
+            if event_id not in existing:
+                inserts.append((shift, event))
+            elif _is_same_event(existing[event_id], event):
+                result.unchanged.append(EventResult(shift=shift, event_id=event_id))
+            else:
+                patches.append((shift, event))
+        deletes = [event_id for event_id in existing if event_id not in desired]
+
+        requests = list()
+        for _, event in inserts:
+            requests.append(
+                self._service.events().insert(
+                    calendarId=self._calendar_id, body=event, fields="id"
+                )
+            )
+        for _, event in patches:
+            requests.append(
+                self._service.events().patch(
+                    calendarId=self._calendar_id,
+                    eventId=event["id"],
+                    body=event,
+                    fields="id",
+                )
+            )
+        for event_id in deletes:
+            requests.append(
+                self._service.events().delete(
+                    calendarId=self._calendar_id, eventId=event_id
+                )
+            )
+        responses = self._execute_batches(requests, batch_size)
+
+        # 削除済みの予定とIDが衝突した場合は，その予定を上書きして復活させる
+        conflicts = list()
+        for (shift, event), (_, exception) in zip(inserts, responses[: len(inserts)]):
+            if _status_of(exception) == 409:
+                conflicts.append((shift, event))
+            elif exception is not None:
+                result.inserted.append(EventResult(shift=shift, error=str(exception)))
+            else:
+                result.inserted.append(EventResult(shift=shift, event_id=event["id"]))
+        retry_requests = [
+            self._service.events().update(
+                calendarId=self._calendar_id,
+                eventId=event["id"],
+                body=dict(event, status="confirmed"),
+                fields="id",
+            )
+            for _, event in conflicts
+        ]
+        for (shift, event), (_, exception) in zip(
+            conflicts, self._execute_batches(retry_requests, batch_size)
+        ):
+            result.inserted.append(
+                EventResult(
+                    shift=shift,
+                    event_id=None if exception is not None else event["id"],
+                    error=None if exception is None else str(exception),
+                )
+            )
+
+        for (shift, event), (_, exception) in zip(
+            patches, responses[len(inserts) : len(inserts) + len(patches)]
+        ):
+            result.patched.append(
+                EventResult(
+                    shift=shift,
+                    event_id=None if exception is not None else event["id"],
+                    error=None if exception is None else str(exception),
+                )
+            )
+        for event_id, (_, exception) in zip(
+            deletes, responses[len(inserts) + len(patches) :]
+        ):
+            # 既に削除されている予定は削除できたものとみなす
+            if exception is not None and _status_of(exception) not in (404, 410):
+                result.errors.append(f"{event_id}: {exception}")
+            else:
+                result.deleted.append(event_id)
+
+        return result
+
+    def event_id_for(self, shift: Shift, occurrence: int = 0) -> str:
+        """シフトデータから予定IDを決めるメソッド
+        Args:
+            shift (Shift): シフトデータ
+            occurrence (int): 同じ日に同じ名前のシフトが複数ある場合の順番
+        Returns:
+            str: 予定ID(base32hexの文字のみからなる)
+        Notes:
+            開始日と予定の名前から決めるため，時刻を修正したシフトは同じ予定として更新される
+        Examples:
+            >>> from dataclass.shift import Shift
+            >>> from unittest.mock import MagicMock
+            >>> dummy_shift = Shift(summary="バイト", start_datetime="2025-04-02T17:00:00+09:00:00", end_datetime="2025-04-02T21:30:00+09:00:00", timezone="Asia/Tokyo")
+            >>> corrected_shift = Shift(summary="バイト", start_datetime="2025-04-02T18:00:00+09:00:00", end_datetime="2025-04-02T22:00:00+09:00:00", timezone="Asia/Tokyo")
+            >>> test_client = CalendarClient.__new__(CalendarClient)
+            >>> test_client._calendar_id = "dummy@outlook.jp"
+            >>> test_client.event_id_for(dummy_shift)
+            'shift14a02dbdc7a621557fa3967f298a177780dbc39f'
+            >>> test_client.event_id_for(dummy_shift) == test_client.event_id_for(corrected_shift)
+            True
+            >>> test_client.event_id_for(dummy_shift) == test_client.event_id_for(dummy_shift, occurrence=1)
+            False
+        """
+        key = f"{self._calendar_id}|{shift.summary}|{shift.start_datetime[:10]}|{occurrence}"
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+        return f"{SYNC_EVENT_ID_PREFIX}{digest}"
+
+    def _to_sync_events(self, shifts: list[Shift]) -> dict[str, tuple[Shift, dict]]:
+        """シフトデータを予定IDと予定の対応表に変換するメソッド
+        Args:
+            shifts (list[Shift]): シフトデータ
+        Returns:
+            dict[str, tuple[Shift, dict]]: 予定IDと(シフトデータ，予定)の対応表
+        """
+        desired = dict()
+        occurrences: dict[tuple[str, str], int] = dict()
         for shift in shifts:
-            shift_dict = shift.to_dict()
-            event = {
-                "summary": shift_dict["summary"],
-                "start": {
-                    "dateTime": shift_dict["start_datetime"],
-                    "timeZone": shift_dict["timezone"],
-                },
-                "end": {
-                    "dateTime": shift_dict["end_datetime"],
-                    "timeZone": shift_dict["timezone"],
-                },
+            day_key = (shift.summary, shift.start_datetime[:10])
+            occurrence = occurrences.get(day_key, 0)
+            occurrences[day_key] = occurrence + 1
+
+            event = self._to_event(shift)
+            event["id"] = self.event_id_for(shift, occurrence)
+            event["extendedProperties"] = {
+                "private": {SYNC_PROPERTY_KEY: SYNC_PROPERTY_VALUE}
             }
-            self._service.events().insert(
-                calendarId=self._calendar_id, body=event
-            ).execute()
+            desired[event["id"]] = (shift, event)
+
+        return desired
+
+    def _list_synced_events(self, shifts: list[Shift]) -> dict[str, dict]:
+        """シフト表の期間にある，このアプリケーションが追加した予定を取得するメソッド
+        Args:
+            shifts (list[Shift]): シフトデータ
+        Returns:
+            dict[str, dict]: 予定IDと予定の対応表
+        """
+        # シフト表の最初の日の0時から最後のシフトの終了時刻までを期間とする
+        first_start = min(datetime.fromisoformat(s.start_datetime) for s in shifts)
+        time_min = first_start.replace(hour=0, minute=0, second=0, microsecond=0)
+        time_max = max(datetime.fromisoformat(s.end_datetime) for s in shifts)
+
+        existing = dict()
+        page_token = None
+        while True:
+            with metrics.registry.span("calendar_list"):
+                try:
+                    response = (
+                        self._service.events()
+                        .list(
+                            calendarId=self._calendar_id,
+                            timeMin=time_min.isoformat(),
+                            timeMax=time_max.isoformat(),
+                            singleEvents=True,
+                            privateExtendedProperty=f"{SYNC_PROPERTY_KEY}={SYNC_PROPERTY_VALUE}",
+                            maxResults=2500,
+                            pageToken=page_token,
+                            fields="items(id,summary,start,end),nextPageToken",
+                        )
+                        .execute(http=self._get_http())
+                    )
+                except Exception as e:
+                    _count_api_error(e)
+                    raise
+            for item in response.get("items", list()):
+                existing[item["id"]] = item
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                break
+
+        return existing
+
+    def _execute_batches(
+        self, requests: list, batch_size: int = BATCH_SIZE_LIMIT
+    ) -> list[tuple[Optional[dict], Optional[Exception]]]:
+        """リクエストをbatch_size件ずつのバッチリクエストで送信するメソッド
+        Args:
+            requests (list[googleapiclient.http.HttpRequest]): 送信するリクエスト
+            batch_size (int): 1回のバッチリクエストに含めるリクエストの数(最大BATCH_SIZE_LIMIT)
+        Returns:
+            list[tuple[dict | None, Exception | None]]: リクエストと同じ順序の(応答，例外)
+        """
+        responses: list[tuple[Optional[dict], Optional[Exception]]] = [
+            (None, None)
+        ] * len(requests)
+        batch_size = min(batch_size, BATCH_SIZE_LIMIT)
+
+        def callback(request_id, response, exception):
+            responses[int(request_id)] = (response, exception)
+            if exception is not None:
+                _count_api_error(exception)
+
+        for start in range(0, len(requests), batch_size):
+            batch = self._service.new_batch_http_request(callback=callback)
+            for index in range(start, min(start + batch_size, len(requests))):
+                batch.add(requests[index], request_id=str(index))
+            # バッチ内の個々のリクエストの所要時間は分からないため，バッチ単位で計測する
+            with metrics.registry.span("calendar_batch"):
+                try:
+                    batch.execute(http=self._get_http())
+                except Exception as e:
+                    _count_api_error(e)
+                    raise
+
+        return responses
+
+    def _to_event(self, shift: Shift) -> dict:
+        """シフトデータをGoogleカレンダーの予定の形式に変換するメソッド
+        Args:
+            shift (Shift): シフトデータ
+        Returns:
+            dict: Googleカレンダーの予定
+        """
+        shift_dict = shift.to_dict()
+        event = {
+            "summary": shift_dict["summary"],
+            "start": {
+                "dateTime": shift_dict["start_datetime"],
+                "timeZone": shift_dict["timezone"],
+            },
+            "end": {
+                "dateTime": shift_dict["end_datetime"],
+                "timeZone": shift_dict["timezone"],
+            },
+        }
+
+        return event
+
+
+def _is_same_event(existing: dict, event: dict) -> bool:
+    """Googleカレンダー上の予定と追加しようとしている予定が同じ内容かを判定する関数
+    Args:
+        existing (dict): Googleカレンダー上の予定
+        event (dict): 追加しようとしている予定
+    Returns:
+        bool: 同じ内容であればTrue
+    Examples:
+        >>> existing = {"summary": "バイト", "start": {"dateTime": "2025-04-02T17:00:00+09:00"}, "end": {"dateTime": "2025-04-02T21:30:00+09:00"}}
+        >>> event = {"summary": "バイト", "start": {"dateTime": "2025-04-02T17:00:00+09:00:00"}, "end": {"dateTime": "2025-04-02T21:30:00+09:00:00"}}
+        >>> _is_same_event(existing, event)
+        True
+        >>> _is_same_event(existing, dict(event, summary="休み"))
+        False
+    """
+    if existing.get("summary") != event["summary"]:
+        return False
+    # 時差の表記が異なっても同じ時刻であれば同じとみなす
+    for key in ("start", "end"):
+        date_time = existing.get(key, dict()).get("dateTime")
+        if date_time is None or datetime.fromisoformat(date_time) != datetime.fromisoformat(
+            event[key]["dateTime"]
+        ):
+            return False
+
+    return True
+
+
+def _status_of(exception: Optional[Exception]) -> Optional[int]:
+    """例外からHTTPステータスを取り出す関数
+    Args:
+        exception (Exception | None): バッチリクエストで発生した例外
+    Returns:
+        int | None: HTTPステータス．HttpError以外の場合はNone
+    """
+    resp = getattr(exception, "resp", None)
+
+    return getattr(resp, "status", None)
+
+
+def _is_rate_limited(exception: Exception) -> bool:
+    """例外が流量制限(429，または理由がrateLimitExceededなどの403)によるものかを判定する関数
+    Args:
+        exception (Exception): 発生した例外
+    Returns:
+        bool: 流量制限による場合はTrue
+    Examples:
+        >>> from googleapiclient.errors import HttpError
+        >>> def http_error(status, reason):
+        ...     content = json.dumps({"error": {"code": status, "errors": [{"reason": reason}]}}).encode()
+        ...     return HttpError(httplib2.Response({"status": status}), content)
+        >>> _is_rate_limited(http_error(403, "rateLimitExceeded")), _is_rate_limited(http_error(429, "rateLimitExceeded"))
+        (True, True)
+        >>> _is_rate_limited(http_error(403, "forbidden")), _is_rate_limited(RuntimeError())
+        (False, False)
+    """
+    status = _status_of(exception)
+    if status == 429:
+        return True
+    if status != 403:
+        return False
+    try:
+        errors = json.loads(exception.content)["error"]["errors"]
+    except (AttributeError, TypeError, ValueError, KeyError):
+        return False
+
+    return any(error.get("reason") in RATE_LIMIT_REASONS for error in errors)
+
+
+def _count_api_error(exception: Exception) -> None:
+    """GoogleカレンダーのAPIの失敗をHTTPステータスごとに数える関数
+    Args:
+        exception (Exception): 発生した例外
+    Returns:
+        None
+    """
+    status = _status_of(exception)
+    metrics.registry.inc(
+        metrics.API_ERRORS,
+        api="calendar",
+        status=str(status) if status is not None else type(exception).__name__,
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,201 @@
+"""Vision APIやGoogleカレンダーのクライアントをプロセス内で共有するモジュール"""
+
+import dataclasses
+import threading
+import time
+from typing import Any, Callable, Optional
+
+
+@dataclasses.dataclass
+class _Entry:
+    """登録されたクライアントの状態を記録するクラス
+    Attributes:
+        factory (Callable[[], Any]): クライアントを作成する関数
+        health_check (Callable[[Any], bool] | None): クライアントが利用可能かを判定する関数
+        client (Any): 作成済みのクライアント．未作成の場合はNone
+        created_at (float): クライアントを作成した時刻(time.monotonic)
+        failures (int): 連続して報告された失敗の回数
+        lock (:obj:`threading.Lock`): クライアントの作成を直列化するロック
+    """
+    factory: Callable[[], Any]
+    health_check: Optional[Callable[[Any], bool]] = None
+    client: Any = None
+    created_at: float = 0.0
+    failures: int = 0
+    lock: threading.Lock = dataclasses.field(default_factory=threading.Lock)
+
+
+class ClientRegistry:
+    """クライアントを初回利用時に1度だけ作成し，プロセス内で共有するクラス
+    Attributes:
+        _entries (dict[str, _Entry]): クライアント名と状態の対応表
+        _max_age (float | None): クライアントを作り直すまでの秒数．Noneの場合は作り直さない
+        _max_failures (int): クライアントを作り直す連続失敗回数
+        _lock (:obj:`threading.Lock`): _entriesを保護するロック
+    """
+
+    def __init__(self, max_age: Optional[float] = 3600.0, max_failures: int = 3):
+        self._entries: dict[str, _Entry] = dict()
+        self._max_age = max_age
+        self._max_failures = max_failures
+        self._lock = threading.Lock()
+
+    def register(
+        self,
+        name: str,
+        factory: Callable[[], Any],
+        health_check: Optional[Callable[[Any], bool]] = None,
+    ) -> None:
+        """クライアントの作成方法を登録するメソッド．クライアントはまだ作成しない
+        Args:
+            name (str): クライアント名
+            factory (Callable[[], Any]): クライアントを作成する関数
+            health_check (Callable[[Any], bool] | None): クライアントが利用可能かを判定する関数
+        Returns:
+            None
+        """
+        with self._lock:
+            self._entries[name] = _Entry(factory=factory, health_check=health_check)
+
+    def get(self, name: str) -> Any:
+        """クライアントを取得するメソッド．未作成または不健全な場合は作成する
+        Args:
+            name (str): クライアント名
+        Returns:
+            Any: クライアント
+        Examples:
+            >>> created = []
+            >>> def factory():
+            ...     created.append(object())
+            ...     return created[-1]
+            >>> test_registry = ClientRegistry(max_failures=2)
+            >>> test_registry.register("vision", factory)
+            >>> len(created)  # 登録時には作成しない
+            0
+            >>> client = test_registry.get("vision")
+            >>> test_registry.get("vision") is client  # 2回目以降は同じものを返す
+            True
+            >>> len(created)
+            1
+            >>>
+            >>> # 連続して失敗が報告されたら作り直す
+            >>> test_registry.report_failure("vision")
+            >>> test_registry.get("vision") is client
+            True
+            >>> test_registry.report_failure("vision")
+            >>> test_registry.get("vision") is client
+            False
+            >>> len(created)
+            2
+            >>>
+            >>> # health_checkがFalseを返した場合も作り直す
+            >>> test_registry.register("calendar", factory, health_check=lambda c: False)
+            >>> test_registry.get("calendar") is test_registry.get("calendar")
+            False
+        """
+        with self._lock:
+            entry = self._entries[name]
+        with entry.lock:
+            if entry.client is None or not self._is_healthy(entry):
+                entry.client = entry.factory()
+                entry.created_at = time.monotonic()
+                entry.failures = 0
+
+            return entry.client
+
+    def report_success(self, name: str) -> None:
+        """クライアントでの処理が成功したことを記録するメソッド
+        Args:
+            name (str): クライアント名
+        Returns:
+            None
+        """
+        with self._lock:
+            entry = self._entries[name]
+        with entry.lock:
+            entry.failures = 0
+
+    def report_failure(self, name: str) -> None:
+        """クライアントでの処理が失敗したことを記録するメソッド
+        Args:
+            name (str): クライアント名
+        Returns:
+            None
+        Notes:
+            doctestはgetを参照
+        """
+        with self._lock:
+            entry = self._entries[name]
+        with entry.lock:
+            entry.failures += 1
+
+    def invalidate(self, name: Optional[str] = None) -> None:
+        """クライアントを破棄し，次回の取得時に作り直させるメソッド
+        Args:
+            name (str | None): クライアント名．Noneの場合は全てのクライアント
+        Returns:
+            None
+        Examples:
+            >>> test_registry = ClientRegistry()
+            >>> test_registry.register("vision", object)
+            >>> client = test_registry.get("vision")
+            >>> test_registry.invalidate()
+            >>> test_registry.get("vision") is client
+            False
+        """
+        with self._lock:
+            entries = list(self._entries.values()) if name is None else [self._entries[name]]
+        for entry in entries:
+            with entry.lock:
+                entry.client = None
+
+    def _is_healthy(self, entry: _Entry) -> bool:
+        """作成済みのクライアントを使い続けてよいかを判定するメソッド
+        Args:
+            entry (_Entry): 判定するクライアントの状態
+        Returns:
+            bool: 使い続けてよい場合はTrue
+        Notes:
+            呼び出し側でentry.lockを取得していること
+        """
+        if entry.failures >= self._max_failures:
+            return False
+        if self._max_age is not None and time.monotonic() - entry.created_at > self._max_age:
+            return False
+        if entry.health_check is not None and not entry.health_check(entry.client):
+            return False
+
+        return True
+
+
+def _create_default_registry() -> ClientRegistry:
+    """Vision APIとGoogleカレンダーのクライアントを登録したレジストリを作成する関数
+    Returns:
+        ClientRegistry: レジストリ
+    """
+    # クライアントのモジュールは初回作成時に読み込む
+    def vision_factory():
+        from src.image_processor.vision_client import VisionClient
+
+        return VisionClient()
+
+    def calendar_factory():
+        from src.calendar_client import CalendarClient
+
+        return CalendarClient()
+
+    registry = ClientRegistry()
+    registry.register("vision", vision_factory)
+    registry.register("calendar", calendar_factory)
+
+    return registry
+
+
+# プロセス内で共有するレジストリ
+registry = _create_default_registry()
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
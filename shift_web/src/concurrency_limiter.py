@@ -0,0 +1,112 @@
+"""外部APIへ同時に送るリクエストの数を，流量制限の応答に合わせて調整するモジュール"""
+
+import random
+import threading
+from typing import Optional
+
+
+class AimdLimiter:
+    """同時に実行する数の上限をAIMD(成功したら少しずつ増やし，流量制限を受けたら半分にする)で調整するクラス
+    Attributes:
+        limit (float): 現在の上限(実際に同時に実行できる数は整数部分)
+        min_limit (int): 上限の最小値
+        max_limit (int): 上限の最大値
+        increase (float): 上限と同じ数のリクエストが成功するごとに増やす量
+        decrease (float): 流量制限を受けたときに上限に掛ける割合
+        in_flight (int): 実行中の数
+        _epoch (int): 上限を下げた回数
+        _condition (:obj:`threading.Condition`): 上限と実行中の数を保護する条件変数
+    Notes:
+        上限を下げる前に送ったリクエストが後から流量制限を受けても，上限は重ねて下げない
+        (同時に送った多数のリクエストが一斉に失敗しても，1回分だけ下げる)
+    Examples:
+        >>> limiter = AimdLimiter(max_limit=8)
+        >>> epochs = [limiter.acquire() for _ in range(8)]
+        >>> limiter.in_flight
+        8
+        >>> # 同時に送った8件が全て流量制限を受けても，上限は1回だけ半分になる
+        >>> for epoch in epochs:
+        ...     limiter.release(epoch, throttled=True)
+        >>> limiter.limit
+        4.0
+        >>> # 上限と同じ数だけ成功すると上限がおよそ1増える
+        >>> for _ in range(4):
+        ...     limiter.release(limiter.acquire())
+        >>> round(limiter.limit, 1)
+        4.9
+    """
+
+    def __init__(
+        self,
+        max_limit: int,
+        initial: Optional[float] = None,
+        min_limit: int = 1,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+    ):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = float(initial if initial is not None else max_limit)
+        self.increase = increase
+        self.decrease = decrease
+        self.in_flight = 0
+        self._epoch = 0
+        self._condition = threading.Condition()
+
+    def acquire(self) -> int:
+        """実行できるようになるまで待ち，実行中の数を1増やすメソッド
+        Returns:
+            int: 取得した時点で上限を下げた回数(releaseに渡す)
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+            return self._epoch
+
+    def release(self, epoch: int, throttled: bool = False) -> None:
+        """実行中の数を1減らし，結果に応じて上限を調整するメソッド
+        Args:
+            epoch (int): acquireが返した値
+            throttled (bool): 流量制限を受けたかどうか
+        Returns:
+            None
+        """
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                if epoch == self._epoch:
+                    self.limit = max(float(self.min_limit), self.limit * self.decrease)
+                    self._epoch += 1
+            else:
+                self.limit = min(
+                    float(self.max_limit), self.limit + self.increase / max(1.0, self.limit)
+                )
+            self._condition.notify_all()
+
+
+def backoff_delay(
+    attempt: int, base: float, cap: float, rng: Optional[random.Random] = None
+) -> float:
+    """再試行までの待機時間をジッター付きの指数バックオフで求める関数
+    Args:
+        attempt (int): 何回目の再試行か(0始まり)
+        base (float): 1回目の待機時間の最大値(秒)
+        cap (float): 待機時間の最大値(秒)
+        rng (random.Random | None): 乱数生成器．Noneの場合はrandomモジュールを使う
+    Returns:
+        float: 0からmin(cap, base * 2 ** attempt)までの一様乱数
+    Notes:
+        待機時間をばらつかせ，同時に失敗したリクエストが同時に再試行しないようにする
+    Examples:
+        >>> rng = random.Random(0)
+        >>> [round(backoff_delay(attempt, base=0.5, cap=4.0, rng=rng), 3) for attempt in range(5)]
+        [0.422, 0.758, 0.841, 1.036, 2.045]
+    """
+    return (rng or random).uniform(0.0, min(cap, base * 2**attempt))
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
@@ -0,0 +1,46 @@
+"""環境変数の設定ファイル(src/.env)を読み込むモジュール"""
+
+import functools
+import os
+
+# 設定ファイルへのパス(実行時のディレクトリによらずこのモジュールと同じディレクトリ)
+ENV_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env")
+
+
+@functools.cache
+def load_env(path: str = ENV_PATH) -> bool:
+    """設定ファイルの内容を環境変数に読み込む関数．同じファイルはプロセス内で1度だけ読み込む
+    Args:
+        path (str): 設定ファイルへのパス
+    Returns:
+        bool: 読み込んだ場合はTrue．ファイルがない場合はFalse
+    Notes:
+        - 既に設定されている環境変数は上書きしない
+        - 環境変数をモジュールの読み込み時に参照するモジュールより先に呼ぶこと
+          (manage.py・Djangoの設定・src/main.pyの先頭で呼ぶ)
+    Examples:
+        >>> import tempfile
+        >>> env_path = os.path.join(tempfile.mkdtemp(), ".env")
+        >>> load_env(env_path)
+        False
+        >>> with open(env_path, "w") as f:
+        ...     _ = f.write("SHIFT_CONFIG_EXAMPLE=1\\n")
+        >>> # 1度読み込んだパスは読み直さない
+        >>> load_env(env_path), load_env.cache_info().hits
+        (False, 1)
+        >>> load_env.cache_clear()
+        >>> load_env(env_path), os.environ["SHIFT_CONFIG_EXAMPLE"]
+        (True, '1')
+    """
+    if not os.path.exists(path):
+        return False
+    # python-dotenvは設定ファイルがある場合のみ読み込む
+    from dotenv import load_dotenv
+
+    return load_dotenv(path)
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
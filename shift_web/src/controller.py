@@ -1,31 +1,106 @@
 """アプリケーションを管理するモジュール"""
 
+import asyncio
+import contextlib
+import contextvars
 import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 
 from src.image_processor.image_processor import ImageProcessor
-from src.calendar_client import CalendarClient
+from src.image_processor.image_source import ImageSource
+from src.image_processor.image_validator import ImageRejectedError
+from src.client_registry import ClientRegistry, registry as default_registry
+from src.dataclass.event_result import EventResult
 from src.dataclass.shift import Shift
+from src import metrics
+
+# 非同期の処理でGoogleカレンダーへの書き込みを同時に実行する数の上限
+CALENDAR_WORKERS = int(os.getenv("ASYNC_CALENDAR_WORKERS", 8))
+# Googleカレンダーへの書き込み方法(Controller._calendar_modeを参照)
+CALENDAR_MODES = ("sync", "batch", "insert")
+
+
+class CalendarWriteError(RuntimeError):
+    """Googleカレンダーへの書き込みに失敗したシフトがある場合の例外
+    Attributes:
+        shifts (list[Shift]): 追加に成功したシフトデータ
+        failed (list[EventResult]): 追加・更新に失敗したシフトの結果
+        errors (list[str]): 予定の削除に失敗した場合のエラーメッセージ
+    Notes:
+        メッセージには成功・失敗の件数と失敗したシフトを含め，ジョブのエラーとして結果ページに表示する
+    """
+
+    def __init__(self, shifts: list[Shift], failed: list[EventResult], errors: Optional[list[str]] = None):
+        self.shifts = shifts
+        self.failed = failed
+        self.errors = errors or list()
+        lines = [
+            f"Googleカレンダーへの書き込みに失敗しました"
+            f"(成功: {len(shifts)}件, 失敗: {len(failed) + len(self.errors)}件)。"
+        ]
+        lines += [f"{result.shift.start_datetime}: {result.error}" for result in failed]
+        lines += [f"削除: {error}" for error in self.errors]
+        super().__init__("\n".join(lines))
 
 
 class Controller:
     """アプリケーションの管理を行うクラス
     Attributes:
+        _registry(:obj:`ClientRegistry`): プロセス内で共有するクライアントを管理するオブジェクト
         _image_processor(:obj:`ImageProcessor`): 画像処理とシフトデータの作成を行うオブジェクト
         _calender_client(:obj:`CalenderClient`): シフトデータをGoogleカレンダーに追加するオブジェクト
+        _calendar_mode (str): Googleカレンダーへの書き込み方法
+            - "sync": 既存の予定との差分のみを追加・更新・削除する(既定)
+            - "batch": 全てのシフトをバッチリクエストで追加する
+            - "insert": 全てのシフトを1件ずつのリクエストで並行して追加する(バッチリクエストを使えない環境向け)
         result_dir (str): 画像や抽出結果ファイルを格納するディレクトリへのパス
+        image (ImageSource | None): 処理する画像のパスか内容．Noneの場合はresult_dir/shift.jpg
+    Raises:
+        ValueError: calendar_mode(環境変数CALENDAR_WRITE_MODE)がCALENDAR_MODESのいずれでもない場合
+    Examples:
+        >>> Controller("result/dummy", registry=ClientRegistry(), calendar_mode="snyc")
+        Traceback (most recent call last):
+            ...
+        ValueError: Googleカレンダーへの書き込み方法が不正です: snyc
     """
 
-    def __init__(self, result_dir: str):
-        self._image_processor = ImageProcessor()
-        self._calendar_client = CalendarClient()
+    def __init__(
+        self,
+        result_dir: str,
+        registry: Optional[ClientRegistry] = None,
+        calendar_mode: Optional[str] = None,
+        image: Optional[ImageSource] = None,
+    ):
+        # 書き込み方法の誤りで重複した予定を追加しないよう，クライアントを作成する前に確かめる
+        self._calendar_mode = calendar_mode or os.getenv("CALENDAR_WRITE_MODE", "sync")
+        if self._calendar_mode not in CALENDAR_MODES:
+            raise ValueError(f"Googleカレンダーへの書き込み方法が不正です: {self._calendar_mode}")
+        # Vision APIとGoogleカレンダーのクライアントは作成済みのものを共有する
+        self._registry = registry if registry is not None else default_registry
+        self._image_processor = ImageProcessor(
+            vision_client=self._registry.get("vision")
+        )
+        self._calendar_client = self._registry.get("calendar")
         self.result_dir = result_dir
+        self.image = image
 
     def run(self) -> list[Shift]:
         """アプリケーションを起動するメソッド
         Args:
             None
         Returns:
-            list[Shift]: シフトデータ
+            list[Shift]: Googleカレンダーへの追加に成功したシフトデータ
+        Notes:
+            doctest対象外
+        """
+        with metrics.registry.span("run"):
+            return self._run()
+
+    def _run(self) -> list[Shift]:
+        """runの本体．各段階の所要時間はmetricsに記録する
         Notes:
             doctest対象外
         """
@@ -35,14 +110,174 @@ class Controller:
 
         # シフトデータを作成
         logger.debug("シフトデータの作成を開始しました。")
-        shifts = self._image_processor.process_image(result_dir=self.result_dir)
+        with self._report_to_registry("vision"):
+            shifts = self._image_processor.process_image(
+                result_dir=self.result_dir, image=self.image
+            )
         logger.debug("シフトデータの作成が完了しました。")
 
-        # シフトデータを予定としてGoogleカレンダーに追加
-        logger.debug("Googleカレンダーへの予定の追加を開始しました。")
-        self._calendar_client.create_events(shifts=shifts)
-        logger.debug("Googleカレンダーへの予定の追加が完了しました。")
+        return self._write_calendar(shifts)
 
-        logger.debug("バックグラウンド処理が完了しました。")
+    async def run_async(self) -> list[Shift]:
+        """runの非同期版．Vision APIの応答はイベントループ上で待ち，
+        Googleカレンダーへの書き込みは上限付きのスレッドプールで実行する
+        Args:
+            None
+        Returns:
+            list[Shift]: Googleカレンダーへの追加に成功したシフトデータ
+        Notes:
+            doctest対象外(benchmarks/bench_async.pyで動作を確かめる)
+        """
+        logger = logging.getLogger("__main__").getChild("controller")
+        with metrics.registry.span("run"):
+            logger.debug("バックグラウンド処理(非同期)を開始しました。")
+            with self._report_to_registry("vision"):
+                shifts = await self._image_processor.process_image_async(
+                    result_dir=self.result_dir, image=self.image
+                )
+            logger.debug("シフトデータの作成が完了しました。")
+
+            # ジョブIDなどのコンテキストを引き継いでスレッドプールで実行する
+            context = contextvars.copy_context()
+            return await asyncio.get_running_loop().run_in_executor(
+                get_calendar_executor(), context.run, self._write_calendar, shifts
+            )
+
+    def _write_calendar(self, shifts: list[Shift]) -> list[Shift]:
+        """シフトデータを予定としてGoogleカレンダーに追加するメソッド
+        Args:
+            shifts (list[Shift]): シフトデータ
+        Returns:
+            list[Shift]: Googleカレンダーへの追加に成功したシフトデータ
+        Raises:
+            CalendarWriteError: 書き込みに失敗したシフトがある場合(クライアントの失敗として記録する)
+        """
+        with self._report_to_registry("calendar"):
+            shifts = write_calendar(self._calendar_client, shifts, self._calendar_mode)
+        logging.getLogger("__main__").getChild("controller").debug("バックグラウンド処理が完了しました。")
 
         return shifts
+
+    @contextlib.contextmanager
+    def _report_to_registry(self, name: str):
+        """処理の成否を共有クライアントの状態としてレジストリに記録するコンテキストマネージャ
+        Args:
+            name (str): クライアント名
+        Notes:
+            失敗が続いたクライアントは次回の取得時に作り直される
+        """
+        try:
+            yield
+        except ImageRejectedError:
+            # 画像の内容による不合格はクライアントの不調ではないため記録しない
+            raise
+        except Exception:
+            self._registry.report_failure(name)
+            raise
+        self._registry.report_success(name)
+
+
+def write_calendar(calendar_client, shifts: list[Shift], mode: str) -> list[Shift]:
+    """シフトデータを予定としてGoogleカレンダーに追加する関数
+    Args:
+        calendar_client (CalendarClient): Googleカレンダーのクライアント
+        shifts (list[Shift]): シフトデータ
+        mode (str): 書き込み方法("sync"・"batch"・"insert"．Controller._calendar_modeを参照)
+    Returns:
+        list[Shift]: Googleカレンダーへの追加に成功したシフトデータ(全てのシフトデータ)
+    Raises:
+        ValueError: modeがCALENDAR_MODESのいずれでもない場合
+        CalendarWriteError: 書き込みに失敗したシフトがある場合．成功したシフトデータは例外のshiftsに入る
+    Notes:
+        Controllerのほか，複数の画像をまとめて処理する場合(src/bulk.py)にも使う
+    Examples:
+        >>> from unittest.mock import patch
+        >>> from google.auth.credentials import AnonymousCredentials
+        >>> from src.calendar_client import CalendarClient
+        >>> from src.testing.fake_calendar import FakeCalendarHttp
+        >>> shifts = [Shift(summary="バイト", start_datetime=f"2025-04-0{day}T17:00:00+09:00:00", end_datetime=f"2025-04-0{day}T21:30:00+09:00:00", timezone="Asia/Tokyo") for day in (1, 2)]
+        >>> def make_client(fake_http):
+        ...     with patch.dict("os.environ", {"GOOGLE_CALENDAR_ID": "dummy@outlook.jp"}):
+        ...         return CalendarClient(http_factory=lambda: fake_http, credentials=AnonymousCredentials())
+        >>> len(write_calendar(make_client(FakeCalendarHttp()), shifts, "batch"))
+        2
+        >>> # 失敗したシフトがある場合は，件数とともに例外で知らせる
+        >>> failing_client = make_client(FakeCalendarHttp(fail_when=lambda event: 400 if event["start"]["dateTime"].startswith("2025-04-02") else None))
+        >>> for mode in ("sync", "batch"):
+        ...     try:
+        ...         write_calendar(failing_client, shifts, mode)
+        ...     except CalendarWriteError as e:
+        ...         print(mode, len(e.shifts), len(e.failed), str(e).splitlines()[0])
+        sync 1 1 Googleカレンダーへの書き込みに失敗しました(成功: 1件, 失敗: 1件)。
+        batch 1 1 Googleカレンダーへの書き込みに失敗しました(成功: 1件, 失敗: 1件)。
+    """
+    if mode not in CALENDAR_MODES:
+        raise ValueError(f"Googleカレンダーへの書き込み方法が不正です: {mode}")
+    logger = logging.getLogger("__main__").getChild("controller")
+    # シフトデータを予定としてGoogleカレンダーに追加
+    logger.debug("Googleカレンダーへの予定の追加を開始しました。")
+    with metrics.registry.span("calendar_write"):
+        if mode == "sync":
+            sync_result = calendar_client.sync_events(shifts=shifts)
+            results = sync_result.results
+            logger.debug(
+                "追加: %d件, 更新: %d件, 削除: %d件, 変更なし: %d件",
+                len(sync_result.inserted),
+                len(sync_result.patched),
+                len(sync_result.deleted),
+                len(sync_result.unchanged),
+            )
+            for error in sync_result.errors:
+                logger.warning("予定の削除に失敗しました。%s", error)
+        elif mode == "insert":
+            results = calendar_client.create_events(shifts=shifts)
+        else:  # "batch"
+            results = calendar_client.create_events_batch(shifts=shifts)
+    errors = sync_result.errors if mode == "sync" else list()
+    for result in results:
+        metrics.registry.inc(
+            metrics.CALENDAR_EVENTS,
+            result="succeeded" if result.succeeded else "failed",
+        )
+        if not result.succeeded:
+            logger.warning(
+                "予定の追加に失敗しました。(%s): %s",
+                result.shift.start_datetime,
+                result.error,
+            )
+    logger.debug("Googleカレンダーへの予定の追加が完了しました。")
+
+    shifts = [result.shift for result in results if result.succeeded]
+    failed = [result for result in results if not result.succeeded]
+    # 一部でも失敗した場合は，ジョブを成功として扱わない
+    if failed or errors:
+        raise CalendarWriteError(shifts, failed, errors)
+
+    return shifts
+
+
+_calendar_executor: Optional[ThreadPoolExecutor] = None
+_calendar_executor_lock = threading.Lock()
+
+
+def get_calendar_executor() -> ThreadPoolExecutor:
+    """非同期の処理からGoogleカレンダーへの書き込みを実行する，プロセス内で共有するスレッドプールを取得する関数
+    Returns:
+        ThreadPoolExecutor: 同時に実行する数がCALENDAR_WORKERS(環境変数ASYNC_CALENDAR_WORKERS)のスレッドプール
+    Notes:
+        CalendarClientはスレッドごとにHTTP接続を持つため，同じクライアントを複数のスレッドから使える
+    """
+    global _calendar_executor
+    with _calendar_executor_lock:
+        if _calendar_executor is None:
+            _calendar_executor = ThreadPoolExecutor(
+                max_workers=CALENDAR_WORKERS, thread_name_prefix="shift-calendar"
+            )
+
+        return _calendar_executor
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
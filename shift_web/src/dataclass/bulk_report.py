@@ -0,0 +1,79 @@
+"""複数の画像をまとめて処理した結果を管理するモジュール
+"""
+
+import dataclasses
+
+
+@dataclasses.dataclass
+class BulkReport:
+    """複数の画像をまとめて処理した結果と処理速度を記録するクラス
+    Attributes:
+        total (int): 対象の画像の数
+        skipped (int): マニフェストに処理済みと記録されていたため飛ばした画像の数
+        succeeded (int): シフトデータを作成できた画像の数
+        rejected (int): シフト表として読み取れないため不合格とした画像の数
+        failed (int): 処理に失敗した画像の数
+        shifts (int): 作成したシフトデータの数
+        events (int): Googleカレンダーに追加した予定の数
+        elapsed (float): 全体の所要時間(秒)
+        prepare_seconds (float): 画像の判定・前処理にかかった時間の合計(秒)
+        ocr_seconds (float): Vision APIでの文字の抽出にかかった時間の合計(秒)
+        parse_seconds (float): シフトデータへの変換にかかった時間の合計(秒)
+        calendar_seconds (float): Googleカレンダーへの書き込みにかかった時間の合計(秒)
+        ocr_concurrency (int): 文字の抽出を同時に行う数の上限
+        processes (int): 画像の判定・前処理とシフトデータへの変換を行うプロセスの数
+    """
+    total: int = 0
+    skipped: int = 0
+    succeeded: int = 0
+    rejected: int = 0
+    failed: int = 0
+    shifts: int = 0
+    events: int = 0
+    elapsed: float = 0.0
+    prepare_seconds: float = 0.0
+    ocr_seconds: float = 0.0
+    parse_seconds: float = 0.0
+    calendar_seconds: float = 0.0
+    ocr_concurrency: int = 0
+    processes: int = 0
+
+    @property
+    def processed(self) -> int:
+        """今回処理した(飛ばさなかった)画像の数を返すプロパティ"""
+        return self.succeeded + self.rejected + self.failed
+
+    @property
+    def images_per_second(self) -> float:
+        """1秒あたりに処理した画像の数を返すプロパティ"""
+        return self.processed / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def shifts_per_second(self) -> float:
+        """1秒あたりに作成したシフトデータの数を返すプロパティ"""
+        return self.shifts / self.elapsed if self.elapsed else 0.0
+
+    def to_dict(self) -> dict:
+        """処理結果を辞書型に変換するメソッド(処理速度を含む)
+        Args:
+            None
+        Returns:
+            dict: 辞書型の処理結果
+        Examples:
+            >>> report = BulkReport(total=12, skipped=2, succeeded=8, rejected=1, failed=1, shifts=160, elapsed=4.0)
+            >>> report_dict = report.to_dict()
+            >>> report_dict["processed"], report_dict["images_per_second"], report_dict["shifts_per_second"]
+            (10, 2.5, 40.0)
+        """
+        report_dict = dataclasses.asdict(self)
+        report_dict["processed"] = self.processed
+        report_dict["images_per_second"] = round(self.images_per_second, 3)
+        report_dict["shifts_per_second"] = round(self.shifts_per_second, 3)
+
+        return report_dict
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
@@ -0,0 +1,40 @@
+"""Googleカレンダーへの予定の登録結果を管理するモジュール
+"""
+
+import dataclasses
+from typing import Optional
+
+from src.dataclass.shift import Shift
+
+
+@dataclasses.dataclass
+class EventResult:
+    """1件のシフトについて，Googleカレンダーへの登録結果を記録するクラス
+    Attributes:
+        shift (Shift): 登録しようとしたシフトデータ
+        event_id (str | None): 登録された予定のID．失敗した場合はNone
+        error (str | None): 失敗した場合のエラーメッセージ
+    """
+    shift: Shift
+    event_id: Optional[str] = None
+    error: Optional[str] = None
+
+    @property
+    def succeeded(self) -> bool:
+        """登録に成功したかを返すプロパティ
+        Returns:
+            bool: 成功した場合はTrue
+        Examples:
+            >>> dummy_shift = Shift(summary="バイト", start_datetime="2025-04-02T17:00:00+09:00:00", end_datetime="2025-04-02T21:30:00+09:00:00", timezone="Asia/Tokyo")
+            >>> EventResult(shift=dummy_shift, event_id="abc").succeeded
+            True
+            >>> EventResult(shift=dummy_shift, error="Rate Limit Exceeded").succeeded
+            False
+        """
+        return self.error is None and self.event_id is not None
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
@@ -0,0 +1,19 @@
+"""成果物の削除結果を管理するモジュール
+"""
+
+import dataclasses
+
+
+@dataclasses.dataclass
+class GcResult:
+    """古い成果物のディレクトリを削除した結果を記録するクラス
+    Attributes:
+        removed (list[str]): 削除した(dry_runの場合は削除する予定の)ディレクトリへのパス
+        freed_bytes (int): 削除した成果物の合計サイズ
+        kept (int): 残したディレクトリの数
+        kept_bytes (int): 残した成果物の合計サイズ
+    """
+    removed: list[str] = dataclasses.field(default_factory=list)
+    freed_bytes: int = 0
+    kept: int = 0
+    kept_bytes: int = 0
@@ -0,0 +1,104 @@
+"""バックグラウンドで実行されるジョブの状態を管理するモジュール
+"""
+
+import dataclasses
+from datetime import datetime
+from typing import Optional
+
+from src.dataclass.shift import Shift
+
+# ジョブの状態
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+
+@dataclasses.dataclass
+class Job:
+    """ジョブの状態を記録するクラス
+    Attributes:
+        job_id (str): ジョブID
+        image_file_path (str): 処理対象の画像へのパス
+        status (str): ジョブの状態(queued, running, succeeded, failed)
+        shifts (list[Shift]): 処理結果のシフトデータ
+        error (str | None): 失敗した場合のエラーメッセージ
+        created_at (datetime): ジョブの登録日時
+        started_at (datetime | None): ジョブの開始日時
+        finished_at (datetime | None): ジョブの終了日時
+    """
+    job_id: str
+    image_file_path: str
+    status: str = JOB_QUEUED
+    shifts: list[Shift] = dataclasses.field(default_factory=list)
+    error: Optional[str] = None
+    created_at: datetime = dataclasses.field(default_factory=datetime.now)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    @property
+    def is_finished(self) -> bool:
+        """ジョブが終了(成功または失敗)しているかを返すプロパティ
+        Returns:
+            bool: 終了していればTrue
+        Examples:
+            >>> Job(job_id="abc", image_file_path="images/shift.jpg").is_finished
+            False
+            >>> Job(job_id="abc", image_file_path="images/shift.jpg", status=JOB_FAILED).is_finished
+            True
+        """
+        return self.status in (JOB_SUCCEEDED, JOB_FAILED)
+
+    def to_dict(self) -> dict:
+        """ジョブ情報を辞書型に変換するメソッド
+        Args:
+            None
+        Returns:
+            dict: 辞書型ジョブデータ
+        Examples:
+            >>> dummy_shift = Shift(summary="バイト", start_datetime="2025-04-02T17:00:00+09:00:00", end_datetime="2025-04-02T21:30:00+09:00:00", timezone="Asia/Tokyo")
+            >>> dummy_job = Job(job_id="abc", image_file_path="images/shift.jpg", status=JOB_SUCCEEDED, shifts=[dummy_shift], created_at=datetime(2025, 4, 1, 12, 0, 0))
+            >>> dummy_job.to_dict()
+            {'job_id': 'abc', 'status': 'succeeded', 'shifts': [{'summary': 'バイト', 'start_datetime': '2025-04-02T17:00:00+09:00:00', 'end_datetime': '2025-04-02T21:30:00+09:00:00', 'timezone': 'Asia/Tokyo'}], 'error': None, 'created_at': '2025-04-01T12:00:00', 'started_at': None, 'finished_at': None}
+        """
+        job_dict = {
+            "job_id": self.job_id,
+            "status": self.status,
+            "shifts": [shift.to_dict() for shift in self.shifts],
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+        return job_dict
+
+    @classmethod
+    def from_dict(cls, job_dict: dict) -> "Job":
+        """辞書型のジョブデータからジョブを作成するメソッド
+        Args:
+            job_dict (dict): to_dictの戻り値にimage_file_pathを加えた辞書
+        Returns:
+            Job: ジョブ
+        Examples:
+            >>> dummy_shift = Shift(summary="バイト", start_datetime="2025-04-02T17:00:00+09:00:00", end_datetime="2025-04-02T21:30:00+09:00:00", timezone="Asia/Tokyo")
+            >>> dummy_job = Job(job_id="abc", image_file_path="images/shift.jpg", status=JOB_SUCCEEDED, shifts=[dummy_shift], finished_at=datetime(2025, 4, 1, 12, 0, 5))
+            >>> Job.from_dict({"image_file_path": dummy_job.image_file_path, **dummy_job.to_dict()}) == dummy_job
+            True
+        """
+        return cls(
+            job_id=job_dict["job_id"],
+            image_file_path=job_dict["image_file_path"],
+            status=job_dict["status"],
+            shifts=[Shift(**shift_dict) for shift_dict in job_dict["shifts"]],
+            error=job_dict["error"],
+            created_at=datetime.fromisoformat(job_dict["created_at"]),
+            started_at=datetime.fromisoformat(job_dict["started_at"]) if job_dict["started_at"] else None,
+            finished_at=datetime.fromisoformat(job_dict["finished_at"]) if job_dict["finished_at"] else None,
+        )
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
@@ -0,0 +1,243 @@
+"""Vision APIで画像から抽出された文字を管理するモジュール
+"""
+
+import dataclasses
+from array import array
+from typing import Iterable, NamedTuple, Optional
+
+
+class OcrSymbol(NamedTuple):
+    """画像から抽出された1文字を記録するクラス
+    Attributes:
+        text (str): 文字
+        vertices (tuple[tuple[int, int], ...]): 文字を囲む四角形の頂点(x座標, y座標)
+    """
+    text: str
+    vertices: tuple[tuple[int, int], ...]
+
+
+@dataclasses.dataclass
+class OcrResult:
+    """画像から抽出された文字の一覧を列ごとに記録するクラス
+    Attributes:
+        texts (list[str]): 抽出された文字(Vision APIが返した順)
+        coords (array[int]): 文字を囲む四角形の頂点の座標を[x0, y0, x1, y1, x2, y2, x3, y3]の順で
+            文字ごとに連結した配列(1文字あたり8要素)
+        breaks (array[int]): 文字の直後の区切りの種類(Vision APIのdetected_break.type．
+            区切りがない場合は0，行末の場合はEOL_SURE_SPACE(3)，HYPHEN(4)，LINE_BREAK(5))
+    Notes:
+        文字ごとにオブジェクトを作らず，座標を1つの配列にまとめることで，
+        ShiftParserがコピーせずにNumPyの配列として扱えるようにする
+    """
+    texts: list[str] = dataclasses.field(default_factory=list)
+    coords: array = dataclasses.field(default_factory=lambda: array("i"))
+    breaks: array = dataclasses.field(default_factory=lambda: array("B"))
+
+    @classmethod
+    def from_symbols(
+        cls, symbols: Iterable[OcrSymbol], breaks: Optional[Iterable[int]] = None
+    ) -> "OcrResult":
+        """文字の一覧から作成するメソッド
+        Args:
+            symbols (Iterable[OcrSymbol]): 抽出された文字
+            breaks (Iterable[int] | None): 文字の直後の区切りの種類．Noneの場合は全て0
+        Returns:
+            OcrResult: 抽出された文字の一覧
+        Examples:
+            >>> ocr_result = OcrResult.from_symbols([OcrSymbol("9", ((35, 23), (52, 23), (52, 49), (35, 49)))])
+            >>> ocr_result.texts, ocr_result.coords.tolist(), ocr_result.breaks.tolist()
+            (['9'], [35, 23, 52, 23, 52, 49, 35, 49], [0])
+        """
+        ocr_result = cls()
+        for symbol in symbols:
+            ocr_result.texts.append(symbol.text)
+            ocr_result.coords.extend(c for vertex in symbol.vertices for c in vertex)
+        if breaks is None:
+            ocr_result.breaks.extend(bytes(len(ocr_result.texts)))
+        else:
+            ocr_result.breaks.extend(breaks)
+
+        return ocr_result
+
+    @property
+    def symbols(self) -> list[OcrSymbol]:
+        """抽出された文字を1文字ずつのOcrSymbolとして返すプロパティ
+        Returns:
+            list[OcrSymbol]: 抽出された文字(Vision APIが返した順)
+        """
+        coords = self.coords
+        return [
+            OcrSymbol(
+                text,
+                tuple(zip(coords[i * 8 : i * 8 + 8 : 2], coords[i * 8 + 1 : i * 8 + 8 : 2])),
+            )
+            for i, text in enumerate(self.texts)
+        ]
+
+    @classmethod
+    def from_response(cls, response) -> "OcrResult":
+        """Vision APIのレスポンスから，辞書型に変換せずに作成するメソッド
+        Args:
+            response (:obj:`google.cloud.vision.AnnotateImageResponse`): Vision APIのレスポンス
+        Returns:
+            OcrResult: 抽出された文字の一覧
+        Notes:
+            to_dictはページから文字までの全ての情報を辞書に変換するため，
+            下層のprotobufのメッセージを1度だけ走査して文字と座標のみを取り出す
+        Examples:
+            >>> from google.cloud import vision
+            >>> response = vision.AnnotateImageResponse({"full_text_annotation": {"pages": [{"blocks": [{"paragraphs": [{"words": [{"symbols": [
+            ...     {"bounding_box": {"vertices": [{"x": 35, "y": 23}, {"x": 52, "y": 23}, {"x": 52, "y": 49}, {"x": 35, "y": 49}]}, "text": "9", "confidence": 0.98},
+            ...     {"bounding_box": {"vertices": [{"y": 23}, {"x": 12, "y": 23}, {"x": 12, "y": 49}, {"y": 49}]}, "text": "/", "property": {"detected_break": {"type_": 5}}},
+            ... ]}]}]}]}]}})
+            >>> ocr_result = OcrResult.from_response(response)
+            >>> ocr_result.symbols
+            [OcrSymbol(text='9', vertices=((35, 23), (52, 23), (52, 49), (35, 49))), OcrSymbol(text='/', vertices=((0, 23), (12, 23), (12, 49), (0, 49)))]
+            >>> ocr_result.breaks.tolist()
+            [0, 5]
+            >>> ocr_result == OcrResult.from_response_dict(vision.AnnotateImageResponse.to_dict(response))
+            True
+            >>> OcrResult.from_response(vision.AnnotateImageResponse()).symbols
+            []
+        """
+        pages = type(response).pb(response).full_text_annotation.pages
+        if not pages:
+            return cls()
+
+        texts = list()
+        coords = array("i")
+        breaks = array("B")
+        for block in pages[0].blocks:
+            for paragraph in block.paragraphs:
+                for word in paragraph.words:
+                    for symbol in word.symbols:
+                        vertices = symbol.bounding_box.vertices
+                        if len(vertices) != 4:
+                            continue
+                        texts.append(symbol.text)
+                        coords.extend(
+                            (
+                                vertices[0].x, vertices[0].y, vertices[1].x, vertices[1].y,
+                                vertices[2].x, vertices[2].y, vertices[3].x, vertices[3].y,
+                            )
+                        )
+                        breaks.append(symbol.property.detected_break.type_)
+
+        return cls(texts=texts, coords=coords, breaks=breaks)
+
+    @classmethod
+    def from_response_dict(cls, response_dict: dict) -> "OcrResult":
+        """辞書型に変換したVision APIのレスポンスから作成するメソッド
+        Args:
+            response_dict (dict): 辞書型のVision APIのレスポンス
+        Returns:
+            OcrResult: 抽出された文字の一覧
+        Examples:
+            >>> response_dict = {"full_text_annotation": {"pages": [{"blocks": [{"paragraphs": [{"words": [{"symbols": [
+            ...     {"bounding_box": {"vertices": [{"x": 35, "y": 23}, {"x": 52, "y": 23}, {"x": 52, "y": 49}, {"x": 35, "y": 49}]}, "text": "9"},
+            ...     {"bounding_box": {"vertices": [{"y": 23}, {"x": 12, "y": 23}, {"x": 12, "y": 49}, {"y": 49}]}, "text": "/"},
+            ... ]}]}]}]}]}}
+            >>> OcrResult.from_response_dict(response_dict).symbols
+            [OcrSymbol(text='9', vertices=((35, 23), (52, 23), (52, 49), (35, 49))), OcrSymbol(text='/', vertices=((0, 23), (12, 23), (12, 49), (0, 49)))]
+        """
+        # 処理に必要な文字と座標のみを取り出す(座標が0の場合は省略されていることがある)
+        page = response_dict["full_text_annotation"]["pages"][0]
+        texts = list()
+        coords = array("i")
+        breaks = array("B")
+        for block in page["blocks"]:
+            for paragraph in block["paragraphs"]:
+                for word in paragraph["words"]:
+                    for symbol in word["symbols"]:
+                        vertices = symbol["bounding_box"]["vertices"]
+                        if len(vertices) != 4:
+                            continue
+                        texts.append(symbol["text"])
+                        for v in vertices:
+                            coords.append(v.get("x", 0))
+                            coords.append(v.get("y", 0))
+                        detected_break = symbol.get("property", dict()).get("detected_break")
+                        breaks.append(detected_break.get("type_", 0) if detected_break else 0)
+
+        return cls(texts=texts, coords=coords, breaks=breaks)
+
+    @classmethod
+    def from_dict(cls, ocr_dict: dict) -> "OcrResult":
+        """to_dictで変換した辞書から作成するメソッド
+        Args:
+            ocr_dict (dict): 辞書型の抽出結果
+        Returns:
+            OcrResult: 抽出された文字の一覧
+        Notes:
+            doctestはto_dictを参照
+        """
+        texts = list()
+        coords = array("i")
+        breaks = array("B")
+        for text, symbol_coords, *symbol_break in ocr_dict["symbols"]:
+            texts.append(text)
+            coords.extend(symbol_coords)
+            breaks.append(symbol_break[0] if symbol_break else 0)
+
+        return cls(texts=texts, coords=coords, breaks=breaks)
+
+    def to_dict(self) -> dict:
+        """抽出結果をJSONに書き出せる辞書型に変換するメソッド
+        Args:
+            None
+        Returns:
+            dict: 辞書型の抽出結果(頂点の座標は[x0, y0, x1, y1, ...]の形式．
+                区切りがある文字のみ3番目の要素に区切りの種類を記録する)
+        Examples:
+            >>> ocr_result = OcrResult.from_symbols([OcrSymbol("9", ((35, 23), (52, 23), (52, 49), (35, 49))), OcrSymbol("/", ((52, 23), (62, 23), (62, 49), (52, 49)))], breaks=[0, 5])
+            >>> ocr_result.to_dict()
+            {'symbols': [['9', [35, 23, 52, 23, 52, 49, 35, 49]], ['/', [52, 23, 62, 23, 62, 49, 52, 49], 5]]}
+            >>> OcrResult.from_dict(ocr_result.to_dict()) == ocr_result
+            True
+        """
+        coords = self.coords.tolist()
+        breaks = self.breaks
+        ocr_dict = {
+            "symbols": [
+                [text, coords[i * 8 : i * 8 + 8], breaks[i]]
+                if breaks[i]
+                else [text, coords[i * 8 : i * 8 + 8]]
+                for i, text in enumerate(self.texts)
+            ]
+        }
+
+        return ocr_dict
+
+    def scaled(
+        self, scale_x: float, scale_y: float, offset_x: int = 0, offset_y: int = 0
+    ) -> "OcrResult":
+        """頂点の座標を拡大・縮小し，平行移動した抽出結果を返すメソッド
+        Args:
+            scale_x (float): x座標に掛ける倍率
+            scale_y (float): y座標に掛ける倍率
+            offset_x (int): 倍率を掛けた後にx座標に足す値
+            offset_y (int): 倍率を掛けた後にy座標に足す値
+        Returns:
+            OcrResult: 座標を四捨五入して整数にした抽出結果(文字と区切りは共有する)
+        Notes:
+            縮小・切り抜きした画像から抽出した座標を，元の画像の座標に戻すために使う
+        Examples:
+            >>> ocr_result = OcrResult.from_symbols([OcrSymbol("9", ((35, 23), (52, 23), (52, 49), (35, 49)))])
+            >>> ocr_result.scaled(2.0, 1.5).coords.tolist()
+            [70, 34, 104, 34, 104, 74, 70, 74]
+            >>> ocr_result.scaled(1.0, 1.0, offset_x=100, offset_y=10).coords.tolist()
+            [135, 33, 152, 33, 152, 59, 135, 59]
+        """
+        coords = self.coords
+        scaled = array("i", coords)
+        # x座標は偶数番目，y座標は奇数番目
+        scaled[0::2] = array("i", [round(c * scale_x) + offset_x for c in coords[0::2]])
+        scaled[1::2] = array("i", [round(c * scale_y) + offset_y for c in coords[1::2]])
+
+        return OcrResult(texts=self.texts, coords=scaled, breaks=self.breaks)
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
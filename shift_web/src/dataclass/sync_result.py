@@ -0,0 +1,58 @@
+"""Googleカレンダーとの同期結果を管理するモジュール
+"""
+
+import dataclasses
+
+from src.dataclass.event_result import EventResult
+from src.dataclass.shift import Shift
+
+
+@dataclasses.dataclass
+class SyncResult:
+    """シフトデータとGoogleカレンダーの同期結果を記録するクラス
+    Attributes:
+        inserted (list[EventResult]): 追加した予定の結果
+        patched (list[EventResult]): 内容を更新した予定の結果
+        unchanged (list[EventResult]): 変更がなかった予定
+        deleted (list[str]): シフト表から消えたため削除した予定のID
+        errors (list[str]): 予定の削除に失敗した場合のエラーメッセージ
+    """
+    inserted: list[EventResult] = dataclasses.field(default_factory=list)
+    patched: list[EventResult] = dataclasses.field(default_factory=list)
+    unchanged: list[EventResult] = dataclasses.field(default_factory=list)
+    deleted: list[str] = dataclasses.field(default_factory=list)
+    errors: list[str] = dataclasses.field(default_factory=list)
+
+    @property
+    def results(self) -> list[EventResult]:
+        """シフトデータごとの結果を返すプロパティ
+        Returns:
+            list[EventResult]: 追加・更新・変更なしの結果
+        """
+        return self.inserted + self.patched + self.unchanged
+
+    @property
+    def shifts(self) -> list[Shift]:
+        """同期後にGoogleカレンダー上に存在するシフトデータを返すプロパティ
+        Returns:
+            list[Shift]: 開始日時順のシフトデータ
+        Examples:
+            >>> early = Shift(summary="バイト", start_datetime="2025-04-02T17:00:00+09:00:00", end_datetime="2025-04-02T21:30:00+09:00:00", timezone="Asia/Tokyo")
+            >>> late = Shift(summary="バイト", start_datetime="2025-04-04T17:00:00+09:00:00", end_datetime="2025-04-04T21:00:00+09:00:00", timezone="Asia/Tokyo")
+            >>> failed = Shift(summary="バイト", start_datetime="2025-04-05T17:00:00+09:00:00", end_datetime="2025-04-05T21:00:00+09:00:00", timezone="Asia/Tokyo")
+            >>> sync_result = SyncResult(
+            ...     inserted=[EventResult(shift=late, event_id="b"), EventResult(shift=failed, error="Rate Limit Exceeded")],
+            ...     unchanged=[EventResult(shift=early, event_id="a")],
+            ... )
+            >>> [shift.start_datetime[:10] for shift in sync_result.shifts]
+            ['2025-04-02', '2025-04-04']
+        """
+        shifts = [result.shift for result in self.results if result.succeeded]
+
+        return sorted(shifts, key=lambda shift: shift.start_datetime)
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
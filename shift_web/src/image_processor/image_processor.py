@@ -1,29 +1,55 @@
 """画像処理とシフトデータの作成を行うモジュール"""
 
+import asyncio
+import hashlib
+from typing import Optional
+
+from src.image_processor.image_source import ImageSource, read_image
+from src.image_processor.image_validator import ImageRejectedError, ImageValidator
+from src.image_processor.preprocess import ImagePreprocessor
 from src.image_processor.vision_client import VisionClient
 from src.image_processor.shift_parser import ShiftParser
+from src.dataclass.ocr_result import OcrResult
 from src.dataclass.shift import Shift
-
-from unittest.mock import MagicMock, patch
+from src import metrics
 
 
 class ImageProcessor:
     """画像処理とシフトデータの作成を行うクラス
     Attributes:
-        _vision_client (:obj:`VisionClient`): Vision APIにおける処理を行うオブジェクト
+        _vision_client (:obj:`VisionClient` | None): Vision APIにおける処理を行うオブジェクト．作成していない場合はNone
         _shift_parser (:obj:`ShiftParser`): 画像から抽出されたデータをシフトデータに変換するオブジェクト
+        _preprocessor (:obj:`ImagePreprocessor`): Vision APIに送る前に画像を縮小・再圧縮するオブジェクト
+        _validator (:obj:`ImageValidator`): Vision APIに送る前に読み取れない画像を不合格にするオブジェクト
     """
 
-    def __init__(self):
-        self._vision_client = VisionClient()
+    def __init__(
+        self,
+        vision_client: Optional[VisionClient] = None,
+        preprocessor: Optional[ImagePreprocessor] = None,
+        validator: Optional[ImageValidator] = None,
+    ):
+        # 共有のクライアントが渡された場合はそれを使う．渡されない場合は最初に文字を抽出する時点で作成する
+        self._vision_client = vision_client
         self._shift_parser = ShiftParser()
+        self._preprocessor = preprocessor if preprocessor is not None else ImagePreprocessor()
+        self._validator = validator if validator is not None else ImageValidator()
 
-    def process_image(self, result_dir: str) -> list[Shift]:
+    def process_image(
+        self, result_dir: str, image: Optional[ImageSource] = None
+    ) -> list[Shift]:
         """画像処理とシフトデータの作成を行うメソッド
         Args:
             result_dir (str):画像や抽出結果ファイルを格納するディレクトリへのパス
+            image (ImageSource | None): 画像のパスか内容．Noneの場合はresult_dir/shift.jpgを使う
         Returns:
             list[Shift]: シフトデータ
+        Raises:
+            ImageRejectedError: 画像が小さい・ぼやけているなど，シフト表として読み取れない場合
+        Notes:
+            Vision APIに送る前に画像をローカルで判定し，読み取れない画像は送らずに不合格にする．
+            前処理で縮小・切り抜きした場合は，抽出された座標を元の画像の座標に戻してからシフトデータに変換する．
+            同じ画像を同じ設定で処理したことがある場合は，判定・前処理も行わずに以前の抽出結果を使う
         Examples:
             >>> from unittest.mock import MagicMock, patch
             >>> from dataclass.shift import Shift
@@ -34,24 +60,201 @@ class ImageProcessor:
             >>> with patch("__main__.VisionClient") as MockClient, \\
             ...      patch("__main__.ShiftParser") as MockParser:
             ...     mock_client_instance = MockClient.return_value
-            ...     mock_client_instance.extract_data_from_image.return_value = None
+            ...     mock_ocr_result = MagicMock()
+            ...     mock_client_instance.extract_data_from_image.return_value = mock_ocr_result
             ...     mock_parser_instance = MockParser.return_value
-            ...     mock_parser_instance.parse_data_to_shifts.return_value = mock_shifts
+            ...     mock_parser_instance.parse_ocr_result.return_value = mock_shifts
             ...
             ...     # テスト対象を実行
-            ...     test_image_processor = ImageProcessor()
+            ...     test_image_processor = ImageProcessor(
+            ...         preprocessor=ImagePreprocessor(enabled=False), validator=ImageValidator(enabled=False)
+            ...     )
             ...     result_shifts = test_image_processor.process_image(test_result_dir)
             ...
             >>> # 正しい引数で呼び出されたか
-            >>> mock_client_instance.extract_data_from_image.assert_called_once_with(test_result_dir)
-            >>> mock_parser_instance.parse_data_to_shifts.assert_called_once_with(test_result_dir)
+            >>> mock_client_instance.extract_data_from_image.assert_called_once_with(test_result_dir, image=None)
+            >>> # 抽出結果はファイルを介さずにそのまま渡される
+            >>> mock_parser_instance.parse_ocr_result.assert_called_once_with(mock_ocr_result)
             >>>
             >>> # 返り値が正しいか
             >>> result_shifts
             [Shift(summary='バイト', start_datetime='2025-04-02T17:00:00+09:00:00', end_datetime='2025-04-02T21:30:00+09:00:00', timezone='Asia/Tokyo'), Shift(summary='バイト', start_datetime='2025-04-04T17:00:00+09:00:00', end_datetime='2025-04-04T21:00:00+09:00:00', timezone='Asia/Tokyo')]
+            >>>
+            >>> # 前処理を行う場合は縮小した画像を送り，座標を元の画像の大きさに戻す
+            >>> import io
+            >>> from PIL import Image
+            >>> from dataclass.ocr_result import OcrResult, OcrSymbol
+            >>> buffer = io.BytesIO()
+            >>> Image.new("RGB", (4000, 3000), "white").save(buffer, "JPEG")
+            >>> mock_client = MagicMock()
+            >>> mock_client.get_prepared.return_value = None
+            >>> mock_client.extract_data_from_image.return_value = OcrResult.from_symbols([OcrSymbol("9", ((35, 23), (52, 23), (52, 49), (35, 49)))])
+            >>> test_image_processor = ImageProcessor(mock_client, ImagePreprocessor(max_edge=1000), ImageValidator(min_sharpness=0, min_contrast=0, max_brightness=255))
+            >>> test_image_processor._shift_parser = MagicMock()
+            >>> _ = test_image_processor.process_image(test_result_dir, image=buffer.getvalue())
+            >>> Image.open(io.BytesIO(mock_client.extract_data_from_image.call_args.kwargs["image"])).size
+            (1000, 750)
+            >>> test_image_processor._shift_parser.parse_ocr_result.call_args.args[0].coords.tolist()
+            [140, 92, 208, 92, 208, 196, 140, 196]
+            >>>
+            >>> # 読み取れない画像はVision APIに送らない
+            >>> mock_client.reset_mock()
+            >>> try:
+            ...     test_image_processor.process_image(test_result_dir, image=b"dummy image data")
+            ... except ImageRejectedError as e:
+            ...     print(e.reason, e)
+            unreadable 画像として読み込めません。JPEGかPNGの画像をアップロードしてください。
+            >>> mock_client.extract_data_from_image.called
+            False
+            >>>
+            >>> # 同じ画像の2回目は判定・前処理を行わずにキャッシュされた抽出結果を使う
+            >>> from google.cloud import vision
+            >>> from src.image_processor.ocr_cache import OcrCache
+            >>> from src.testing.fake_vision import FakeImageAnnotatorClient
+            >>> fake_client = FakeImageAnnotatorClient(lambda content: vision.AnnotateImageResponse())
+            >>> test_image_processor = ImageProcessor(
+            ...     VisionClient(ocr_cache=OcrCache(), save_response=False, client=fake_client),
+            ...     ImagePreprocessor(max_edge=1000), ImageValidator(min_sharpness=0, min_contrast=0, max_brightness=255),
+            ... )
+            >>> preprocess_count = metrics.registry.count(metrics.STAGE_DURATION, stage="preprocess")
+            >>> for _ in range(2):
+            ...     _ = test_image_processor.process_image(test_result_dir, image=buffer.getvalue())
+            >>> fake_client.calls, metrics.registry.count(metrics.STAGE_DURATION, stage="preprocess") - preprocess_count
+            (1, 1)
+        """
+        vision_client = self._get_vision_client()
+        image, source_key = self._read_source(result_dir, image)
+        if source_key is not None:
+            cached = vision_client.get_prepared(result_dir, source_key)
+            if cached is not None:
+                return self.to_shifts(*cached)
+        image, transform = self._prepare_content(image)
+        ocr_result = vision_client.extract_data_from_image(result_dir, image=image)
+        if source_key is not None:
+            vision_client.put_prepared(source_key, image, transform)
+
+        return self.to_shifts(ocr_result, transform)
+
+    async def process_image_async(
+        self, result_dir: str, image: Optional[ImageSource] = None
+    ) -> list[Shift]:
+        """process_imageの非同期版
+        Args:
+            result_dir (str):画像や抽出結果ファイルを格納するディレクトリへのパス
+            image (ImageSource | None): 画像のパスか内容．Noneの場合はresult_dir/shift.jpgを使う
+        Returns:
+            list[Shift]: シフトデータ
+        Raises:
+            ImageRejectedError: 画像が小さい・ぼやけているなど，シフト表として読み取れない場合
+        Notes:
+            判定・前処理・シフトデータへの変換とキャッシュの参照はCPUやディスクを使うため別スレッドで実行し，
+            Vision APIの応答はイベントループ上で待つ
+        Examples:
+            >>> from unittest.mock import AsyncMock, MagicMock
+            >>> mock_client = MagicMock()
+            >>> mock_client.extract_data_from_image_async = AsyncMock(return_value=OcrResult())
+            >>> test_image_processor = ImageProcessor(
+            ...     mock_client, ImagePreprocessor(enabled=False), ImageValidator(enabled=False)
+            ... )
+            >>> asyncio.run(test_image_processor.process_image_async("result/dummy", image=b"dummy image data"))
+            []
+            >>> mock_client.extract_data_from_image_async.assert_awaited_once_with("result/dummy", image=b"dummy image data")
+        """
+        vision_client = self._get_vision_client()
+        image, source_key = await asyncio.to_thread(self._read_source, result_dir, image)
+        if source_key is not None:
+            cached = await asyncio.to_thread(vision_client.get_prepared, result_dir, source_key)
+            if cached is not None:
+                return await asyncio.to_thread(self.to_shifts, *cached)
+        image, transform = await asyncio.to_thread(self._prepare_content, image)
+        ocr_result = await vision_client.extract_data_from_image_async(result_dir, image=image)
+        if source_key is not None:
+            await asyncio.to_thread(vision_client.put_prepared, source_key, image, transform)
+
+        return await asyncio.to_thread(self.to_shifts, ocr_result, transform)
+
+    def _get_vision_client(self) -> VisionClient:
+        """Vision APIのクライアントを取得するメソッド．作成していない場合は作成する
+        Returns:
+            VisionClient: クライアント
+        """
+        if self._vision_client is None:
+            self._vision_client = VisionClient()
+
+        return self._vision_client
+
+    def prepare(
+        self, result_dir: str, image: Optional[ImageSource]
+    ) -> tuple[Optional[ImageSource], Optional[tuple]]:
+        """画像を判定・前処理するメソッド
+        Args:
+            result_dir (str): 画像を格納するディレクトリへのパス
+            image (ImageSource | None): 画像のパスか内容
+        Returns:
+            tuple: (Vision APIに送る画像，座標を元の画像に戻すOcrResult.scaledの引数．不要な場合はNone)
+        Raises:
+            ImageRejectedError: 画像がシフト表として読み取れない場合
+        Notes:
+            Vision APIのクライアントは使わないため，画像をまとめて処理する場合(src/bulk.py)は別のプロセスで呼ぶ
+        """
+        image, _ = self._read_source(result_dir, image)
+
+        return self._prepare_content(image)
+
+    def _read_source(
+        self, result_dir: str, image: Optional[ImageSource]
+    ) -> tuple[Optional[ImageSource], Optional[str]]:
+        """判定・前処理を行う場合に画像を読み込み，前処理する前の画像のキーとともに返すメソッド
+        Args:
+            result_dir (str): 画像を格納するディレクトリへのパス
+            image (ImageSource | None): 画像のパスか内容
+        Returns:
+            tuple: (画像，前処理する前の画像と判定・前処理の設定から作成したキー)．
+                判定・前処理を行わない場合は(imageそのもの，None)
+        """
+        if not (self._validator.enabled or self._preprocessor.enabled):
+            return image, None
+        # 画像は1度だけ読み込み，判定・前処理・送信で共有する．ハッシュ値は読み込みながら計算したものを使う
+        content, digest = read_image(image if image is not None else f"{result_dir}/shift.jpg")
+        # 設定が変わった場合は前処理の結果も変わるため，キーに含める
+        settings = repr((sorted(vars(self._validator).items()), sorted(vars(self._preprocessor).items())))
+        source_key = hashlib.sha256(f"prepared|{digest}|{settings}".encode()).hexdigest()
+
+        return content, source_key
+
+    def _prepare_content(self, image: Optional[ImageSource]) -> tuple[Optional[ImageSource], Optional[tuple]]:
+        """_read_sourceで読み込んだ画像を判定・前処理するメソッド(prepareを参照)"""
+        if self._validator.enabled:
+            with metrics.registry.span("validate"):
+                try:
+                    self._validator.validate(image)
+                except ImageRejectedError as e:
+                    metrics.registry.inc(metrics.IMAGES_REJECTED, reason=e.reason)
+                    raise
+        if not self._preprocessor.enabled:
+            return image, None
+
+        with metrics.registry.span("preprocess"):
+            prepared = self._preprocessor.process(image)
+        transform = (prepared.scale_x, prepared.scale_y, prepared.offset_x, prepared.offset_y)
+
+        return prepared.content, transform if transform != (1.0, 1.0, 0, 0) else None
+
+    def to_shifts(self, ocr_result: OcrResult, transform: Optional[tuple]) -> list[Shift]:
+        """抽出結果の座標を元の画像に戻し，シフトデータに変換するメソッド
+        Args:
+            ocr_result (OcrResult): Vision APIに送った画像からの抽出結果
+            transform (tuple | None): OcrResult.scaledの引数(prepareの戻り値)．Noneの場合は座標を変えない
+        Returns:
+            list[Shift]: シフトデータ
+        Notes:
+            prepareと同様に，画像をまとめて処理する場合は別のプロセスで呼ぶ
         """
-        self._vision_client.extract_data_from_image(result_dir)
-        shifts = self._shift_parser.parse_data_to_shifts(result_dir)
+        if transform is not None:
+            ocr_result = ocr_result.scaled(*transform)
+        with metrics.registry.span("parse"):
+            shifts = self._shift_parser.parse_ocr_result(ocr_result)
+        metrics.registry.inc(metrics.SHIFTS_PRODUCED, len(shifts))
 
         return shifts
 
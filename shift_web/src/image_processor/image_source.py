@@ -0,0 +1,146 @@
+"""アップロードされた画像を複製せずに読み込むモジュール"""
+
+import errno
+import hashlib
+import os
+import shutil
+from typing import BinaryIO, Optional, Union
+
+# 画像のサイズの上限(Vision APIが受け付ける画像ファイルの上限に合わせる)
+MAX_IMAGE_BYTES = int(os.getenv("SHIFT_MAX_IMAGE_BYTES", 20 * 1024 * 1024))
+# 画像を読み込む単位
+CHUNK_SIZE = 1024 * 1024
+# Linuxでファイルの内容を共有するコピー(reflink)を作成するioctlの番号
+_FICLONE = 0x40049409
+
+# 画像のパス，画像の内容，または読み込み可能なバイナリのファイルオブジェクト
+ImageSource = Union[str, bytes, bytearray, memoryview, BinaryIO]
+
+
+def read_image(
+    source: ImageSource, max_bytes: Optional[int] = None
+) -> tuple[bytes, str]:
+    """サイズの上限を確かめながら画像を読み込み，ハッシュ値とともに返す関数
+    Args:
+        source (ImageSource): 画像のパス，画像の内容，またはバイナリのファイルオブジェクト
+        max_bytes (int | None): 画像のサイズの上限．Noneの場合はMAX_IMAGE_BYTES
+    Returns:
+        tuple[bytes, str]: (画像の内容，SHA-256のハッシュ値)
+    Raises:
+        ValueError: 画像のサイズが上限を超えた場合
+    Notes:
+        通常のファイルは読み込む前にサイズを確かめ，1回で読み込む(途中の複製を作らない)．
+        それ以外は少しずつ読み込みながらハッシュ値を計算し，上限を超えた時点で読み込みを止める．
+        いずれの場合も巨大なファイルを全てメモリに載せることはない
+    Examples:
+        >>> import io
+        >>> content, digest = read_image(io.BytesIO(b"dummy image data"))
+        >>> content, digest[:16]
+        (b'dummy image data', 'd00be442b4159c03')
+        >>> read_image(b"dummy image data")[1] == digest
+        True
+        >>> read_image(b"x" * 11, max_bytes=10)
+        Traceback (most recent call last):
+            ...
+        ValueError: 画像のサイズが上限(10バイト)を超えています。
+    """
+    max_bytes = max_bytes if max_bytes is not None else MAX_IMAGE_BYTES
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        if len(source) > max_bytes:
+            raise ValueError(f"画像のサイズが上限({max_bytes}バイト)を超えています。")
+        content = bytes(source)
+        return content, hashlib.sha256(content).hexdigest()
+
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            try:
+                size = os.fstat(f.fileno()).st_size
+            except (OSError, TypeError, ValueError):
+                # ファイル記述子を持たない場合は少しずつ読み込む
+                return _read_stream(f, max_bytes)
+            if size > max_bytes:
+                raise ValueError(f"画像のサイズが上限({max_bytes}バイト)を超えています。")
+            content = f.read()
+        if len(content) > max_bytes:
+            raise ValueError(f"画像のサイズが上限({max_bytes}バイト)を超えています。")
+        return content, hashlib.sha256(content).hexdigest()
+
+    return _read_stream(source, max_bytes)
+
+
+def _read_stream(f: BinaryIO, max_bytes: int) -> tuple[bytes, str]:
+    """ファイルオブジェクトをCHUNK_SIZEずつ読み込む関数(read_imageを参照)"""
+    digest = hashlib.sha256()
+    chunks = list()
+    total = 0
+    while True:
+        chunk = f.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > max_bytes:
+            raise ValueError(f"画像のサイズが上限({max_bytes}バイト)を超えています。")
+        digest.update(chunk)
+        chunks.append(chunk)
+
+    return b"".join(chunks), digest.hexdigest()
+
+
+def link_or_copy(src: str, dst: str) -> str:
+    """ファイルの内容を複製せずにdstから参照できるようにする関数
+    Args:
+        src (str): 元のファイルへのパス
+        dst (str): 作成するファイルへのパス
+    Returns:
+        str: 使った方法("hardlink"，"reflink"，"copy"のいずれか)
+    Notes:
+        ハードリンクを作成できない場合(別のファイルシステムなど)はreflinkを試し，
+        どちらもできない場合のみ内容をコピーする
+    Examples:
+        >>> import tempfile
+        >>> test_dir = tempfile.mkdtemp()
+        >>> with open(f"{test_dir}/upload.jpg", "wb") as f:
+        ...     _ = f.write(b"dummy image data")
+        >>> link_or_copy(f"{test_dir}/upload.jpg", f"{test_dir}/shift.jpg")
+        'hardlink'
+        >>> os.path.samefile(f"{test_dir}/upload.jpg", f"{test_dir}/shift.jpg")
+        True
+    """
+    try:
+        os.link(src, dst)
+        return "hardlink"
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP, errno.EACCES):
+            raise
+
+    if _reflink(src, dst):
+        return "reflink"
+    shutil.copyfile(src, dst)
+
+    return "copy"
+
+
+def _reflink(src: str, dst: str) -> bool:
+    """reflink(内容を共有するコピー)を作成する関数
+    Returns:
+        bool: 作成できた場合はTrue．対応していない環境やファイルシステムの場合はFalse
+    """
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    with open(src, "rb") as f_src, open(dst, "wb") as f_dst:
+        try:
+            fcntl.ioctl(f_dst.fileno(), _FICLONE, f_src.fileno())
+            return True
+        except OSError:
+            pass
+    os.remove(dst)
+
+    return False
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
@@ -0,0 +1,275 @@
+"""Vision APIに送る前に，シフト表として読み取れない画像をローカルで判定するモジュール"""
+
+import io
+import os
+from typing import NamedTuple, Optional
+
+import numpy as np
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+
+# 短辺の最小のピクセル数
+MIN_EDGE = int(os.getenv("VALIDATE_MIN_EDGE", 480))
+# 長辺と短辺の比の最大値
+MAX_ASPECT = float(os.getenv("VALIDATE_MAX_ASPECT", 4.0))
+# 鮮明さ(ラプラシアンの分散)の最小値
+MIN_SHARPNESS = float(os.getenv("VALIDATE_MIN_SHARPNESS", 30.0))
+# 明るさ(画素の平均値)の範囲．最大値を超えてもコントラストが十分な場合(白地の画面のスクリーンショット)は合格とする
+MIN_BRIGHTNESS = float(os.getenv("VALIDATE_MIN_BRIGHTNESS", 40.0))
+MAX_BRIGHTNESS = float(os.getenv("VALIDATE_MAX_BRIGHTNESS", 245.0))
+# コントラスト(画素の標準偏差)の最小値
+MIN_CONTRAST = float(os.getenv("VALIDATE_MIN_CONTRAST", 15.0))
+# 判定を行うかどうか
+ENABLED = os.getenv("VALIDATE_ENABLED", "1") != "0"
+# 鮮明さ・明るさ・コントラストを計算する縮小画像の長辺の最小のピクセル数
+ANALYZE_EDGE = 1024
+# ラプラシアンを計算する行数の単位
+LAPLACIAN_CHUNK_ROWS = 128
+# EXIFの向きのタグと，縦と横が入れ替わる向き
+_ORIENTATION_TAG = 0x0112
+_TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+
+class ImageRejectedError(ValueError):
+    """シフト表として読み取れない画像を受け取った場合の例外
+    Attributes:
+        reason (str): 理由の種類(metricsのラベルに使う)
+            - "unreadable": 画像として読み込めない
+            - "too_small": 画像が小さすぎる
+            - "aspect": 縦横比が極端
+            - "blurry": ぼやけている
+            - "too_dark"，"too_bright": 暗すぎる，明るすぎる
+            - "low_contrast": コントラストが低すぎる
+    """
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+    def __reduce__(self):
+        """別のプロセス(プロセスプール)に渡せるよう，reasonを含めて復元するメソッド
+        Examples:
+            >>> import pickle
+            >>> error = pickle.loads(pickle.dumps(ImageRejectedError("blurry", "画像がぼやけています。")))
+            >>> error.reason, str(error)
+            ('blurry', '画像がぼやけています。')
+        """
+        return type(self), (self.reason, str(self))
+
+
+class ImageStats(NamedTuple):
+    """判定に使った画像の特徴量
+    Attributes:
+        width (int): 幅(向きを補正したもの)
+        height (int): 高さ(向きを補正したもの)
+        sharpness (float): 長辺ANALYZE_EDGE〜2倍のピクセル数に縮小したグレースケール画像のラプラシアンの分散
+        brightness (float): 画素の平均値(0〜255)
+        contrast (float): 画素の標準偏差
+    """
+    width: int
+    height: int
+    sharpness: float
+    brightness: float
+    contrast: float
+
+
+class ImageValidator:
+    """画像の大きさ・縦横比・鮮明さ・明るさ・コントラストを確かめるクラス
+    Attributes:
+        min_edge (int): 短辺の最小のピクセル数
+        max_aspect (float): 長辺と短辺の比の最大値
+        min_sharpness (float): 鮮明さの最小値
+        min_brightness (float): 明るさの最小値
+        max_brightness (float): 明るさの最大値(コントラストもmin_contrast未満の場合のみ不合格にする)
+        min_contrast (float): コントラストの最小値
+        enabled (bool): 判定を行うかどうか
+    """
+
+    def __init__(
+        self,
+        min_edge: Optional[int] = None,
+        max_aspect: Optional[float] = None,
+        min_sharpness: Optional[float] = None,
+        min_brightness: Optional[float] = None,
+        max_brightness: Optional[float] = None,
+        min_contrast: Optional[float] = None,
+        enabled: Optional[bool] = None,
+    ):
+        self.min_edge = min_edge if min_edge is not None else MIN_EDGE
+        self.max_aspect = max_aspect if max_aspect is not None else MAX_ASPECT
+        self.min_sharpness = min_sharpness if min_sharpness is not None else MIN_SHARPNESS
+        self.min_brightness = min_brightness if min_brightness is not None else MIN_BRIGHTNESS
+        self.max_brightness = max_brightness if max_brightness is not None else MAX_BRIGHTNESS
+        self.min_contrast = min_contrast if min_contrast is not None else MIN_CONTRAST
+        self.enabled = enabled if enabled is not None else ENABLED
+
+    def validate(self, content: bytes) -> ImageStats:
+        """画像がシフト表として読み取れそうかを確かめるメソッド
+        Args:
+            content (bytes): 画像の内容
+        Returns:
+            ImageStats: 判定に使った特徴量
+        Raises:
+            ImageRejectedError: 読み取れない画像の場合(理由は例外のメッセージとreasonを参照)
+        Notes:
+            大きさと縦横比はヘッダのみから判定し，画素を読み込む前に不合格にする．
+            鮮明さなどはdraftでデコード時に縮小した画像から計算するため，1200万画素の写真でも40ミリ秒程度で終わる
+        Examples:
+            >>> from PIL import ImageDraw, ImageFilter
+            >>> roster = Image.new("L", (1200, 1600), 235)
+            >>> draw = ImageDraw.Draw(roster)
+            >>> for y in range(100, 1500, 60):
+            ...     draw.text((100, y), "9/1 17:00 21:30   9/2 15:00 18:30", fill=20, font_size=40)
+            >>> def encode(image):
+            ...     buffer = io.BytesIO()
+            ...     image.save(buffer, "JPEG")
+            ...     return buffer.getvalue()
+            >>> validator = ImageValidator()
+            >>> validator.validate(encode(roster))[:2]
+            (1200, 1600)
+            >>> validator.validate(encode(roster.filter(ImageFilter.GaussianBlur(4))))
+            Traceback (most recent call last):
+                ...
+            ImageRejectedError: 画像がぼやけています(鮮明さ: 3.4 < 30.0)。ピントを合わせて撮影し直してください。
+            >>> validator.validate(encode(roster.resize((300, 400))))
+            Traceback (most recent call last):
+                ...
+            ImageRejectedError: 画像が小さすぎます(300x400ピクセル)。短辺が480ピクセル以上の画像をアップロードしてください。
+            >>> # 白地の画面のスクリーンショットは明るくても文字のコントラストがあるため合格とする
+            >>> screenshot = Image.new("L", (1170, 2532), 255)
+            >>> draw = ImageDraw.Draw(screenshot)
+            >>> for y in range(200, 2400, 120):
+            ...     draw.line((40, y, 1130, y), fill=200)
+            ...     draw.text((60, y + 10), "4/2 17:00-21:30", fill=30, font_size=34)
+            >>> stats = validator.validate(encode(screenshot))
+            >>> stats.brightness > validator.max_brightness
+            True
+            >>> # 光の反射で白くなった写真は明るく，コントラストも低い
+            >>> glare = Image.new("L", (1200, 1600), 250)
+            >>> draw = ImageDraw.Draw(glare)
+            >>> for y in range(100, 1500, 60):
+            ...     draw.text((100, y), "9/1 17:00 21:30   9/2 15:00 18:30", fill=235, font_size=40)
+            >>> validator.validate(encode(glare))
+            Traceback (most recent call last):
+                ...
+            ImageRejectedError: 画像が明るすぎます(明るさ: 249.2 > 245.0)。光の反射を避けて撮影し直してください。
+            >>> validator.validate(b"dummy image data")
+            Traceback (most recent call last):
+                ...
+            ImageRejectedError: 画像として読み込めません。JPEGかPNGの画像をアップロードしてください。
+        """
+        try:
+            with Image.open(io.BytesIO(content)) as image:
+                # 向きはヘッダのEXIFから求め，画素はまだ読み込まない
+                width, height = image.size
+                if image.getexif().get(_ORIENTATION_TAG) in _TRANSPOSED_ORIENTATIONS:
+                    width, height = height, width
+                self._check_size(width, height)
+                image.draft("L", (ANALYZE_EDGE, ANALYZE_EDGE))
+                gray = ImageOps.exif_transpose(image).convert("L")
+        except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+            raise ImageRejectedError(
+                "unreadable", "画像として読み込めません。JPEGかPNGの画像をアップロードしてください。"
+            ) from None
+        # 整数分の1の平均で縮小する(補間による縮小より速い)．長辺はANALYZE_EDGE〜2倍になる
+        factor = max(gray.size) // ANALYZE_EDGE
+        if factor > 1:
+            gray = gray.reduce(factor)
+        pixels = np.asarray(gray)
+        # 明るさとコントラストは画素値のヒストグラムから求める(画像と同じ大きさの一時配列を作らない)
+        histogram = np.array(gray.histogram(), dtype=np.float64)
+        levels = np.arange(256)
+        brightness = float(histogram @ levels / pixels.size)
+        contrast = float(np.sqrt(max(0.0, histogram @ levels**2 / pixels.size - brightness**2)))
+        stats = ImageStats(
+            width=width,
+            height=height,
+            sharpness=_laplacian_variance(pixels),
+            brightness=brightness,
+            contrast=contrast,
+        )
+        self._check_pixels(stats)
+
+        return stats
+
+    def _check_size(self, width: int, height: int) -> None:
+        """大きさと縦横比を確かめるメソッド(validateを参照)"""
+        if min(width, height) < self.min_edge:
+            raise ImageRejectedError(
+                "too_small",
+                f"画像が小さすぎます({width}x{height}ピクセル)。"
+                f"短辺が{self.min_edge}ピクセル以上の画像をアップロードしてください。",
+            )
+        aspect = max(width, height) / min(width, height)
+        if aspect > self.max_aspect:
+            raise ImageRejectedError(
+                "aspect",
+                f"画像の縦横比が極端です({aspect:.1f}:1)。シフト表全体が収まるように撮影してください。",
+            )
+
+    def _check_pixels(self, stats: ImageStats) -> None:
+        """明るさ・コントラスト・鮮明さを確かめるメソッド(validateを参照)"""
+        if stats.brightness < self.min_brightness:
+            raise ImageRejectedError(
+                "too_dark",
+                f"画像が暗すぎます(明るさ: {stats.brightness:.1f} < {self.min_brightness:.1f})。明るい場所で撮影し直してください。",
+            )
+        # 明るいだけでなくコントラストも低い場合を光の反射とみなす(白地の画面のスクリーンショットは明るい)
+        if stats.brightness > self.max_brightness and stats.contrast < self.min_contrast:
+            raise ImageRejectedError(
+                "too_bright",
+                f"画像が明るすぎます(明るさ: {stats.brightness:.1f} > {self.max_brightness:.1f})。光の反射を避けて撮影し直してください。",
+            )
+        if stats.contrast < self.min_contrast:
+            raise ImageRejectedError(
+                "low_contrast",
+                f"画像のコントラストが低すぎます({stats.contrast:.1f} < {self.min_contrast:.1f})。文字が写っているか確認してください。",
+            )
+        # 明るさとコントラストが十分な場合のみ鮮明さを判定する(暗い画像はラプラシアンも小さくなるため)
+        if stats.sharpness < self.min_sharpness:
+            raise ImageRejectedError(
+                "blurry",
+                f"画像がぼやけています(鮮明さ: {stats.sharpness:.1f} < {self.min_sharpness:.1f})。ピントを合わせて撮影し直してください。",
+            )
+
+
+def _laplacian_variance(pixels: np.ndarray) -> float:
+    """4近傍のラプラシアンの分散を計算する関数(値が小さいほどぼやけている)
+    Args:
+        pixels (np.ndarray): グレースケール画像の画素(2次元，8ビット)
+    Returns:
+        float: 分散．画像が3x3ピクセル未満の場合は0
+    Examples:
+        >>> _laplacian_variance(np.zeros((10, 10), dtype=np.uint8))
+        0.0
+        >>> _laplacian_variance((np.indices((10, 10)).sum(axis=0) % 2 * 255).astype(np.uint8)) > 1000
+        True
+    """
+    height, width = pixels.shape
+    if min(height, width) < 3:
+        return 0.0
+    # 画像と同じ大きさの一時配列を作らないよう，LAPLACIAN_CHUNK_ROWS行ずつ合計と二乗和を求める
+    total = 0.0
+    total_squares = 0.0
+    for top in range(1, height - 1, LAPLACIAN_CHUNK_ROWS):
+        bottom = min(top + LAPLACIAN_CHUNK_ROWS, height - 1)
+        laplacian = pixels[top - 1:bottom - 1, 1:-1].astype(np.float32)
+        laplacian += pixels[top + 1:bottom + 1, 1:-1]
+        laplacian += pixels[top:bottom, :-2]
+        laplacian += pixels[top:bottom, 2:]
+        center = pixels[top:bottom, 1:-1].astype(np.float32)
+        center *= 4
+        laplacian -= center
+        flat = laplacian.ravel()
+        total += float(flat.sum(dtype=np.float64))
+        total_squares += float(np.dot(flat, flat))
+    count = (height - 2) * (width - 2)
+    mean = total / count
+
+    return max(0.0, total_squares / count - mean * mean)
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
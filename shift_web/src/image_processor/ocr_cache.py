@@ -0,0 +1,351 @@
+"""画像の内容をキーとしてVision APIの抽出結果を保存するモジュール"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+class OcrCache:
+    """画像のハッシュ値をキーとして，Vision APIの抽出結果をメモリとディスクに保存するクラス
+    Attributes:
+        hits (int): メモリかディスクから結果を返した回数
+        memory_hits (int): メモリから結果を返した回数
+        disk_hits (int): ディスクから結果を返した回数
+        misses (int): 結果が見つからなかった回数
+        _max_memory_bytes (int): メモリに保存する結果の合計サイズの上限
+        _disk_dir (str | None): ディスクに保存するディレクトリ．Noneの場合はディスクを使わない
+        _max_disk_bytes (int): ディスクに保存する結果の合計サイズの上限
+        _ttl (float | None): 結果の有効期間(秒)．Noneの場合は期限なし
+        _memory (OrderedDict[str, tuple[float, bytes]]): キーと(保存時刻，結果)の対応表(古く使われた順)
+        _memory_bytes (int): メモリに保存している結果の合計サイズ
+        _disk_bytes (int | None): ディスクに保存している結果の合計サイズ．未集計の場合はNone
+        _lock (:obj:`threading.Lock`): 状態を保護するロック
+    Notes:
+        結果はJSON文字列として保存し，サイズはその長さで数える
+    """
+
+    def __init__(
+        self,
+        max_memory_bytes: int = 32 * 1024 * 1024,
+        disk_dir: Optional[str] = None,
+        max_disk_bytes: int = 512 * 1024 * 1024,
+        ttl: Optional[float] = 7 * 24 * 60 * 60,
+    ):
+        self.hits = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._max_memory_bytes = max_memory_bytes
+        self._disk_dir = disk_dir
+        self._max_disk_bytes = max_disk_bytes
+        self._ttl = ttl
+        self._memory: "OrderedDict[str, tuple[float, bytes]]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key_for(content: bytes) -> str:
+        """画像の内容からキーを作成するメソッド
+        Args:
+            content (bytes): 画像の内容
+        Returns:
+            str: キー(SHA-256のハッシュ値)
+        Examples:
+            >>> OcrCache.key_for(b"dummy image data")
+            'd00be442b4159c037f2baca86ad60528cb5b9a9b94b7c4118810ae93a644f252'
+        """
+        return hashlib.sha256(content).hexdigest()
+
+    def get(self, key: str) -> Optional[dict]:
+        """キーに対応する抽出結果を取得するメソッド
+        Args:
+            key (str): キー
+        Returns:
+            dict | None: 抽出結果．見つからない場合や期限切れの場合はNone
+        Examples:
+            >>> import tempfile
+            >>> test_dir = tempfile.mkdtemp()
+            >>> test_cache = OcrCache(max_memory_bytes=100, disk_dir=test_dir)
+            >>> key = OcrCache.key_for(b"dummy image data")
+            >>> test_cache.get(key) is None
+            True
+            >>> test_cache.put(key, {"text": "9/1金17時00分21時30分"})
+            >>> test_cache.get(key)
+            {'text': '9/1金17時00分21時30分'}
+            >>>
+            >>> # メモリの上限を超えると古いものから追い出されるが，ディスクからは取得できる
+            >>> test_cache.put(OcrCache.key_for(b"other image"), {"text": "x" * 80})
+            >>> test_cache.get(key)
+            {'text': '9/1金17時00分21時30分'}
+            >>> test_cache.stats()
+            {'hits': 2, 'memory_hits': 1, 'disk_hits': 1, 'misses': 1, 'memory_bytes': 37, 'memory_entries': 1}
+            >>>
+            >>> # 有効期間を過ぎたものは返さない
+            >>> expired_cache = OcrCache(ttl=0)
+            >>> expired_cache.put(key, {"text": "x"})
+            >>> expired_cache.get(key) is None
+            True
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                stored_at, payload = entry
+                if not self._is_expired(stored_at, now):
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    self.memory_hits += 1
+                    return json.loads(payload)
+                self._remove_from_memory(key)
+
+        disk_entry = self._read_from_disk(key, now)
+        with self._lock:
+            if disk_entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            stored_at, payload = disk_entry
+            self._put_to_memory(key, payload, stored_at)
+
+        return json.loads(payload)
+
+    def put(self, key: str, value: dict) -> None:
+        """抽出結果を保存するメソッド
+        Args:
+            key (str): キー
+            value (dict): 抽出結果
+        Returns:
+            None
+        Notes:
+            doctestはgetを参照
+        """
+        payload = json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode(
+            "utf-8"
+        )
+        now = time.time()
+        with self._lock:
+            self._put_to_memory(key, payload, now)
+        self._write_to_disk(key, payload)
+
+    def stats(self) -> dict:
+        """ヒット数などの統計情報を返すメソッド
+        Args:
+            None
+        Returns:
+            dict: 統計情報
+        Notes:
+            doctestはgetを参照
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "memory_bytes": self._memory_bytes,
+                "memory_entries": len(self._memory),
+            }
+
+    def _is_expired(self, stored_at: float, now: float) -> bool:
+        """保存時刻から有効期間を過ぎているかを判定するメソッド"""
+        return self._ttl is not None and now - stored_at >= self._ttl
+
+    def _put_to_memory(self, key: str, payload: bytes, now: float) -> None:
+        """メモリに結果を保存し，上限を超えた分を古く使われた順に追い出すメソッド
+        Notes:
+            呼び出し側で_lockを取得していること
+        """
+        if len(payload) > self._max_memory_bytes:
+            return
+        self._remove_from_memory(key)
+        self._memory[key] = (now, payload)
+        self._memory_bytes += len(payload)
+        while self._memory_bytes > self._max_memory_bytes:
+            oldest_key = next(iter(self._memory))
+            self._remove_from_memory(oldest_key)
+
+    def _remove_from_memory(self, key: str) -> None:
+        """メモリから結果を削除するメソッド
+        Notes:
+            呼び出し側で_lockを取得していること
+        """
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_bytes -= len(entry[1])
+
+    def _disk_path(self, key: str) -> str:
+        """キーに対応するディスク上のパスを返すメソッド(先頭2文字でディレクトリを分ける)"""
+        return os.path.join(self._disk_dir, key[:2], f"{key}.json")
+
+    def _read_from_disk(self, key: str, now: float) -> Optional[tuple[float, bytes]]:
+        """ディスクから結果を読み込むメソッド
+        Args:
+            key (str): キー
+            now (float): 現在時刻
+        Returns:
+            tuple[float, bytes] | None: (保存時刻，結果)．見つからない場合や期限切れの場合はNone
+        """
+        if self._disk_dir is None:
+            return None
+        path = self._disk_path(key)
+        try:
+            stat = os.stat(path)
+            if self._is_expired(stat.st_mtime, now):
+                os.remove(path)
+                with self._lock:
+                    if self._disk_bytes is not None:
+                        self._disk_bytes -= stat.st_size
+                return None
+            with open(path, "rb") as f:
+                payload = f.read()
+            # 最後に使われた時刻(atime)を更新し，追い出しの順序に反映する
+            os.utime(path, (now, stat.st_mtime))
+        except FileNotFoundError:
+            return None
+
+        return stat.st_mtime, payload
+
+    def _write_to_disk(self, key: str, payload: bytes) -> None:
+        """ディスクに結果を書き込み，上限を超えた場合は古く使われた順に削除するメソッド
+        Args:
+            key (str): キー
+            payload (bytes): 結果
+        Returns:
+            None
+        Notes:
+            容量不足などで書き込めない場合は警告を出力して諦める(メモリには保存済みのため)
+        Examples:
+            >>> import tempfile
+            >>> from unittest.mock import patch
+            >>> test_dir = tempfile.mkdtemp()
+            >>> test_cache = OcrCache(disk_dir=test_dir, ttl=60)
+            >>> key = OcrCache.key_for(b"dummy image data")
+            >>> test_cache.put(key, {"text": "x" * 10})
+            >>> test_cache.put(key, {"text": "x" * 20})
+            >>> test_cache._disk_bytes == sum(size for _, size, _ in test_cache._scan_disk())
+            True
+            >>>
+            >>> # 書き込みに失敗しても例外は送出せず，一時ファイルも残さない
+            >>> with patch("os.replace", side_effect=OSError(28, "No space left on device")):
+            ...     test_cache.put(OcrCache.key_for(b"other image"), {"text": "y"})
+            >>> sorted(name for _, _, names in os.walk(test_dir) for name in names)
+            ['d00be442b4159c037f2baca86ad60528cb5b9a9b94b7c4118810ae93a644f252.json']
+            >>>
+            >>> # 期限切れで削除した分も合計サイズから差し引く
+            >>> test_cache._ttl = 0
+            >>> test_cache._memory.clear()
+            >>> test_cache.get(key) is None
+            True
+            >>> test_cache._disk_bytes
+            0
+        """
+        if self._disk_dir is None:
+            return
+        path = self._disk_path(key)
+        try:
+            try:
+                old_size = os.stat(path).st_size
+            except FileNotFoundError:
+                old_size = 0
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 書き込み途中のファイルを読まれないように，一時ファイルから置き換える
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(payload)
+                os.replace(tmp_path, path)
+            except OSError:
+                try:
+                    os.remove(tmp_path)
+                except FileNotFoundError:
+                    pass
+                raise
+        except OSError as e:
+            logging.getLogger("__main__").getChild("ocr_cache").warning(
+                "抽出結果をディスクに保存できませんでした: %s", e
+            )
+            return
+
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(size for _, size, _ in self._scan_disk())
+            else:
+                self._disk_bytes += len(payload) - old_size
+            if self._disk_bytes > self._max_disk_bytes:
+                self._evict_disk()
+
+    def _scan_disk(self) -> list[tuple[float, int, str]]:
+        """ディスク上の結果を(最後に使われた時刻，サイズ，パス)のリストで返すメソッド"""
+        entries = list()
+        for root, _, files in os.walk(self._disk_dir):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_atime, stat.st_size, path))
+
+        return entries
+
+    def _evict_disk(self) -> None:
+        """ディスク上の結果を古く使われた順に上限の9割まで削除するメソッド
+        Notes:
+            呼び出し側で_lockを取得していること
+        """
+        entries = sorted(self._scan_disk())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self._max_disk_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._disk_bytes = total
+
+
+_default_cache: Optional[OcrCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_ocr_cache() -> OcrCache:
+    """環境変数の設定に従って，プロセス内で共有するキャッシュを取得する関数
+    Returns:
+        OcrCache: キャッシュ
+    Notes:
+        - OCR_CACHE_DIR: ディスクに保存するディレクトリ(未設定の場合はメモリのみ)
+        - OCR_CACHE_MEMORY_BYTES: メモリに保存する合計サイズの上限
+        - OCR_CACHE_DISK_BYTES: ディスクに保存する合計サイズの上限
+        - OCR_CACHE_TTL: 有効期間(秒)
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = OcrCache(
+                max_memory_bytes=int(
+                    os.getenv("OCR_CACHE_MEMORY_BYTES", 32 * 1024 * 1024)
+                ),
+                disk_dir=os.getenv("OCR_CACHE_DIR") or None,
+                max_disk_bytes=int(os.getenv("OCR_CACHE_DISK_BYTES", 512 * 1024 * 1024)),
+                ttl=float(os.getenv("OCR_CACHE_TTL", 7 * 24 * 60 * 60)),
+            )
+
+        return _default_cache
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
@@ -0,0 +1,250 @@
+"""Vision APIに送る前に画像を縮小・再圧縮するモジュール"""
+
+import io
+import logging
+import os
+from typing import NamedTuple, Optional
+
+import numpy as np
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+
+# 長辺の最大のピクセル数(文字の高さが十分に残る大きさ)
+MAX_EDGE = int(os.getenv("PREPROCESS_MAX_EDGE", 2048))
+# 再圧縮するJPEGの品質
+JPEG_QUALITY = int(os.getenv("PREPROCESS_JPEG_QUALITY", 85))
+# グレースケールに変換するかどうか
+GRAYSCALE = os.getenv("PREPROCESS_GRAYSCALE", "1") != "0"
+# 前処理を行うかどうか
+ENABLED = os.getenv("PREPROCESS_ENABLED", "1") != "0"
+# 表の範囲を検出して切り抜くかどうか
+CROP = os.getenv("PREPROCESS_CROP", "0") != "0"
+# 表の検出に使う縮小画像の長辺のピクセル数
+DETECT_EDGE = 512
+# 輪郭とみなす隣り合う画素の明るさの差
+EDGE_THRESHOLD = 40
+# 輪郭の画素の割合が最大値に対してこの割合以上の行・列を表の一部とみなす
+PROFILE_RATIO = 0.15
+# 表の一部とみなす行・列の間に挟まってもよい空白(検出用の画像の長辺に対する割合)
+PROFILE_GAP = 0.04
+# 検出した範囲の周りに残す余白(検出した範囲の幅・高さに対する割合)
+CROP_PADDING = 0.03
+# 切り抜いた面積が元の画像に対してこの割合より大きい場合は切り抜かない
+CROP_MAX_AREA = 0.9
+# 切り抜いた面積が元の画像に対してこの割合より小さい場合は検出の失敗とみなす
+CROP_MIN_AREA = 0.05
+# 縦と横が入れ替わるEXIFの向き(90度・270度の回転を含むもの)
+_TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+# EXIFの向きのタグ
+_ORIENTATION_TAG = 0x0112
+
+
+class PreprocessedImage(NamedTuple):
+    """前処理した画像
+    Attributes:
+        content (bytes): Vision APIに送る画像の内容
+        scale_x (float): 送る画像のx座標を元の画像(向きを補正したもの)のx座標に戻す倍率
+        scale_y (float): 送る画像のy座標を元の画像(向きを補正したもの)のy座標に戻す倍率
+        offset_x (int): 倍率を掛けた後に足すx座標(切り抜いた範囲の左端)
+        offset_y (int): 倍率を掛けた後に足すy座標(切り抜いた範囲の上端)
+    """
+    content: bytes
+    scale_x: float = 1.0
+    scale_y: float = 1.0
+    offset_x: int = 0
+    offset_y: int = 0
+
+
+class ImagePreprocessor:
+    """画像の向きを補正し，グレースケール化・縮小・再圧縮を行うクラス
+    Attributes:
+        max_edge (int): 長辺の最大のピクセル数
+        quality (int): 再圧縮するJPEGの品質(1〜95)
+        grayscale (bool): グレースケールに変換するかどうか
+        enabled (bool): 前処理を行うかどうか
+        crop (bool): 表の範囲を検出して切り抜くかどうか
+    """
+
+    def __init__(
+        self,
+        max_edge: Optional[int] = None,
+        quality: Optional[int] = None,
+        grayscale: Optional[bool] = None,
+        enabled: Optional[bool] = None,
+        crop: Optional[bool] = None,
+    ):
+        self.max_edge = max_edge if max_edge is not None else MAX_EDGE
+        self.quality = quality if quality is not None else JPEG_QUALITY
+        self.grayscale = grayscale if grayscale is not None else GRAYSCALE
+        self.enabled = enabled if enabled is not None else ENABLED
+        self.crop = crop if crop is not None else CROP
+
+    def process(self, content: bytes) -> PreprocessedImage:
+        """画像を前処理するメソッド
+        Args:
+            content (bytes): 画像の内容
+        Returns:
+            PreprocessedImage: 前処理した画像と，座標を元の画像に戻す倍率・移動量
+        Notes:
+            - 読み込む前にdraftでJPEGのデコード時の縮小を指定し，大きな画像でもメモリを抑える
+            - cropがTrueの場合は，縮小する前に表の範囲(find_table_boxを参照)を切り抜く
+            - 再圧縮した方が大きく，向きの補正も不要な場合は元の画像をそのまま返す
+            - 画像として読み込めない場合は警告を出して元の画像をそのまま返す(判定はVision APIに任せる)
+        Examples:
+            >>> buffer = io.BytesIO()
+            >>> Image.new("RGB", (4000, 3000), "white").save(buffer, "JPEG")
+            >>> prepared = ImagePreprocessor(max_edge=1000).process(buffer.getvalue())
+            >>> Image.open(io.BytesIO(prepared.content)).size, prepared.scale_x, prepared.scale_y
+            ((1000, 750), 4.0, 4.0)
+            >>> len(prepared.content) < len(buffer.getvalue())
+            True
+            >>> # 机の上の表を撮影した画像は，表の範囲を切り抜いて移動量を返す
+            >>> from PIL import ImageDraw
+            >>> desk = Image.new("L", (2000, 1500), 90)
+            >>> draw = ImageDraw.Draw(desk)
+            >>> draw.rectangle((600, 300, 1400, 1200), fill=240)
+            >>> for y in range(330, 1180, 40):
+            ...     for x in range(640, 1360, 30):
+            ...         draw.rectangle((x, y, x + 12, y + 20), fill=30)
+            >>> buffer = io.BytesIO()
+            >>> desk.save(buffer, "JPEG")
+            >>> prepared = ImagePreprocessor(crop=True).process(buffer.getvalue())
+            >>> Image.open(io.BytesIO(prepared.content)).size, prepared[1:]
+            ((930, 1004), (1.0, 1.0, 539, 266))
+            >>> ImagePreprocessor().process(b"dummy image data")
+            PreprocessedImage(content=b'dummy image data', scale_x=1.0, scale_y=1.0, offset_x=0, offset_y=0)
+        """
+        logger = logging.getLogger("__main__").getChild("preprocess")
+        try:
+            with Image.open(io.BytesIO(content)) as image:
+                orientation = image.getexif().get(_ORIENTATION_TAG)
+                width, height = image.size
+                if orientation in _TRANSPOSED_ORIENTATIONS:
+                    width, height = height, width
+                # JPEGの場合はデコード時に1/2〜1/8に縮小させる(max_edgeを下回らない範囲)
+                image.draft("L" if self.grayscale else "RGB", (self.max_edge, self.max_edge))
+                image = ImageOps.exif_transpose(image)
+                image = image.convert("L" if self.grayscale else "RGB")
+                # draftで縮小された分の倍率
+                draft_x, draft_y = width / image.width, height / image.height
+                box = find_table_box(image) if self.crop else None
+                if box is not None:
+                    image = image.crop(box)
+                    offset_x, offset_y = round(box[0] * draft_x), round(box[1] * draft_y)
+                else:
+                    offset_x, offset_y = 0, 0
+                cropped_width, cropped_height = image.size
+                if max(image.size) > self.max_edge:
+                    image.thumbnail((self.max_edge, self.max_edge), Image.Resampling.LANCZOS)
+                buffer = io.BytesIO()
+                image.save(buffer, "JPEG", quality=self.quality, optimize=True)
+                new_width, new_height = image.size
+        except (UnidentifiedImageError, OSError, ValueError) as e:
+            logger.warning("画像を前処理できないため，そのまま送信します: %s", e)
+            return PreprocessedImage(content)
+
+        processed = buffer.getvalue()
+        if (
+            len(processed) >= len(content)
+            and orientation in (None, 1)
+            and box is None
+            and (new_width, new_height) == (width, height)
+        ):
+            return PreprocessedImage(content)
+        logger.debug(
+            "画像を前処理しました: %dx%d(%dバイト) -> %dx%d(%dバイト)，切り抜いた範囲: %s",
+            width, height, len(content), new_width, new_height, len(processed), box,
+        )
+
+        return PreprocessedImage(
+            processed,
+            draft_x * cropped_width / new_width,
+            draft_y * cropped_height / new_height,
+            offset_x,
+            offset_y,
+        )
+
+
+def find_table_box(image: Image.Image) -> Optional[tuple[int, int, int, int]]:
+    """画像の中の表の範囲を，輪郭の画素の行・列ごとの数(射影)から推定する関数
+    Args:
+        image (Image.Image): グレースケールかRGBの画像(向きを補正したもの)
+    Returns:
+        tuple[int, int, int, int] | None: 表の範囲(左，上，右，下)．
+            表が画像のほぼ全体を占める場合や，検出できない場合はNone
+    Notes:
+        長辺DETECT_EDGEピクセルに縮小した画像で，隣り合う画素の明るさの差がEDGE_THRESHOLD以上の画素を
+        輪郭とみなす．行・列ごとの輪郭の画素の数を平滑化し，最大値のPROFILE_RATIO以上の行・列が
+        最も多く続く範囲(PROFILE_GAP以下の空白は続いているものとする)を表の範囲とする．
+        文字と罫線が密集する表は輪郭の画素が多く，机や手は輪郭が少ないことを利用する
+    Examples:
+        >>> from PIL import ImageDraw
+        >>> desk = Image.new("L", (2000, 1500), 90)
+        >>> draw = ImageDraw.Draw(desk)
+        >>> draw.rectangle((600, 300, 1400, 1200), fill=240)
+        >>> for y in range(330, 1180, 40):
+        ...     for x in range(640, 1360, 30):
+        ...         draw.rectangle((x, y, x + 12, y + 20), fill=30)
+        >>> find_table_box(desk)
+        (539, 266, 1469, 1270)
+        >>> find_table_box(Image.new("L", (800, 600), 255)) is None
+        True
+    """
+    width, height = image.size
+    ratio = min(1.0, DETECT_EDGE / max(width, height))
+    small = image.convert("L").resize(
+        (max(1, round(width * ratio)), max(1, round(height * ratio))), Image.Resampling.BILINEAR
+    )
+    pixels = np.asarray(small, dtype=np.int16)
+    edges = np.zeros(pixels.shape, dtype=bool)
+    edges[:, 1:] |= np.abs(np.diff(pixels, axis=1)) >= EDGE_THRESHOLD
+    edges[1:, :] |= np.abs(np.diff(pixels, axis=0)) >= EDGE_THRESHOLD
+    if not edges.any():
+        return None
+
+    gap = max(1, round(max(pixels.shape) * PROFILE_GAP))
+    top, bottom = _densest_span(edges.sum(axis=1), gap)
+    left, right = _densest_span(edges[top:bottom].sum(axis=0), gap)
+    # 余白を付けて元の画像の座標に戻す
+    pad_x = round((right - left) * CROP_PADDING)
+    pad_y = round((bottom - top) * CROP_PADDING)
+    box = (
+        max(0, round((left - pad_x) / ratio)),
+        max(0, round((top - pad_y) / ratio)),
+        min(width, round((right + pad_x) / ratio)),
+        min(height, round((bottom + pad_y) / ratio)),
+    )
+    area = (box[2] - box[0]) * (box[3] - box[1]) / (width * height)
+    if not CROP_MIN_AREA <= area <= CROP_MAX_AREA:
+        return None
+
+    return box
+
+
+def _densest_span(profile: np.ndarray, gap: int) -> tuple[int, int]:
+    """射影のうち，しきい値以上の値が最も多く続く範囲を返す関数
+    Args:
+        profile (np.ndarray): 行または列ごとの輪郭の画素の数
+        gap (int): 続いているとみなす空白の最大の長さ
+    Returns:
+        tuple[int, int]: 範囲(開始，終了)．終了は範囲に含まない
+    Examples:
+        >>> _densest_span(np.array([0, 9, 0, 0, 0, 0, 8, 9, 0, 7, 9, 0, 0]), gap=1)
+        (6, 11)
+    """
+    # 文字の間の隙間で途切れないよう，gapの幅で平滑化する
+    kernel = np.ones(gap) / gap
+    smoothed = np.convolve(profile, kernel, mode="same") if gap > 1 else profile.astype(float)
+    active = np.flatnonzero(smoothed >= smoothed.max() * PROFILE_RATIO)
+    # gapより長い空白で区切り，しきい値以上の値の合計が最も大きい範囲を選ぶ
+    splits = np.flatnonzero(np.diff(active) > gap + 1) + 1
+    runs = np.split(active, splits)
+    best = max(runs, key=lambda run: profile[run[0]:run[-1] + 1].sum())
+
+    return int(best[0]), int(best[-1]) + 1
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
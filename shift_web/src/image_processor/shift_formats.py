@@ -0,0 +1,248 @@
+"""シフト表の行の書式(文法)を登録し，行の文字列からシフトの日時を読み取るモジュール"""
+
+import dataclasses
+import re
+import threading
+from typing import NamedTuple, Optional
+
+
+# 書式に必須の名前付きグループ(next_dayは任意)
+REQUIRED_GROUPS = ("month", "day", "start_hour", "start_minute", "end_hour", "end_minute")
+OPTIONAL_GROUPS = ("next_day",)
+
+# OCRで誤認識しやすい文字と置き換える文字の対応表
+# I, |, ｜は表の罫線を誤認識したものとして削除する(従来の処理と同じ)
+CONFUSIONS = {
+    "I": "",
+    "|": "",
+    "｜": "",
+    "O": "0",
+    "o": "0",
+    "〇": "0",
+    "l": "1",
+    "／": "/",
+    "：": ":",
+    **{chr(ord("０") + i): str(i) for i in range(10)},
+}
+# 日本語を含む文字列ではstr.translateが1文字ずつ表を引くため，
+# 対象の文字のみを1回の走査で置き換える
+_CONFUSION_PATTERN = re.compile(f"[{re.escape(''.join(CONFUSIONS))}]")
+
+
+def normalize(text: str) -> str:
+    """OCRで誤認識しやすい文字を1回の走査で置き換える関数
+    Args:
+        text (str): 行の文字列
+    Returns:
+        str: 置き換えた文字列
+    Examples:
+        >>> normalize("9/1金|117時OO分２１時3O分")
+        '9/1金117時00分21時30分'
+    """
+    return _CONFUSION_PATTERN.sub(lambda m: CONFUSIONS[m.group()], text)
+
+
+class ShiftMatch(NamedTuple):
+    """行の文字列から読み取ったシフトの日時を記録するクラス
+    Attributes:
+        format_name (str): 一致した書式の名前
+        month (int): 月
+        day (int): 日
+        start_hour (int): 開始時刻の時
+        start_minute (int): 開始時刻の分
+        end_hour (int): 終了時刻の時
+        end_minute (int): 終了時刻の分
+        next_day (bool): 終了時刻が翌日かどうか
+    """
+    format_name: str
+    month: int
+    day: int
+    start_hour: int
+    start_minute: int
+    end_hour: int
+    end_minute: int
+    next_day: bool
+
+
+@dataclasses.dataclass(frozen=True)
+class ShiftFormat:
+    """シフト表の行の書式を記録するクラス
+    Attributes:
+        name (str): 書式の名前
+        pattern (str): 名前付きグループ(REQUIRED_GROUPS，任意でnext_day)を含む正規表現
+    """
+    name: str
+    pattern: str
+
+
+class ShiftFormatRegistry:
+    """書式を登録し，登録された全ての書式を1つの正規表現にまとめて行を照合するクラス
+    Attributes:
+        hits (dict[str, int]): 書式の名前と一致した回数の対応表
+        misses (int): どの書式にも一致しなかった回数
+        _formats (list[ShiftFormat]): 登録された書式(登録順．先に登録したものを優先する)
+        _combined (:obj:`re.Pattern` | None): 全ての書式をまとめた正規表現
+        _group_indexes (dict[str, tuple[str, tuple[int, ...], int | None]]): 書式ごとのグループ(_f0など)の名前と，
+            (書式の名前，REQUIRED_GROUPSに対応する_combined内のグループ番号，next_dayのグループ番号)の対応表
+        _lock (:obj:`threading.Lock`): 書式と統計情報を保護するロック
+    """
+
+    def __init__(self):
+        self.hits: dict[str, int] = dict()
+        self.misses = 0
+        self._formats: list[ShiftFormat] = list()
+        self._combined: Optional[re.Pattern] = None
+        self._group_indexes: dict[str, tuple[str, tuple[int, ...], Optional[int]]] = dict()
+        self._lock = threading.Lock()
+
+    def register(self, name: str, pattern: str) -> None:
+        """書式を登録するメソッド
+        Args:
+            name (str): 書式の名前
+            pattern (str): 名前付きグループを含む正規表現
+        Returns:
+            None
+        Raises:
+            ValueError: 名前が登録済みの場合や，必須の名前付きグループが不足している場合
+        Examples:
+            >>> test_registry = ShiftFormatRegistry()
+            >>> test_registry.register("hm", r"(?P<month>\\d+)/(?P<day>\\d+)")
+            Traceback (most recent call last):
+                ...
+            ValueError: 書式hmに名前付きグループがありません: start_hour, start_minute, end_hour, end_minute
+        """
+        compiled = re.compile(pattern)
+        missing = [g for g in REQUIRED_GROUPS if g not in compiled.groupindex]
+        if missing:
+            raise ValueError(f"書式{name}に名前付きグループがありません: {', '.join(missing)}")
+        with self._lock:
+            if any(f.name == name for f in self._formats):
+                raise ValueError(f"書式{name}は登録済みです")
+            self._formats.append(ShiftFormat(name=name, pattern=pattern))
+            self.hits[name] = 0
+            self._combined, self._group_indexes = self._compile(self._formats)
+
+    def match(self, text: str) -> Optional[ShiftMatch]:
+        """行の文字列を正規化し，登録された書式のいずれかに一致する部分を読み取るメソッド
+        Args:
+            text (str): 行の文字列
+        Returns:
+            ShiftMatch | None: 読み取ったシフトの日時．どの書式にも一致しない場合はNone
+        Notes:
+            全ての書式をまとめた正規表現で1度だけ走査し，最も左で一致した書式を使う．
+            時が3桁の場合は罫線を誤認識したものとして先頭の1桁を除く(例: 117時 -> 17時)
+        Examples:
+            >>> test_registry = _create_default_registry()
+            >>> test_registry.match("9/1金|117時00分21時30分")
+            ShiftMatch(format_name='kanji', month=9, day=1, start_hour=17, start_minute=0, end_hour=21, end_minute=30, next_day=False)
+            >>> test_registry.match("9/22月20時OO分翌日05時00分")
+            ShiftMatch(format_name='kanji', month=9, day=22, start_hour=20, start_minute=0, end_hour=5, end_minute=0, next_day=True)
+            >>> test_registry.match("９/３(水)9:00〜翌13:30")
+            ShiftMatch(format_name='colon', month=9, day=3, start_hour=9, start_minute=0, end_hour=13, end_minute=30, next_day=True)
+            >>> test_registry.match("日付曜日開始終了") is None
+            True
+            >>> test_registry.stats()
+            {'hits': {'kanji': 2, 'colon': 1}, 'misses': 1}
+        """
+        combined = self._combined
+        match = combined.search(normalize(text)) if combined else None
+        if match is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        name, indexes, next_day_index = self._group_indexes[match.lastgroup]
+        with self._lock:
+            self.hits[name] += 1
+
+        month, day, start_hour, start_minute, end_hour, end_minute = match.group(*indexes)
+        # 時は末尾の2桁のみを使う(3桁の場合は先頭の1桁を除く)
+        return ShiftMatch(
+            name,
+            int(month),
+            int(day),
+            int(start_hour[-2:]),
+            int(start_minute),
+            int(end_hour[-2:]),
+            int(end_minute),
+            next_day_index is not None and match.group(next_day_index) is not None,
+        )
+
+    def stats(self) -> dict:
+        """書式ごとの一致した回数と，一致しなかった回数を返すメソッド
+        Args:
+            None
+        Returns:
+            dict: 統計情報
+        Notes:
+            doctestはmatchを参照
+        """
+        with self._lock:
+            return {"hits": dict(self.hits), "misses": self.misses}
+
+    @staticmethod
+    def _compile(
+        formats: list[ShiftFormat],
+    ) -> tuple[re.Pattern, dict[str, tuple[str, tuple[int, ...], Optional[int]]]]:
+        """書式の正規表現を1つにまとめるメソッド
+        Args:
+            formats (list[ShiftFormat]): 書式
+        Returns:
+            tuple[re.Pattern, dict[str, tuple]]: 書式ごとのグループ(_f0，_f1，...)を選択肢とする正規表現と，
+                グループの名前から(書式の名前，REQUIRED_GROUPSのグループ番号，next_dayのグループ番号)への対応表
+        Notes:
+            書式ごとに名前付きグループの名前が重ならないよう，先頭に_f0_などを付ける．
+            一致した後は名前ではなく番号でまとめて取り出す
+        """
+        alternatives = list()
+        for index, shift_format in enumerate(formats):
+            prefix = f"_f{index}_"
+            pattern = re.sub(r"\(\?P<(\w+)>", rf"(?P<{prefix}\1>", shift_format.pattern)
+            pattern = re.sub(r"\(\?P=(\w+)\)", rf"(?P={prefix}\1)", pattern)
+            alternatives.append(f"(?P<_f{index}>{pattern})")
+
+        combined = re.compile("|".join(alternatives))
+        group_indexes = dict()
+        for index, shift_format in enumerate(formats):
+            prefix = f"_f{index}_"
+            group_indexes[f"_f{index}"] = (
+                shift_format.name,
+                tuple(combined.groupindex[prefix + g] for g in REQUIRED_GROUPS),
+                combined.groupindex.get(prefix + "next_day"),
+            )
+
+        return combined, group_indexes
+
+
+def _create_default_registry() -> ShiftFormatRegistry:
+    """標準の書式を登録したレジストリを作成する関数
+    Returns:
+        ShiftFormatRegistry: レジストリ
+    """
+    registry = ShiftFormatRegistry()
+    # 例: 9/1月17時00分21時30分，9/22月20時00分翌日05時00分
+    registry.register(
+        "kanji",
+        r"(?P<month>\d{1,2})/(?P<day>\d{1,2})[月火水木金土日]"
+        r"(?P<start_hour>\d{1,3})時(?P<start_minute>\d{2})分"
+        r"(?P<next_day>翌日)?(?P<end_hour>\d{1,3})時(?P<end_minute>\d{2})分",
+    )
+    # 例: 9/1(月)17:00-21:30，9/22月20:00~翌05:00
+    registry.register(
+        "colon",
+        r"(?P<month>\d{1,2})/(?P<day>\d{1,2})\(?[月火水木金土日]\)?"
+        r"(?P<start_hour>\d{1,3}):(?P<start_minute>\d{2})[-~〜～]"
+        r"(?P<next_day>翌日?)?(?P<end_hour>\d{1,3}):(?P<end_minute>\d{2})",
+    )
+
+    return registry
+
+
+# プロセス内で共有するレジストリ
+registry = _create_default_registry()
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
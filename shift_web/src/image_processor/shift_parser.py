@@ -1,29 +1,139 @@
 """画像から抽出されたデータをシフトデータに変換するモジュール"""
 
 import json
-import re
-from datetime import datetime
+import os
+from datetime import datetime, time, timedelta
+from typing import NamedTuple, Optional
+
+import numpy as np
 
 from src.dataclass.shift import Shift
+from src.dataclass.ocr_result import OcrResult
+from src.image_processor.shift_formats import ShiftFormatRegistry
+from src.image_processor.shift_formats import registry as default_format_registry
+
+
+# 文字の高さが分からない場合に，同じ行とみなすy座標の差の上限(ピクセル)
+LINE_THRESHOLD = 10
+# 同じ行とみなすy座標の差の上限を，文字の高さの中央値の何倍にするか
+LINE_THRESHOLD_FACTOR = 0.5
+
+# 行のまとめ方
+# geometry: 1文字ずつ座標から行にまとめる
+# breaks: Vision APIが検出した行末の区切りで文字列に分け，文字列を座標から行にまとめる
+LAYOUT_GEOMETRY = "geometry"
+LAYOUT_BREAKS = "breaks"
+# 行末を表す区切りの種類(EOL_SURE_SPACE, HYPHEN, LINE_BREAK)
+LINE_END_BREAKS = (3, 4, 5)
+
+
+class SymbolTable(NamedTuple):
+    """文字と中心座標を列ごとにまとめた表
+    Attributes:
+        texts (list[str]): 文字
+        x (:obj:`numpy.ndarray`): 文字を囲む四角形の中心のx座標
+        y (:obj:`numpy.ndarray`): 文字を囲む四角形の中心のy座標
+        heights (:obj:`numpy.ndarray`): 文字を囲む四角形の高さ(左右の辺の長さの平均)
+        skew (float): 文字を囲む四角形の上下の辺から求めた傾き(xが1増えたときのyの増分)
+    """
+    texts: list[str]
+    x: np.ndarray
+    y: np.ndarray
+    heights: np.ndarray
+    skew: float
+
+    @classmethod
+    def from_ocr_result(cls, ocr_result: OcrResult) -> "SymbolTable":
+        """抽出された文字の一覧から表を作成するメソッド
+        Args:
+            ocr_result (OcrResult): 抽出された文字の一覧
+        Returns:
+            SymbolTable: 文字と中心座標の表
+        Examples:
+            >>> from dataclass.ocr_result import OcrResult, OcrSymbol
+            >>> table = SymbolTable.from_ocr_result(OcrResult.from_symbols([OcrSymbol("9", ((35, 23), (52, 23), (52, 49), (35, 49)))]))
+            >>> table.texts, table.x.tolist(), table.y.tolist(), table.heights.tolist(), table.skew
+            (['9'], [43.5], [36.0], [26.0], 0.0)
+            >>>
+            >>> # 傾いた文字は上下の辺の傾きを記録する
+            >>> table = SymbolTable.from_ocr_result(OcrResult.from_symbols([OcrSymbol("1", ((0, 0), (20, 2), (20, 32), (0, 30)))]))
+            >>> table.skew
+            0.1
+        """
+        vertices = np.frombuffer(ocr_result.coords, dtype=np.intc).reshape(-1, 4, 2)
+
+        return cls.from_vertices(ocr_result.texts, vertices)
+
+    @classmethod
+    def from_vertices(cls, texts: list[str], vertices: np.ndarray) -> "SymbolTable":
+        """文字と，文字を囲む四角形の頂点から表を作成するメソッド
+        Args:
+            texts (list[str]): 文字(文字列)
+            vertices (:obj:`numpy.ndarray`): (文字数, 4頂点, xy)の配列
+        Returns:
+            SymbolTable: 文字と中心座標の表
+        Notes:
+            doctestはfrom_ocr_resultを参照
+        """
+        if not texts:
+            empty = np.empty(0, dtype=np.float64)
+            return cls(texts=list(), x=empty, y=empty, heights=empty, skew=0.0)
+
+        # 頂点の平均を中心座標とする(sum(axis=1)より頂点ごとに足す方が速い)
+        x = (vertices[:, 0, 0] + vertices[:, 1, 0] + vertices[:, 2, 0] + vertices[:, 3, 0]) / 4
+        y = (vertices[:, 0, 1] + vertices[:, 1, 1] + vertices[:, 2, 1] + vertices[:, 3, 1]) / 4
+        heights = (
+            (vertices[:, 3, 1] - vertices[:, 0, 1]) + (vertices[:, 2, 1] - vertices[:, 1, 1])
+        ) / 2
+
+        # 上辺(頂点0→1)と下辺(頂点3→2)の変化量の合計から傾きを求める
+        # (1文字ごとの傾きは座標が整数のため粗いので，全ての文字でまとめて計算する)
+        dx = int(vertices[:, 1, 0].sum() - vertices[:, 0, 0].sum()) + int(
+            vertices[:, 2, 0].sum() - vertices[:, 3, 0].sum()
+        )
+        dy = int(vertices[:, 1, 1].sum() - vertices[:, 0, 1].sum()) + int(
+            vertices[:, 2, 1].sum() - vertices[:, 3, 1].sum()
+        )
+        skew = dy / dx if dx > 0 else 0.0
 
-from unittest.mock import MagicMock, patch
+        return cls(texts=texts, x=x, y=y, heights=heights, skew=skew)
 
 
 class ShiftParser:
     """画像から抽出されたデータをシフトデータに変換するモジュール
     Attributes:
-        None
+        line_threshold (float | None): 同じ行とみなすy座標の差の上限(ピクセル)．
+            Noneの場合は文字の高さの中央値にline_threshold_factorを掛けた値を使う
+        line_threshold_factor (float): 文字の高さの中央値に掛ける係数
+        layout (str): 行のまとめ方(LAYOUT_GEOMETRY または LAYOUT_BREAKS)．
+            未指定の場合は環境変数SHIFT_LAYOUT_MODE(既定値はLAYOUT_GEOMETRY)．
+            LAYOUT_BREAKSでVision APIの区切りが座標と矛盾する場合はLAYOUT_GEOMETRYと同じ処理を行う
+        formats (ShiftFormatRegistry): 行の書式を登録したレジストリ
     """
 
-    def __init__(self):
-        pass
+    def __init__(
+        self,
+        line_threshold: Optional[float] = None,
+        line_threshold_factor: float = LINE_THRESHOLD_FACTOR,
+        layout: Optional[str] = None,
+        formats: Optional[ShiftFormatRegistry] = None,
+    ):
+        self.line_threshold = line_threshold
+        self.line_threshold_factor = line_threshold_factor
+        self.layout = layout or os.getenv("SHIFT_LAYOUT_MODE", LAYOUT_GEOMETRY)
+        if self.layout not in (LAYOUT_GEOMETRY, LAYOUT_BREAKS):
+            raise ValueError(f"行のまとめ方が不正です: {self.layout}")
+        # 指定がない場合はプロセス内で共有するレジストリを使う
+        self.formats = formats if formats is not None else default_format_registry
 
     def parse_data_to_shifts(self, result_dir: str) -> list[Shift]:
-        """画像から抽出されたデータを使ってシフトデータを作成するメソッド
+        """response.jsonに保存された抽出結果を使ってシフトデータを作成するメソッド
         Args:
             result_dir (str):画像や抽出結果ファイルを格納するディレクトリへのパス
         Returns:
             list[Shift]: シフトデータ
+        Notes:
+            保存済みの抽出結果を後から再処理するために使う．アップロード時の処理ではparse_ocr_resultを使う
         Examples:
             >>> # --- 1. テスト準備 ---
             >>> from unittest.mock import patch, mock_open
@@ -1073,171 +1183,317 @@ class ShiftParser:
         with open(f"{result_dir}/response.json", "r", encoding="utf-8") as f:
             response = json.load(f)
 
-        # response.jsonの中身から処理に必要な部分のみを取り出す
-        full_text_annotation = response["full_text_annotation"]
-        page = full_text_annotation["pages"][0]
-        context = list()
-        for block in page["blocks"]:
-            for paragraph in block["paragraphs"]:
-                for word in paragraph["words"]:
-                    for symbol in word["symbols"]:
-                        text = symbol["text"]
-                        vertices = symbol["bounding_box"]["vertices"]
-                        context.append({"text": text, "vertices": vertices})
-
-        # "coordinate": (x座標の平均値，y座標の平均値)とする
-        processed_context = list()
-        for d in context:
-            processed_context.append(
-                {
-                    "text": d["text"],
-                    "coordinate": (
-                        (
-                            d["vertices"][0]["x"]
-                            + d["vertices"][1]["x"]
-                            + d["vertices"][2]["x"]
-                            + d["vertices"][3]["x"]
-                        )
-                        / 4,
-                        (
-                            d["vertices"][0]["y"]
-                            + d["vertices"][1]["y"]
-                            + d["vertices"][2]["y"]
-                            + d["vertices"][3]["y"]
-                        )
-                        / 4,
-                    ),
-                }
-            )
-
-        # y座標の平均値で昇順にソート
-        sorted_processed_context = sorted(
-            processed_context, key=lambda x: x["coordinate"][1]
-        )
-
-        # y座標の平均値が近いものでグループ化
-        line_context = list()
-        current_line = [sorted_processed_context[0]]
-        current_y = sorted_processed_context[0]["coordinate"][1]
-        for d in sorted_processed_context[1:]:
-            if abs(d["coordinate"][1] - current_y) < 10:
-                current_line.append(d)
-            else:
-                line_context.append(current_line)
-                current_line = [d]
-            current_y = d["coordinate"][1]
-
-        line_context.append(current_line)  # 最後の行を追加
-
-        # グループ化した行ごとにx座標の平均値で並べ替え
-        sorted_line_context = list()
-        for line in line_context:
-            sorted_line = sorted(line, key=lambda x: x["coordinate"][0])
-            sorted_line_context.append(sorted_line)
+        # Vision APIのレスポンスと，キャッシュから書き出した抽出結果のどちらにも対応する
+        if "full_text_annotation" in response:
+            ocr_result = OcrResult.from_response_dict(response)
+        else:
+            ocr_result = OcrResult.from_dict(response)
 
-        # シフトが入っていない行(00時00分以外)を除外
-        removed_context = list()
-        for sl in sorted_line_context:
-            text = ""
-            for t in sl:
-                text += t["text"]
-            if len(text) >= 16:
-                removed_context.append(text)
-
-        # 誤字(Iや|)を除外
-        cleaned_context = list()
-        for rc in removed_context:
-            cleaned_rc = re.sub(r"[I|]", "", rc)
-            cleaned_context.append(cleaned_rc)
-
-        # patternに一致する文字列を探す
-        pattern = re.compile(
-            r"(\d{1,2}/\d{1,2})[月火水木金土日](\d{1,3})時(\d{2})分(翌日)?(\d{1,3})時(\d{2})分"
-        )
-        result_context = list()
-        for cc in cleaned_context:
-            match = pattern.search(cc)
-            if match:
-                # 一致したグループを抽出
-                date, start_hour, start_min, next_day, end_hour, end_min = (
-                    match.groups()
-                )
-                start_time = f"{start_hour}:{start_min}"
-                two_days = (
-                    True if next_day else False
-                )  # 「翌日」が含まれる場合はフラグを立てる
-                end_time = f"{end_hour}:{end_min}"
-                result_context.append([date, two_days, start_time, end_time])
+        return self.parse_ocr_result(ocr_result)
 
+    def parse_ocr_result(self, ocr_result: OcrResult) -> list[Shift]:
+        """画像から抽出された文字の一覧を使ってシフトデータを作成するメソッド
+        Args:
+            ocr_result (OcrResult): 抽出された文字の一覧
+        Returns:
+            list[Shift]: シフトデータ
+        Notes:
+            doctestはparse_data_to_shiftsを参照
+        """
         # シフトデータの作成
         summary = "バイト"  # summaryは固定
         year = datetime.now().year  # 年は現在のもの
         time_difference = "+09:00:00"  # 時差は+9時間
         timezone = "Asia/Tokyo"  # タイムゾーンは東京(Asia/Tokyo)
         shifts = list()
-        for rc in result_context:
-            date = rc[0].split("/")  # 月と日に分ける
-            two_days = rc[1]  # 日を跨ぐか
-            start_time = rc[2].split(":")  # 時と分に分ける
-            end_time = rc[3].split(":")
-
-            # 時間が3桁になっている場合は2桁にする(例:117->17)
-            if len(start_time[0]) >= 3:
-                start_time[0] = start_time[0][1:]
-
-            if len(end_time[0]) >= 3:
-                end_time[0] = end_time[0][1:]
+        # 文字を行ごとにまとめ，登録された書式のいずれかに一致する行からシフトを読み取る
+        for line in self._build_lines(ocr_result):
+            match = self.formats.match(line)
+            if match is None:
+                continue
 
             # 開始時刻と終了時刻が00時00分になっている日はシフトデータに含めない
-            if start_time == ["00", "00"] and end_time == ["00", "00"]:
+            if not (
+                match.start_hour or match.start_minute or match.end_hour or match.end_minute
+            ):
                 continue
 
-            # yyyy-mm-ddThh:mm:ss+hh:mm:ssの形式にする
             start_datetime = datetime(
                 year=year,
-                month=int(date[0]),
-                day=int(date[1]),
-                hour=int(start_time[0]),
-                minute=int(start_time[1]),
-            )
-            splited_start_datetime = str(start_datetime).split(" ")
-            start_datetime_str = (
-                splited_start_datetime[0]
-                + "T"
-                + splited_start_datetime[1]
-                + time_difference
-            )
-
-            day = int(date[1])
-            # 日を跨ぐ場合は終了日を(開始日+1)にする
-            if two_days:
-                day += 1
-
-            end_datetime = datetime(
-                year=year,
-                month=int(date[0]),
-                day=day,
-                hour=int(end_time[0]),
-                minute=int(end_time[1]),
+                month=match.month,
+                day=match.day,
+                hour=match.start_hour,
+                minute=match.start_minute,
             )
-            splited_end_datetime = str(end_datetime).split(" ")
-            end_datetime_str = (
-                splited_end_datetime[0]
-                + "T"
-                + splited_end_datetime[1]
-                + time_difference
+            # 日を跨ぐ場合は終了日を開始日の翌日にする
+            end_date = start_datetime.date()
+            if match.next_day:
+                end_date += timedelta(days=1)
+            end_datetime = datetime.combine(
+                end_date, time(hour=match.end_hour, minute=match.end_minute)
             )
 
+            # yyyy-mm-ddThh:mm:ss+hh:mm:ssの形式にする
             shift = Shift(
                 summary=summary,
-                start_datetime=start_datetime_str,
-                end_datetime=end_datetime_str,
+                start_datetime=start_datetime.isoformat() + time_difference,
+                end_datetime=end_datetime.isoformat() + time_difference,
                 timezone=timezone,
             )
             shifts.append(shift)
 
         return shifts
 
+    def _build_lines(self, ocr_result: OcrResult) -> list[str]:
+        """layoutに従って，抽出された文字を行ごとの文字列にまとめるメソッド
+        Args:
+            ocr_result (OcrResult): 抽出された文字の一覧
+        Returns:
+            list[str]: 上の行から順に並べた，行ごとの文字列
+        Examples:
+            >>> from dataclass.ocr_result import OcrResult, OcrSymbol
+            >>> def box(x, y):
+            ...     return ((x, y), (x + 10, y), (x + 10, y + 20), (x, y + 20))
+            >>> # Vision APIは表の列ごとに文字を返すことがある(行末の区切りは5)
+            >>> ocr_result = OcrResult.from_symbols(
+            ...     [OcrSymbol("9", box(0, 0)), OcrSymbol("/", box(10, 1)), OcrSymbol("1", box(20, 0)),
+            ...      OcrSymbol("9", box(0, 40)), OcrSymbol("/", box(10, 41)), OcrSymbol("2", box(20, 40)),
+            ...      OcrSymbol("1", box(50, 2)), OcrSymbol("7", box(60, 0)), OcrSymbol("1", box(50, 40)), OcrSymbol("5", box(60, 42))],
+            ...     breaks=[0, 0, 5, 0, 0, 5, 0, 5, 0, 5],
+            ... )
+            >>> ShiftParser(layout="breaks")._build_lines(ocr_result)
+            ['9/117', '9/215']
+            >>> ShiftParser(layout="geometry")._build_lines(ocr_result)
+            ['9/117', '9/215']
+        """
+        table = SymbolTable.from_ocr_result(ocr_result)
+        if self.layout == LAYOUT_BREAKS:
+            segments = self._segments_from_breaks(ocr_result, table)
+            if segments is not None:
+                return self._assemble_lines(segments)
+
+        return self._assemble_lines(table)
+
+    def _segments_from_breaks(
+        self, ocr_result: OcrResult, table: "SymbolTable"
+    ) -> Optional["SymbolTable"]:
+        """Vision APIが検出した行末の区切りで文字を文字列に分け，文字列の表を作成するメソッド
+        Args:
+            ocr_result (OcrResult): 抽出された文字の一覧
+            table (SymbolTable): 抽出された文字の表
+        Returns:
+            SymbolTable | None: 文字列と中心座標の表．区切りがない場合や，区切りの間の文字が
+                1行に収まっていない・左から右に並んでいない場合はNone
+        Examples:
+            >>> from dataclass.ocr_result import OcrResult, OcrSymbol
+            >>> def box(x, y):
+            ...     return ((x, y), (x + 10, y), (x + 10, y + 20), (x, y + 20))
+            >>> symbols = [OcrSymbol("1", box(0, 0)), OcrSymbol("7", box(10, 0)), OcrSymbol("2", box(0, 40)), OcrSymbol("1", box(10, 40))]
+            >>> ocr_result = OcrResult.from_symbols(symbols, breaks=[0, 5, 0, 5])
+            >>> segments = ShiftParser()._segments_from_breaks(ocr_result, SymbolTable.from_ocr_result(ocr_result))
+            >>> segments.texts, segments.x.tolist(), segments.y.tolist()
+            (['17', '21'], [10.0, 10.0], [10.0, 50.0])
+            >>>
+            >>> # 区切りがない場合
+            >>> ocr_result = OcrResult.from_symbols(symbols)
+            >>> ShiftParser()._segments_from_breaks(ocr_result, SymbolTable.from_ocr_result(ocr_result)) is None
+            True
+            >>> # 区切りの間に複数の行の文字が含まれる場合
+            >>> ocr_result = OcrResult.from_symbols(symbols, breaks=[0, 0, 0, 5])
+            >>> ShiftParser()._segments_from_breaks(ocr_result, SymbolTable.from_ocr_result(ocr_result)) is None
+            True
+        """
+        count = len(table.texts)
+        breaks = np.frombuffer(ocr_result.breaks, dtype=np.uint8)
+        if count == 0 or len(breaks) != count:
+            return None
+        ends = np.flatnonzero(np.isin(breaks, LINE_END_BREAKS))
+        if len(ends) == 0:
+            return None
+        if ends[-1] != count - 1:
+            ends = np.append(ends, count - 1)
+        starts = np.concatenate(([0], ends[:-1] + 1))
+
+        # 区切りの間の文字が1行に収まっているかを確認する
+        threshold = self._line_threshold_for(table)
+        baseline_y = table.y - table.skew * table.x if table.skew else table.y
+        spreads = np.maximum.reduceat(baseline_y, starts) - np.minimum.reduceat(
+            baseline_y, starts
+        )
+        if np.any(spreads >= threshold):
+            return None
+
+        # 区切りの間の文字が左から右に並んでいるかを確認する(区切りをまたぐ差は除く)
+        steps = np.diff(table.x)
+        steps[ends[:-1]] = 0
+        if np.any(steps <= -threshold):
+            return None
+
+        # 先頭の文字の左辺と末尾の文字の右辺を結んだ四角形を文字列の頂点とする
+        vertices = np.frombuffer(ocr_result.coords, dtype=np.intc).reshape(-1, 4, 2)
+        segment_vertices = np.stack(
+            (
+                vertices[starts, 0],
+                vertices[ends, 1],
+                vertices[ends, 2],
+                vertices[starts, 3],
+            ),
+            axis=1,
+        )
+        # 文字が全て1文字の場合は，連結した文字列を切り出す方が速い
+        texts = table.texts
+        joined = "".join(texts)
+        if len(joined) == count:
+            segment_texts = [
+                joined[start : end + 1] for start, end in zip(starts.tolist(), ends.tolist())
+            ]
+        else:
+            segment_texts = [
+                "".join(texts[start : end + 1])
+                for start, end in zip(starts.tolist(), ends.tolist())
+            ]
+
+        return SymbolTable.from_vertices(segment_texts, segment_vertices)
+
+    def _assemble_lines(self, table: "SymbolTable") -> list[str]:
+        """文字を座標から行ごとにまとめ，行の文字列を作成するメソッド
+        Args:
+            table (SymbolTable): 文字と中心座標の表
+        Returns:
+            list[str]: 上の行から順に並べた，行ごとの文字列
+        Notes:
+            画像の傾きに沿った基準線からの距離(y - 傾き * x)で文字を並べ，
+            直前の文字との差が閾値(_line_threshold_forを参照)以上の位置で行を分ける．
+            傾きは文字を囲む四角形の辺から推定した後，まとめた行ごとの回帰で求め直す
+        Examples:
+            >>> from dataclass.ocr_result import OcrResult, OcrSymbol
+            >>> def box(x, y, size=10, skew=0.0):
+            ...     return tuple((x + dx, round(y + dy + skew * (x + dx))) for dx, dy in ((0, 0), (size, 0), (size, size * 2), (0, size * 2)))
+            >>> ocr_result = OcrResult.from_symbols([
+            ...     OcrSymbol("時", box(40, 52)), OcrSymbol("1", box(0, 3)), OcrSymbol("7", box(20, 50)),
+            ...     OcrSymbol("2", box(20, 0)), OcrSymbol("1", box(0, 55)),
+            ... ])
+            >>> ShiftParser()._assemble_lines(SymbolTable.from_ocr_result(ocr_result))
+            ['12', '17時']
+            >>> ShiftParser()._assemble_lines(SymbolTable.from_ocr_result(OcrResult()))
+            []
+            >>>
+            >>> # 高解像度の画像では文字の揺らぎが10ピクセルを超えても同じ行にまとめる
+            >>> ocr_result = OcrResult.from_symbols([
+            ...     OcrSymbol("1", box(0, 0, 60)), OcrSymbol("7", box(70, 14, 60)), OcrSymbol("時", box(140, 2, 60)),
+            ...     OcrSymbol("2", box(0, 240, 60)), OcrSymbol("1", box(70, 254, 60)),
+            ... ])
+            >>> ShiftParser(line_threshold=10)._assemble_lines(SymbolTable.from_ocr_result(ocr_result))
+            ['1時', '7', '2', '1']
+            >>> ShiftParser()._assemble_lines(SymbolTable.from_ocr_result(ocr_result))
+            ['17時', '21']
+            >>>
+            >>> # 傾いた画像では，右端の文字が次の行の左端の文字より下にあっても行を分けられる
+            >>> ocr_result = OcrResult.from_symbols(
+            ...     [OcrSymbol(c, box(i * 12, 0, skew=0.15)) for i, c in enumerate("9/1月17時00分")]
+            ...     + [OcrSymbol(c, box(i * 12, 25, skew=0.15)) for i, c in enumerate("9/2火15時00分")]
+            ... )
+            >>> ShiftParser()._assemble_lines(SymbolTable.from_ocr_result(ocr_result))
+            ['9/1月17時00分', '9/2火15時00分']
+        """
+        if len(table.texts) == 0:
+            return list()
+
+        threshold = self._line_threshold_for(table)
+        y_order, line_ids = self._cluster_lines(table, table.skew, threshold)
+
+        # まとめた行の中でのyとxの関係から傾きを求め直し，画像の幅全体で基準線が
+        # 閾値の1/4以上ずれる場合のみ改めて行に分ける
+        skew = self._fit_skew(table, y_order, line_ids, table.skew)
+        if abs(skew - table.skew) * float(np.ptp(table.x)) >= threshold / 4:
+            y_order, line_ids = self._cluster_lines(table, skew, threshold)
+
+        # 行ごとにx座標の平均値で並べ替え(行番号が第1キー，x座標が第2キー)
+        order = y_order[np.lexsort((table.x[y_order], line_ids))]
+        line_starts = np.flatnonzero(np.diff(line_ids)) + 1
+
+        texts = table.texts
+        sorted_texts = [texts[i] for i in order.tolist()]
+        bounds = [0, *line_starts.tolist(), len(sorted_texts)]
+
+        return ["".join(sorted_texts[a:b]) for a, b in zip(bounds[:-1], bounds[1:])]
+
+    def _line_threshold_for(self, table: "SymbolTable") -> float:
+        """同じ行とみなすy座標の差の上限を求めるメソッド
+        Args:
+            table (SymbolTable): 文字と中心座標の表
+        Returns:
+            float: 閾値(ピクセル)．line_thresholdが指定されている場合はその値
+        Examples:
+            >>> from dataclass.ocr_result import OcrResult, OcrSymbol
+            >>> table = SymbolTable.from_ocr_result(OcrResult.from_symbols([
+            ...     OcrSymbol("9", ((0, 0), (20, 0), (20, 30), (0, 30))),
+            ...     OcrSymbol("/", ((20, 0), (30, 0), (30, 40), (20, 40))),
+            ...     OcrSymbol("1", ((30, 0), (50, 0), (50, 120), (30, 120))),
+            ... ]))
+            >>> ShiftParser()._line_threshold_for(table)
+            20.0
+            >>> ShiftParser(line_threshold=10)._line_threshold_for(table)
+            10
+        """
+        if self.line_threshold is not None:
+            return self.line_threshold
+        # 文字の高さは外れ値(罫線などの誤認識)があるため中央値を使う
+        median_height = float(np.median(table.heights))
+        if median_height <= 0:
+            return LINE_THRESHOLD
+
+        return median_height * self.line_threshold_factor
+
+    def _cluster_lines(
+        self, table: "SymbolTable", skew: float, threshold: float
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """基準線からの距離で文字を並べ，行番号を振るメソッド
+        Args:
+            table (SymbolTable): 文字と中心座標の表
+            skew (float): 基準線の傾き
+            threshold (float): 同じ行とみなす差の上限
+        Returns:
+            tuple[numpy.ndarray, numpy.ndarray]: 基準線からの距離で並べた文字の添字と，その順に並べた行番号
+        """
+        baseline_y = table.y - skew * table.x if skew else table.y
+        # 基準線からの距離で昇順にソート(同じ値の場合は元の順序を保つ)
+        y_order = np.argsort(baseline_y, kind="stable")
+
+        # 直前の文字との差がthreshold以上の位置で行を分ける
+        line_ids = np.concatenate(
+            ([0], np.cumsum(np.diff(baseline_y[y_order]) >= threshold))
+        )
+
+        return y_order, line_ids
+
+    def _fit_skew(
+        self,
+        table: "SymbolTable",
+        y_order: np.ndarray,
+        line_ids: np.ndarray,
+        default: float,
+    ) -> float:
+        """行ごとの中心を揃えたときのyとxの回帰係数から傾きを求めるメソッド
+        Args:
+            table (SymbolTable): 文字と中心座標の表
+            y_order (numpy.ndarray): _cluster_linesで並べた文字の添字
+            line_ids (numpy.ndarray): _cluster_linesで振った行番号
+            default (float): 傾きを求められない場合に返す値
+        Returns:
+            float: 傾き
+        """
+        x = table.x[y_order]
+        y = table.y[y_order]
+        counts = np.bincount(line_ids)
+        dx = x - (np.bincount(line_ids, weights=x) / counts)[line_ids]
+        dy = y - (np.bincount(line_ids, weights=y) / counts)[line_ids]
+        sxx = float(dx @ dx)
+        if sxx == 0:
+            return default
+
+        return float(dx @ dy) / sxx
+
 
 if __name__ == "__main__":
     import doctest
@@ -1,47 +1,110 @@
 """Vision APIとアプリケーション間のやり取りを行うモジュール"""
 
-from dotenv import load_dotenv
 import os
-
-load_dotenv("src/.env")
-from google.cloud import vision
+import asyncio
 import json
-from google.oauth2 import service_account
+import logging
+import threading
+import weakref
+from typing import Callable, Optional
+
+from src.image_processor.image_source import ImageSource, read_image
+from src.image_processor.ocr_cache import OcrCache, get_default_ocr_cache
+from src.dataclass.ocr_result import OcrResult
+from src.utils import run_in_background
+from src.token_cache import VISION_SCOPES, load_credentials
+from src import metrics
+
+
+class VisionApiError(RuntimeError):
+    """Vision APIがエラーのレスポンス(response.error)を返した場合の例外
+    Attributes:
+        code (int): エラーコード(google.rpc.Codeの値)
+        message (str): エラーメッセージ
+    """
 
-from unittest.mock import MagicMock, patch
+    def __init__(self, code: int, message: str):
+        super().__init__(f"Vision APIで文字を抽出できませんでした(code={code}): {message}")
+        self.code = code
+        self.message = message
 
 
 class VisionClient:
     """Vision APIを使って画像からデータを抽出するクラス
     Attributes:
         _api_key (str): Vision APIを利用するための鍵のパス
-        _creds (:obj:`google.oauth2.service_account.Credentials`): 認証情報
+        _creds (:obj:`google.auth.credentials.Credentials` | None): 認証情報(アクセストークンはプロセス間で共有する)．clientが渡された場合はNone
         _client (:obj:`google.cloud.vision_v1.ImageAnnotatorClient`): Vision APIとのやりとりを担うオブジェクト
+        _async_client_factory (Callable[[], ImageAnnotatorAsyncClient] | None): 非同期のクライアントを作成する関数．
+            Noneの場合は非同期の処理でも_clientを別スレッドで呼び出す
+        _async_clients (weakref.WeakKeyDictionary): イベントループと非同期のクライアントの対応表
+        _async_lock (:obj:`threading.Lock`): _async_clientsを保護するロック
+        _ocr_cache (:obj:`OcrCache`): 画像の内容をキーとして抽出結果を保存するオブジェクト
+        _save_response (bool): レスポンスをresponse.jsonに書き出すかどうか
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        ocr_cache: Optional[OcrCache] = None,
+        save_response: Optional[bool] = None,
+        client: Optional["vision.ImageAnnotatorClient"] = None,
+        async_client_factory: Optional[Callable[[], "vision.ImageAnnotatorAsyncClient"]] = None,
+    ):
         self._api_key = os.getenv("GOOGLE_CLOUD_API_KEY_PATH")
-        self._creds = service_account.Credentials.from_service_account_file(
-            self._api_key
-        )
-        self._client = vision.ImageAnnotatorClient(credentials=self._creds)
+        # document_text_detectionを持つクライアントが渡された場合はそれを使う
+        if client is None:
+            # gRPCとprotobufを含み読み込みに時間がかかるため，クライアントを作成する時点で読み込む
+            from google.cloud import vision
+
+            self._creds = load_credentials(self._api_key, VISION_SCOPES)
+            client = vision.ImageAnnotatorClient(credentials=self._creds)
+            if async_client_factory is None:
+                creds = self._creds
 
-    def extract_data_from_image(self, result_dir: str) -> None:
+                def async_client_factory():
+                    return vision.ImageAnnotatorAsyncClient(credentials=creds)
+        else:
+            self._creds = None
+        self._client = client
+        self._async_client_factory = async_client_factory
+        self._async_clients: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+        self._async_lock = threading.Lock()
+        self._ocr_cache = ocr_cache if ocr_cache is not None else get_default_ocr_cache()
+        # 未設定の場合は成果物を保存する設定のときのみ書き出す
+        if save_response is None:
+            save_response = os.getenv("SAVE_OCR_RESPONSE", "1") != "0" and os.getenv(
+                "SHIFT_ARTIFACTS", "1"
+            ) != "0"
+        self._save_response = save_response
+
+    def extract_data_from_image(
+        self, result_dir: str, image: Optional[ImageSource] = None
+    ) -> OcrResult:
         """画像からデータを抽出するメソッド
         Args:
             result_dir (str):画像や抽出結果ファイルを格納するディレクトリへのパス
+            image (ImageSource | None): 画像のパスか内容．Noneの場合はresult_dir/shift.jpgを読み込む
         Returns:
-            None
+            OcrResult: 抽出された文字の一覧
+        Raises:
+            ValueError: 画像のサイズが上限を超えた場合
+        Notes:
+            response.jsonはバックグラウンドで書き出すため，戻り値を受け取った時点では書き出し中の場合がある
         Examples:
             >>> # --- 1. テスト準備 ---
             >>> from unittest.mock import patch, MagicMock, mock_open
+            >>> from google.cloud import vision
+            >>> from src.utils import wait_for_background
             >>>
             >>> # --- 2. ダミーやモックの設定 ---
             >>> test_result_dir = "result/dummy"
             >>> mock_image_content = b"dummy image data"
             >>> dummy_key_path = "dummy/key.json"
             >>> # MessageToDictが返す辞書データ
-            >>> mock_response_dict = {"text_annotations": [{"description": "test"}]}
+            >>> mock_response_dict = {"full_text_annotation": {"pages": [{"blocks": [{"paragraphs": [{"words": [{"symbols": [
+            ...     {"bounding_box": {"vertices": [{"x": 35, "y": 23}, {"x": 52, "y": 23}, {"x": 52, "y": 49}, {"x": 35, "y": 49}]}, "text": "9"},
+            ... ]}]}]}]}]}}
+            >>> mock_api_response = vision.AnnotateImageResponse(mock_response_dict) # Vision APIからのレスポンス
             >>>
             >>> # --- 3. 外部依存をモック化してテストを実行 ---
             >>> with patch('os.getenv', return_value=dummy_key_path), \\
@@ -52,15 +115,18 @@ class VisionClient:
             ...      patch("builtins.open", mock_open(read_data=mock_image_content)) as mock_file, \\
             ...      patch("json.dump") as mock_json_dump:
             ...     # --- モックのインスタンスと返り値を設定 ---
-            ...     mock_api_response = MagicMock() # Vision APIからのレスポンスを模したMagicMockオブジェクト
             ...     mock_client_instance = MockClient.return_value  # self._client == mock_client_instanceとなるようにする
             ...     mock_client_instance.document_text_detection.return_value = mock_api_response
             ...     mock_image_instance = MockImage.return_value    # image == mock_image_instanceとなるようにする
             ...     MockResponse.to_dict.return_value = mock_response_dict
             ...
             ...     # --- 4. テスト対象の実行 ---
-            ...     test_client = VisionClient()
-            ...     test_client.extract_data_from_image(test_result_dir)
+            ...     test_client = VisionClient(ocr_cache=OcrCache(), save_response=True)
+            ...     ocr_result = test_client.extract_data_from_image(test_result_dir)
+            ...     # 同じ画像の2回目はキャッシュを使う
+            ...     cached_ocr_result = test_client.extract_data_from_image(test_result_dir)
+            ...     # バックグラウンドでのresponse.jsonの書き出しを待つ
+            ...     wait_for_background()
             ...
             >>> # --- 5. 結果の検証 ---
             >>> mock_from_file.assert_called_once_with(dummy_key_path)
@@ -74,24 +140,280 @@ class VisionClient:
             >>> # document_text_detectionが正しい引数で呼び出されたか
             >>> mock_client_instance.document_text_detection.assert_called_once_with(image=mock_image_instance)
             >>>
-            >>> # APIレスポンスが辞書に変換されたか
+            >>> # APIレスポンスがresponse.jsonの書き出しのためにのみ辞書に変換されたか
             >>> MockResponse.to_dict.assert_called_once_with(mock_api_response)
             >>>
             >>> # JSONファイルが正しく書き込まれたか
             >>> mock_file.assert_any_call(f"{test_result_dir}/response.json", "w", encoding="utf-8")
             >>> write_handle = mock_file()
-            >>> mock_json_dump.assert_called_with(mock_response_dict, write_handle, ensure_ascii=False, indent=2)
+            >>> mock_json_dump.assert_any_call(mock_response_dict, write_handle, ensure_ascii=False, indent=2)
+            >>>
+            >>> # 抽出された文字が返されたか
+            >>> ocr_result.symbols
+            [OcrSymbol(text='9', vertices=((35, 23), (52, 23), (52, 49), (35, 49)))]
+            >>>
+            >>> # 2回目はキャッシュから取得され，Vision APIは1回しか呼ばれていない
+            >>> test_client._ocr_cache.stats()["hits"]
+            1
+            >>> cached_ocr_result == ocr_result
+            True
+        """
+        # 読み込みながら計算したハッシュ値(OcrCache.key_forと同じ値)をキーとする
+        content, cache_key = read_image(
+            image if image is not None else f"{result_dir}/shift.jpg"
+        )
+
+        # 同じ画像を処理したことがあればVision APIを呼ばずに結果を使う
+        cached_dict = self._get_cached(cache_key)
+        response = None
+        if cached_dict is None:
+            from google.cloud import vision
+
+            image = vision.Image(content=content)
+            with metrics.registry.span("ocr"):
+                try:
+                    response = self._client.document_text_detection(image=image)
+                except Exception as e:
+                    metrics.registry.inc(metrics.API_ERRORS, api="vision", status=type(e).__name__)
+                    raise
+
+        return self._to_ocr_result(result_dir, cache_key, response, cached_dict)
+
+    async def extract_data_from_image_async(
+        self, result_dir: str, image: Optional[ImageSource] = None
+    ) -> OcrResult:
+        """extract_data_from_imageの非同期版．Vision APIの応答を待つ間はイベントループを解放する
+        Args:
+            result_dir (str):画像や抽出結果ファイルを格納するディレクトリへのパス
+            image (ImageSource | None): 画像のパスか内容．Noneの場合はresult_dir/shift.jpgを読み込む
+        Returns:
+            OcrResult: 抽出された文字の一覧
+        Raises:
+            ValueError: 画像のサイズが上限を超えた場合
+        Notes:
+            ImageAnnotatorAsyncClientはイベントループごとに作成する．
+            非同期のクライアントがない場合(同期のクライアントのみが渡された場合)は，同期のクライアントを別スレッドで呼び出す
+        Examples:
+            >>> from google.cloud import vision
+            >>> from src.testing.fake_vision import FakeImageAnnotatorAsyncClient, FakeImageAnnotatorClient
+            >>> mock_response_dict = {"full_text_annotation": {"pages": [{"blocks": [{"paragraphs": [{"words": [{"symbols": [
+            ...     {"bounding_box": {"vertices": [{"x": 35, "y": 23}, {"x": 52, "y": 23}, {"x": 52, "y": 49}, {"x": 35, "y": 49}]}, "text": "9"},
+            ... ]}]}]}]}]}}
+            >>> fake_async_client = FakeImageAnnotatorAsyncClient(lambda content: vision.AnnotateImageResponse(mock_response_dict), latency=0.01)
+            >>> test_client = VisionClient(
+            ...     ocr_cache=OcrCache(), save_response=False,
+            ...     client=FakeImageAnnotatorClient(lambda content: vision.AnnotateImageResponse()),
+            ...     async_client_factory=lambda: fake_async_client,
+            ... )
+            >>> async def extract_all():
+            ...     return await asyncio.gather(*[
+            ...         test_client.extract_data_from_image_async("result/dummy", image=f"image {i}".encode()) for i in range(3)
+            ...     ])
+            >>> [ocr_result.texts for ocr_result in asyncio.run(extract_all())]
+            [['9'], ['9'], ['9']]
+            >>> fake_async_client.calls, test_client._client.calls
+            (3, 0)
+        """
+        content, cache_key = await asyncio.to_thread(
+            read_image, image if image is not None else f"{result_dir}/shift.jpg"
+        )
+
+        cached_dict = self._get_cached(cache_key)
+        response = None
+        if cached_dict is None:
+            from google.cloud import vision
+
+            image = vision.Image(content=content)
+            with metrics.registry.span("ocr"):
+                try:
+                    async_client = self._get_async_client()
+                    if async_client is not None:
+                        response = await async_client.document_text_detection(image=image)
+                    else:
+                        response = await asyncio.to_thread(
+                            self._client.document_text_detection, image=image
+                        )
+                except Exception as e:
+                    metrics.registry.inc(metrics.API_ERRORS, api="vision", status=type(e).__name__)
+                    raise
+
+        return self._to_ocr_result(result_dir, cache_key, response, cached_dict)
+
+    def get_prepared(self, result_dir: str, source_key: str) -> Optional[tuple[OcrResult, Optional[tuple]]]:
+        """前処理する前の画像のキーから，以前の抽出結果と座標の変換を取得するメソッド
+        Args:
+            result_dir (str): 抽出結果ファイルを格納するディレクトリへのパス
+            source_key (str): 前処理する前の画像と前処理の設定から作成したキー
+        Returns:
+            tuple[OcrResult, tuple | None] | None: (抽出結果，put_preparedで記録した座標の変換)．ない場合はNone
+        Notes:
+            同じ画像が再びアップロードされた場合に，判定・前処理(画像のデコード)を行わずに
+            抽出結果を使うためのもの．抽出結果は前処理した画像のキーで保存したものを参照する
+        Examples:
+            >>> from google.cloud import vision
+            >>> from src.testing.fake_vision import FakeImageAnnotatorClient
+            >>> test_client = VisionClient(
+            ...     ocr_cache=OcrCache(), save_response=False,
+            ...     client=FakeImageAnnotatorClient(lambda content: vision.AnnotateImageResponse({"text_annotations": [{"description": "9"}]})),
+            ... )
+            >>> test_client.get_prepared("result/dummy", "source-key") is None
+            True
+            >>> _ = test_client.extract_data_from_image("result/dummy", image=b"prepared image")
+            >>> test_client.put_prepared("source-key", b"prepared image", (2.0, 2.0, 0, 0))
+            >>> test_client.get_prepared("result/dummy", "source-key")[1], test_client._client.calls
+            ((2.0, 2.0, 0, 0), 1)
         """
-        with open(f"{result_dir}/shift.jpg", "rb") as f:
-            content = f.read()
-        image = vision.Image(content=content)
+        entry = self._ocr_cache.get(source_key)
+        if entry is None:
+            return None
+        cached_dict = self._ocr_cache.get(entry["ocr_key"])
+        if cached_dict is None:
+            return None
+        logging.getLogger("__main__").getChild("vision_client").debug(
+            "前処理する前の画像からキャッシュされた抽出結果を使います。(%s)", source_key
+        )
+        metrics.registry.inc(metrics.OCR_CACHE, result="hit")
+        ocr_result = self._to_ocr_result(result_dir, entry["ocr_key"], None, cached_dict)
+        transform = tuple(entry["transform"]) if entry["transform"] is not None else None
 
-        response = self._client.document_text_detection(image=image)
+        return ocr_result, transform
 
-        # Vision APIからのレスポンスを辞書型に変換
-        response_dict = vision.AnnotateImageResponse.to_dict(response)
-        with open(f"{result_dir}/response.json", "w", encoding="utf-8") as f:
-            json.dump(response_dict, f, ensure_ascii=False, indent=2)
+    def put_prepared(self, source_key: str, image: bytes, transform: Optional[tuple]) -> None:
+        """前処理する前の画像のキーと，Vision APIに送った画像・座標の変換の対応を記録するメソッド
+        Args:
+            source_key (str): 前処理する前の画像と前処理の設定から作成したキー
+            image (bytes): Vision APIに送った(前処理した)画像の内容
+            transform (tuple | None): 座標を元の画像に戻すOcrResult.scaledの引数
+        Returns:
+            None
+        Notes:
+            doctestはget_preparedを参照
+        """
+        self._ocr_cache.put(
+            source_key,
+            {"ocr_key": OcrCache.key_for(image), "transform": list(transform) if transform is not None else None},
+        )
+
+    def _get_async_client(self) -> Optional["vision.ImageAnnotatorAsyncClient"]:
+        """実行中のイベントループ専用の非同期のクライアントを取得するメソッド
+        Returns:
+            ImageAnnotatorAsyncClient | None: 非同期のクライアント．作成する関数がない場合はNone
+        Notes:
+            gRPCの非同期のチャネルは作成したイベントループでしか使えないため，ループごとに作成する
+        """
+        if self._async_client_factory is None:
+            return None
+        loop = asyncio.get_running_loop()
+        with self._async_lock:
+            async_client = self._async_clients.get(loop)
+            if async_client is None:
+                async_client = self._async_clients[loop] = self._async_client_factory()
+
+        return async_client
+
+    def _get_cached(self, cache_key: str) -> Optional[dict]:
+        """キャッシュされた抽出結果を取得し，参照結果を記録するメソッド
+        Args:
+            cache_key (str): 画像のハッシュ値
+        Returns:
+            dict | None: 抽出結果(OcrResult.to_dictの形式)．ない場合はNone
+        """
+        cached_dict = self._ocr_cache.get(cache_key)
+        if cached_dict is not None:
+            logging.getLogger("__main__").getChild("vision_client").debug(
+                "キャッシュされた抽出結果を使います。(%s)", cache_key
+            )
+            metrics.registry.inc(metrics.OCR_CACHE, result="hit")
+        else:
+            metrics.registry.inc(metrics.OCR_CACHE, result="miss")
+
+        return cached_dict
+
+    def _to_ocr_result(
+        self,
+        result_dir: str,
+        cache_key: str,
+        response: Optional["vision.AnnotateImageResponse"],
+        cached_dict: Optional[dict],
+    ) -> OcrResult:
+        """Vision APIのレスポンスかキャッシュから抽出結果を作成し，キャッシュと書き出しを行うメソッド
+        Args:
+            result_dir (str): 抽出結果ファイルを格納するディレクトリへのパス
+            cache_key (str): 画像のハッシュ値
+            response (vision.AnnotateImageResponse | None): レスポンス．キャッシュを使う場合はNone
+            cached_dict (dict | None): キャッシュされた抽出結果
+        Returns:
+            OcrResult: 抽出された文字の一覧
+        Raises:
+            VisionApiError: レスポンスがエラーの場合(response.jsonは書き出す)
+        Examples:
+            >>> from google.cloud import vision
+            >>> from src.testing.fake_vision import FakeImageAnnotatorClient
+            >>> error_response = vision.AnnotateImageResponse({"error": {"code": 3, "message": "Bad image data."}})
+            >>> test_client = VisionClient(
+            ...     ocr_cache=OcrCache(), save_response=False,
+            ...     client=FakeImageAnnotatorClient(lambda content: error_response),
+            ... )
+            >>> test_client.extract_data_from_image("result/dummy", image=b"dummy image data")
+            Traceback (most recent call last):
+                ...
+            VisionApiError: Vision APIで文字を抽出できませんでした(code=3): Bad image data.
+            >>> # エラーの結果はキャッシュせず，次回もVision APIに送る
+            >>> try:
+            ...     test_client.extract_data_from_image("result/dummy", image=b"dummy image data")
+            ... except VisionApiError as e:
+            ...     print(e.code, e.message, test_client._client.calls)
+            3 Bad image data. 2
+        """
+        if cached_dict is not None:
+            ocr_result = OcrResult.from_dict(cached_dict)
+        elif response.error.message:
+            # エラーの結果は保存せず，空の抽出結果としてジョブを成功させないよう例外にする
+            metrics.registry.inc(metrics.API_ERRORS, api="vision", status=str(response.error.code))
+            if self._save_response:
+                run_in_background(_write_response, f"{result_dir}/response.json", response)
+            raise VisionApiError(response.error.code, response.error.message)
+        else:
+            # 辞書型には変換せず，レスポンスから文字と座標のみを取り出す
+            ocr_result = OcrResult.from_response(response)
+            self._ocr_cache.put(cache_key, ocr_result.to_dict())
+        metrics.registry.observe(metrics.OCR_SYMBOLS, len(ocr_result.texts))
+
+        # 結果ファイルの書き出しは待たずにシフトデータの作成へ進む
+        if self._save_response:
+            run_in_background(
+                _write_response,
+                f"{result_dir}/response.json",
+                response if cached_dict is None else cached_dict,
+            )
+
+        return ocr_result
+
+
+def _write_response(path: str, response) -> None:
+    """Vision APIのレスポンスをJSONファイルに書き出す関数
+    Args:
+        path (str): 書き出し先のパス
+        response (:obj:`google.cloud.vision.AnnotateImageResponse` | dict): レスポンス．
+            辞書型の場合はそのまま書き出す
+    Returns:
+        None
+    """
+    try:
+        with metrics.registry.span("write_response"):
+            # Vision APIからのレスポンスを辞書型に変換
+            if isinstance(response, dict):
+                response_dict = response
+            else:
+                from google.cloud import vision
+
+                response_dict = vision.AnnotateImageResponse.to_dict(response)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(response_dict, f, ensure_ascii=False, indent=2)
+    except Exception:
+        logging.getLogger("__main__").getChild("vision_client").exception(
+            "%sの書き出しに失敗しました。", path
+        )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,241 @@
+"""アップロードされた画像の処理をバックグラウンドで実行するモジュール"""
+
+import asyncio
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import wait as wait_futures
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+
+from src.dataclass.job import Job, JOB_RUNNING, JOB_SUCCEEDED, JOB_FAILED
+from src.dataclass.shift import Shift
+from src.utils import job_context
+
+
+class JobManager:
+    """画像処理のジョブを受け付け，上限付きのワーカーで実行するクラス
+    Attributes:
+        _runner (Callable[[str], list[Shift]]): 画像へのパスを受け取りシフトデータを返す関数
+        _executor (:obj:`ThreadPoolExecutor`): ジョブを実行するワーカー
+        _jobs (OrderedDict[str, Job]): ジョブIDとジョブの対応表(登録順)
+        _futures (dict[str, Future]): ジョブIDと実行中のFutureの対応表
+        _max_jobs (int): 保持する終了済みジョブの上限
+        _lock (:obj:`threading.Lock`): _jobsと_futuresを保護するロック
+        _async_runner (Callable[[str], Awaitable[list[Shift]]] | None): runnerの非同期版．
+            指定した場合はジョブを専用スレッドのイベントループ上で実行する
+        _max_async_jobs (int): イベントループ上で同時に実行するジョブの上限
+        _loop (:obj:`asyncio.AbstractEventLoop` | None): ジョブを実行するイベントループ
+        _async_slots (:obj:`asyncio.Semaphore` | None): 同時に実行するジョブの数を制限するセマフォ
+    Notes:
+        ジョブはプロセス内に保持するため，他のプロセスからは参照できない．
+        Webサーバを複数のプロセスで起動する場合は，スプールディレクトリでジョブを共有するSpoolQueueを使う
+    """
+
+    def __init__(
+        self,
+        runner: Callable[[str], list[Shift]],
+        max_workers: int = 2,
+        max_jobs: int = 1000,
+        async_runner: Optional[Callable[[str], Awaitable[list[Shift]]]] = None,
+        max_async_jobs: int = 32,
+    ):
+        self._runner = runner
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="shift-job"
+        )
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._futures: dict[str, Future] = dict()
+        self._max_jobs = max_jobs
+        self._lock = threading.Lock()
+        self._async_runner = async_runner
+        self._max_async_jobs = max_async_jobs
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._async_slots: Optional[asyncio.Semaphore] = None
+        if async_runner is not None:
+            self._start_loop()
+
+    def submit(self, image_file_path: str) -> str:
+        """ジョブを登録するメソッド．処理の完了は待たない
+        Args:
+            image_file_path (str): 処理対象の画像へのパス
+        Returns:
+            str: ジョブID
+        Examples:
+            >>> from dataclass.shift import Shift
+            >>>
+            >>> dummy_shifts = [Shift(summary="バイト", start_datetime="2025-04-02T17:00:00+09:00:00", end_datetime="2025-04-02T21:30:00+09:00:00", timezone="Asia/Tokyo")]
+            >>> test_manager = JobManager(runner=lambda path: dummy_shifts, max_workers=1)
+            >>> job_id = test_manager.submit("images/shift.jpg")
+            >>> len(job_id)
+            32
+            >>> job = test_manager.wait(job_id, timeout=5)
+            >>> job.status, job.shifts == dummy_shifts, job.error
+            ('succeeded', True, None)
+            >>>
+            >>> # 失敗したジョブはエラーメッセージを記録する
+            >>> def failing_runner(path):
+            ...     raise RuntimeError("Vision APIに接続できません")
+            >>> test_manager = JobManager(runner=failing_runner, max_workers=1)
+            >>> job = test_manager.wait(test_manager.submit("images/shift.jpg"), timeout=5)
+            >>> job.status, job.error
+            ('failed', 'Vision APIに接続できません')
+            >>>
+            >>> # async_runnerを指定すると，ジョブはイベントループ上で同時に実行される
+            >>> import asyncio
+            >>> async def async_runner(path):
+            ...     await asyncio.sleep(0.2)
+            ...     return dummy_shifts
+            >>> test_manager = JobManager(runner=None, max_workers=1, async_runner=async_runner)
+            >>> job_ids = [test_manager.submit("images/shift.jpg") for _ in range(20)]
+            >>> [test_manager.wait(job_id, timeout=5).status for job_id in job_ids] == ["succeeded"] * 20
+            True
+            >>> test_manager.shutdown()
+        """
+        job = Job(job_id=uuid.uuid4().hex, image_file_path=image_file_path)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._evict_finished_jobs()
+            if self._loop is not None:
+                # concurrent.futures.Futureが返るため，waitはスレッドのワーカーと同様に使える
+                self._futures[job.job_id] = asyncio.run_coroutine_threadsafe(
+                    self._run_job_async(job), self._loop
+                )
+            else:
+                self._futures[job.job_id] = self._executor.submit(self._run_job, job)
+
+        return job.job_id
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """ジョブの現在の状態を取得するメソッド
+        Args:
+            job_id (str): ジョブID
+        Returns:
+            Job | None: ジョブ．存在しない場合はNone
+        Examples:
+            >>> test_manager = JobManager(runner=lambda path: [], max_workers=1)
+            >>> test_manager.get("unknown") is None
+            True
+        """
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[Job]:
+        """ジョブの終了を最大timeout秒待ってから状態を取得するメソッド
+        Args:
+            job_id (str): ジョブID
+            timeout (float | None): 待機する最大秒数．Noneの場合は終了まで待つ
+        Returns:
+            Job | None: ジョブ．存在しない場合はNone
+        Notes:
+            doctestはsubmitを参照
+        """
+        with self._lock:
+            future = self._futures.get(job_id)
+        if future is not None:
+            wait_futures([future], timeout=timeout)
+
+        return self.get(job_id)
+
+    def shutdown(self, wait: bool = True) -> None:
+        """ワーカーを停止するメソッド
+        Args:
+            wait (bool): 実行中のジョブの終了を待つかどうか
+        Returns:
+            None
+        """
+        self._executor.shutdown(wait=wait)
+        if self._loop is not None:
+            if wait:
+                with self._lock:
+                    futures = list(self._futures.values())
+                wait_futures(futures)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def _run_job(self, job: Job) -> None:
+        """ワーカー上でジョブを実行するメソッド
+        Args:
+            job (Job): 実行するジョブ
+        Returns:
+            None
+        """
+        logger = logging.getLogger("__main__").getChild("job_manager")
+        job.status = JOB_RUNNING
+        job.started_at = datetime.now()
+        # ジョブ内で出力したログにはジョブIDを付ける
+        with job_context(job.job_id):
+            try:
+                job.shifts = self._runner(job.image_file_path)
+                job.status = JOB_SUCCEEDED
+            except Exception as e:
+                logger.exception("ジョブ%sの実行に失敗しました。", job.job_id)
+                job.error = str(e)
+                job.status = JOB_FAILED
+            finally:
+                job.finished_at = datetime.now()
+                with self._lock:
+                    self._futures.pop(job.job_id, None)
+
+    async def _run_job_async(self, job: Job) -> None:
+        """イベントループ上でジョブを実行するメソッド(_run_jobの非同期版)
+        Args:
+            job (Job): 実行するジョブ
+        Returns:
+            None
+        """
+        logger = logging.getLogger("__main__").getChild("job_manager")
+        async with self._async_slots:
+            job.status = JOB_RUNNING
+            job.started_at = datetime.now()
+            # タスクごとにコンテキストが分かれるため，同時に実行するジョブのIDは混ざらない
+            with job_context(job.job_id):
+                try:
+                    job.shifts = await self._async_runner(job.image_file_path)
+                    job.status = JOB_SUCCEEDED
+                except Exception as e:
+                    logger.exception("ジョブ%sの実行に失敗しました。", job.job_id)
+                    job.error = str(e)
+                    job.status = JOB_FAILED
+                finally:
+                    job.finished_at = datetime.now()
+                    with self._lock:
+                        self._futures.pop(job.job_id, None)
+
+    def _start_loop(self) -> None:
+        """ジョブを実行するイベントループを専用のスレッドで起動するメソッド
+        Notes:
+            WSGIでもASGIでも同じように動くよう，リクエストを処理するイベントループとは別のループを使う
+        """
+        loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def run_loop() -> None:
+            asyncio.set_event_loop(loop)
+            self._async_slots = asyncio.Semaphore(self._max_async_jobs)
+            started.set()
+            loop.run_forever()
+            loop.close()
+
+        threading.Thread(target=run_loop, name="shift-async-loop", daemon=True).start()
+        started.wait()
+        self._loop = loop
+
+    def _evict_finished_jobs(self) -> None:
+        """保持するジョブが上限を超えた場合に古い終了済みジョブを削除するメソッド
+        Notes:
+            呼び出し側で_lockを取得していること
+        """
+        if len(self._jobs) <= self._max_jobs:
+            return
+        for job_id in [j.job_id for j in self._jobs.values() if j.is_finished]:
+            del self._jobs[job_id]
+            if len(self._jobs) <= self._max_jobs:
+                break
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
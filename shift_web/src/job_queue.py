@@ -0,0 +1,372 @@
+"""Webアプリケーションとパイプラインのデーモン(src/pipeline_daemon.py)の間でジョブを受け渡すモジュール
+
+ジョブはスプールディレクトリ内の1つのJSONファイルとして表し，状態ごとのディレクトリ
+(queued→running→finished)の間を移動させる．queuedからrunningへの移動はリネームで行うため，
+複数のワーカープロセスが同時に取り出しても，1つのジョブを実行するのは1つのワーカーのみとなる．
+"""
+
+import contextlib
+import json
+import os
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from typing import Optional
+
+from src.dataclass.job import Job, JOB_FAILED, JOB_QUEUED, JOB_RUNNING
+
+# スプールディレクトリ(Webアプリケーションとデーモンで同じディレクトリを使う)
+SPOOL_DIR = os.getenv("SHIFT_SPOOL_DIR") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "spool"
+)
+# ジョブの終了やキューへの追加を確かめる間隔(秒)
+POLL_INTERVAL = float(os.getenv("SHIFT_SPOOL_POLL_INTERVAL", 0.2))
+
+# 状態ごとのディレクトリ名
+QUEUED_DIR = "queued"
+RUNNING_DIR = "running"
+FINISHED_DIR = "finished"
+# デーモンの各プロセスが指標(src/metrics.py)を書き出すディレクトリ名
+METRICS_DIR = "metrics"
+
+
+class SpoolQueue:
+    """スプールディレクトリを使い，プロセス間でジョブを受け渡すクラス
+    Attributes:
+        root (str): スプールディレクトリへのパス
+        poll_interval (float): ジョブの終了やキューへの追加を確かめる間隔(秒)
+        max_jobs (int): 保持する終了済みジョブの上限
+    Notes:
+        submit・get・wait・shutdownはJobManagerと同じ使い方ができるため，Webアプリケーションは
+        どちらを使うかを意識しない(shift_app/jobs.pyを参照)
+    Examples:
+        >>> from src.dataclass.shift import Shift
+        >>>
+        >>> test_queue = SpoolQueue(tempfile.mkdtemp())
+        >>> job_id = test_queue.submit("images/shift.jpg")
+        >>> test_queue.get(job_id).status, test_queue.pending()
+        ('queued', 1)
+        >>>
+        >>> # ワーカーが取り出すとrunningになり，他のワーカーは同じジョブを取り出さない
+        >>> job = test_queue.claim()
+        >>> job.job_id == job_id, test_queue.get(job_id).status, test_queue.claim()
+        (True, 'running', None)
+        >>>
+        >>> job.shifts = [Shift(summary="バイト", start_datetime="2025-04-02T17:00:00+09:00:00", end_datetime="2025-04-02T21:30:00+09:00:00", timezone="Asia/Tokyo")]
+        >>> job.status = "succeeded"
+        >>> test_queue.complete(job)
+        >>> finished = test_queue.wait(job_id, timeout=1)
+        >>> finished.status, finished.shifts == job.shifts
+        ('succeeded', True)
+        >>>
+        >>> # デーモンが途中で止まった場合，実行中だったジョブはキューに戻す
+        >>> job_id = test_queue.submit("images/shift.jpg")
+        >>> _ = test_queue.claim()
+        >>> test_queue.requeue_running(), test_queue.get(job_id).status
+        (1, 'queued')
+        >>>
+        >>> # ワーカーが実行中に異常終了した場合，そのワーカーのジョブは失敗として記録する
+        >>> job = test_queue.claim(worker_pid=12345)
+        >>> test_queue.fail_running(12345, "ワーカーが異常終了しました"), test_queue.get(job_id).status
+        (1, 'failed')
+    """
+
+    def __init__(
+        self,
+        root: Optional[str] = None,
+        poll_interval: Optional[float] = None,
+        max_jobs: int = 1000,
+    ):
+        self.root = root or SPOOL_DIR
+        self.poll_interval = poll_interval if poll_interval is not None else POLL_INTERVAL
+        self.max_jobs = max_jobs
+        for name in (QUEUED_DIR, RUNNING_DIR, FINISHED_DIR, METRICS_DIR):
+            os.makedirs(os.path.join(self.root, name), exist_ok=True)
+
+    def submit(self, image_file_path: str) -> str:
+        """ジョブをキューに追加するメソッド．処理の完了は待たない
+        Args:
+            image_file_path (str): 処理対象の画像へのパス
+        Returns:
+            str: ジョブID
+        Notes:
+            doctestはクラスを参照
+        """
+        job = Job(job_id=uuid.uuid4().hex, image_file_path=image_file_path)
+        self._write(QUEUED_DIR, job)
+
+        return job.job_id
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """ジョブの現在の状態を取得するメソッド
+        Args:
+            job_id (str): ジョブID
+        Returns:
+            Job | None: ジョブ．存在しない場合はNone
+        Examples:
+            >>> SpoolQueue(tempfile.mkdtemp()).get("unknown") is None
+            True
+        """
+        # ジョブはqueued→running→finishedの順にのみ移動するため，同じ順に探せば移動中でも見つかる
+        for name in (QUEUED_DIR, RUNNING_DIR, FINISHED_DIR):
+            job = self._read(os.path.join(self.root, name, f"{job_id}.json"))
+            if job is not None:
+                return job
+
+        return None
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[Job]:
+        """ジョブの終了を最大timeout秒待ってから状態を取得するメソッド
+        Args:
+            job_id (str): ジョブID
+            timeout (float | None): 待機する最大秒数．Noneの場合は終了まで待つ
+        Returns:
+            Job | None: ジョブ．存在しない場合はNone
+        Notes:
+            doctestはクラスを参照
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            job = self.get(job_id)
+            if job is None or job.is_finished:
+                return job
+            if deadline is not None and time.monotonic() >= deadline:
+                return job
+            time.sleep(self.poll_interval)
+
+    def shutdown(self, wait: bool = True) -> None:
+        """JobManagerと同じ使い方をするためのメソッド．ジョブは別のプロセスで実行するため何もしない
+        Args:
+            wait (bool): 使わない
+        Returns:
+            None
+        """
+
+    def pending(self) -> int:
+        """キューで待っているジョブの数を返すメソッド
+        Returns:
+            int: ジョブの数
+        Notes:
+            doctestはクラスを参照
+        """
+        return len(self._list(QUEUED_DIR))
+
+    def claim(self, worker_pid: Optional[int] = None) -> Optional[Job]:
+        """キューから最も古いジョブを取り出し，実行中にするメソッド
+        Args:
+            worker_pid (int | None): ジョブを実行するプロセスのID．Noneの場合は呼び出したプロセス
+        Returns:
+            Job | None: 取り出したジョブ．キューが空の場合はNone
+        Notes:
+            doctestはクラスを参照
+        """
+        for name in self._list(QUEUED_DIR):
+            running_path = os.path.join(self.root, RUNNING_DIR, name)
+            try:
+                # リネームに成功したワーカーのみがジョブを実行する
+                os.rename(os.path.join(self.root, QUEUED_DIR, name), running_path)
+            except FileNotFoundError:
+                continue
+            job = self._read(running_path)
+            if job is None:
+                continue
+            job.status = JOB_RUNNING
+            job.started_at = datetime.now()
+            # ワーカーが異常終了した場合に親プロセスがジョブを特定できるよう，プロセスIDも記録する
+            self._write(RUNNING_DIR, job, worker_pid=worker_pid or os.getpid())
+
+            return job
+
+        return None
+
+    def complete(self, job: Job) -> None:
+        """終了したジョブを記録するメソッド
+        Args:
+            job (Job): 終了したジョブ(statusはsucceededまたはfailed)
+        Returns:
+            None
+        Notes:
+            doctestはクラスを参照
+        """
+        if job.finished_at is None:
+            job.finished_at = datetime.now()
+        self._write(FINISHED_DIR, job)
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(os.path.join(self.root, RUNNING_DIR, f"{job.job_id}.json"))
+        self._evict_finished_jobs()
+
+    def requeue_running(self) -> int:
+        """実行中のジョブを全てキューに戻すメソッド．デーモンの起動時に呼ぶ
+        Returns:
+            int: キューに戻したジョブの数
+        Notes:
+            - 前回のデーモンが実行中に止まったジョブを実行し直すためのもの．
+              同じスプールディレクトリを使うデーモンは1つとすること
+            - doctestはクラスを参照
+        """
+        count = 0
+        for name in self._list(RUNNING_DIR):
+            running_path = os.path.join(self.root, RUNNING_DIR, name)
+            job = self._read(running_path)
+            if job is None:
+                continue
+            job.status = JOB_QUEUED
+            job.started_at = None
+            self._write(QUEUED_DIR, job)
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(running_path)
+            count += 1
+
+        return count
+
+    def fail_running(self, worker_pid: int, error: str) -> int:
+        """異常終了したワーカーが実行していたジョブを失敗として記録するメソッド
+        Args:
+            worker_pid (int): 異常終了したワーカーのプロセスID
+            error (str): ジョブに記録するエラーメッセージ
+        Returns:
+            int: 失敗として記録したジョブの数
+        Notes:
+            - ジョブ自体がワーカーを終了させた(メモリ不足など)可能性があるため，キューには戻さない
+            - doctestはクラスを参照
+        """
+        count = 0
+        for name in self._list(RUNNING_DIR):
+            running_path = os.path.join(self.root, RUNNING_DIR, name)
+            try:
+                with open(running_path, encoding="utf-8") as f:
+                    job_dict = json.load(f)
+            except FileNotFoundError:
+                continue
+            if job_dict.get("worker_pid") != worker_pid:
+                continue
+            job = Job.from_dict(job_dict)
+            job.status = JOB_FAILED
+            job.error = error
+            self.complete(job)
+            count += 1
+
+        return count
+
+    def publish_metrics(self, snapshot: dict) -> None:
+        """呼び出したプロセスの指標をスプールディレクトリに書き出すメソッド．同じプロセスの前回の内容は置き換える
+        Args:
+            snapshot (dict): MetricsRegistry.snapshotの戻り値
+        Returns:
+            None
+        Notes:
+            画像処理はデーモンのプロセスで実行されるため，Webアプリケーションはcollect_metricsで
+            読み込んで自身の指標と合わせて出力する
+        Examples:
+            >>> test_queue = SpoolQueue(tempfile.mkdtemp())
+            >>> test_queue.publish_metrics({"shift_shifts_produced_total": {"type": "counter", "help": "", "buckets": [], "series": [[[], 20]]}})
+            >>> [snapshot["shift_shifts_produced_total"]["series"] for snapshot in test_queue.collect_metrics()]
+            [[[[], 20]]]
+            >>> test_queue.clear_metrics()
+            >>> test_queue.collect_metrics()
+            []
+        """
+        self._write_json(os.path.join(self.root, METRICS_DIR, f"{os.getpid()}.json"), snapshot)
+
+    def collect_metrics(self) -> list[dict]:
+        """デーモンの各プロセスが書き出した指標を読み込むメソッド
+        Returns:
+            list[dict]: プロセスごとのMetricsRegistry.snapshotの戻り値
+        Notes:
+            終了したワーカーの指標も残すため，デーモンが起動してからの合計となる．doctestはpublish_metricsを参照
+        """
+        snapshots = list()
+        for name in self._list(METRICS_DIR):
+            with contextlib.suppress(FileNotFoundError):
+                with open(os.path.join(self.root, METRICS_DIR, name), encoding="utf-8") as f:
+                    snapshots.append(json.load(f))
+
+        return snapshots
+
+    def clear_metrics(self) -> None:
+        """書き出された指標を全て削除するメソッド．デーモンの起動時に呼ぶ
+        Returns:
+            None
+        Notes:
+            doctestはpublish_metricsを参照
+        """
+        for name in self._list(METRICS_DIR):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(self.root, METRICS_DIR, name))
+
+    def _list(self, dir_name: str) -> list[str]:
+        """状態ごとのディレクトリ内のジョブのファイル名を古い順に返すメソッド
+        Args:
+            dir_name (str): ディレクトリ名
+        Returns:
+            list[str]: ファイル名
+        """
+        entries = list()
+        with os.scandir(os.path.join(self.root, dir_name)) as it:
+            for entry in it:
+                if not entry.name.endswith(".json"):
+                    continue
+                try:
+                    entries.append((entry.stat().st_mtime, entry.name))
+                except FileNotFoundError:
+                    continue
+
+        return [name for _, name in sorted(entries)]
+
+    def _write(self, dir_name: str, job: Job, **extra) -> None:
+        """ジョブをJSONファイルとして書き出すメソッド．読み込み途中のファイルが見えないよう，置き換えで書き出す
+        Args:
+            dir_name (str): 書き出すディレクトリ名
+            job (Job): ジョブ
+            **extra: ジョブと一緒に記録する値(実行中のワーカーのプロセスIDなど)
+        Returns:
+            None
+        """
+        job_dict = {"image_file_path": job.image_file_path, **job.to_dict(), **extra}
+        self._write_json(os.path.join(self.root, dir_name, f"{job.job_id}.json"), job_dict)
+
+    def _write_json(self, path: str, data: dict) -> None:
+        """辞書をJSONファイルとして置き換えで書き出すメソッド
+        Args:
+            path (str): 書き出すファイルへのパス
+            data (dict): 書き出す辞書
+        Returns:
+            None
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix=".job-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp_path)
+            raise
+
+    @staticmethod
+    def _read(path: str) -> Optional[Job]:
+        """JSONファイルからジョブを読み込むメソッド
+        Args:
+            path (str): ファイルへのパス
+        Returns:
+            Job | None: ジョブ．ファイルがない場合はNone
+        """
+        try:
+            with open(path, encoding="utf-8") as f:
+                return Job.from_dict(json.load(f))
+        except FileNotFoundError:
+            return None
+
+    def _evict_finished_jobs(self) -> None:
+        """保持する終了済みジョブが上限を超えた場合に古いものから削除するメソッド"""
+        names = self._list(FINISHED_DIR)
+        for name in names[: max(0, len(names) - self.max_jobs)]:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(self.root, FINISHED_DIR, name))
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
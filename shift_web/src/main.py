@@ -1,39 +1,152 @@
-import os
-from datetime import datetime
-import shutil
+import asyncio
+import contextlib
 import logging
+from typing import Optional, Union
 
-from src.utils import set_logging
-from src.controller import Controller
+from src.config import load_env
+
+# 環境変数を読み込み時に参照するモジュールより先に，src/.envを読み込む
+load_env()
+
+from src.artifact_store import get_default_artifact_store
+from src.image_processor.image_source import link_or_copy, read_image
+from src.utils import (
+    close_job_log,
+    current_job_id,
+    job_context,
+    set_logging,
+    wait_for_background,
+)
 from src.dataclass.shift import Shift
+from src import metrics
 
 
-def main(image_file_path: str) -> list[Shift]:
+def main(
+    image_file_path: Union[str, bytes], save_artifacts: Optional[bool] = None
+) -> list[Shift]:
     """アプリケーションを立ち上げるための準備をするメソッド
     Args:
-        image_file_path(str): Django上でアップロードされた画像へのパス
+        image_file_path(str | bytes): Django上でアップロードされた画像へのパス，または画像の内容
+        save_artifacts (bool | None): 画像のコピー・抽出結果・ログを残すかどうか．
+            Noneの場合は成果物の保存先の設定(環境変数SHIFT_ARTIFACTS)に従う
     Returns:
         list[Shift]: シフトデータ
     Notes:
         doctest対象外
     """
-    # 結果出力用ファイルの作成
-    now_str = datetime.now().strftime("%Y%m%d%H%M%S")
-    result_dir = f"src/result/{now_str}"
-    os.makedirs(result_dir)
+    with _open_job(image_file_path, save_artifacts) as (result_dir, keep):
+        try:
+            # 画像はresult_dirを経由せずに直接読み込む
+            controller = _create_controller(result_dir=result_dir, image=image_file_path)
+            shifts = controller.run()
+        finally:
+            close_job_log()
+            # 一時ディレクトリを削除する前に，バックグラウンドでの書き出しを待つ
+            if not keep:
+                wait_for_background()
 
-    # ログ設定
-    logger = logging.getLogger(__name__)
-    set_logging(result_dir)
+    return shifts
 
-    # Django上でアップロードされた画像をresult_dirにコピー
-    shutil.copy(image_file_path, f"{result_dir}/shift.jpg")
 
-    controller = Controller(result_dir=result_dir)
-    shifts = controller.run()
+async def main_async(
+    image_file_path: Union[str, bytes], save_artifacts: Optional[bool] = None
+) -> list[Shift]:
+    """mainの非同期版．Vision APIとGoogleカレンダーの応答を待つ間はイベントループを他のジョブに譲る
+    Args:
+        image_file_path(str | bytes): Django上でアップロードされた画像へのパス，または画像の内容
+        save_artifacts (bool | None): mainを参照
+    Returns:
+        list[Shift]: シフトデータ
+    Notes:
+        doctest対象外(benchmarks/bench_async.pyで動作を確かめる)
+    """
+    with _open_job(image_file_path, save_artifacts) as (result_dir, keep):
+        try:
+            controller = _create_controller(result_dir=result_dir, image=image_file_path)
+            shifts = await controller.run_async()
+        finally:
+            close_job_log()
+            if not keep:
+                await asyncio.to_thread(wait_for_background)
 
     return shifts
 
 
+def _create_controller(result_dir: str, image: Union[str, bytes]) -> "Controller":
+    """Controllerを作成する関数
+    Args:
+        result_dir (str): 結果出力用ディレクトリへのパス
+        image (str | bytes): 画像へのパス，または画像の内容
+    Returns:
+        Controller: 作成したController
+    Notes:
+        画像処理(numpy・Pillow・Vision API)のモジュールは最初のジョブで読み込み，
+        Djangoのワーカーの起動時には読み込まない
+    """
+    from src.controller import Controller
+
+    return Controller(result_dir=result_dir, image=image)
+
+
+@contextlib.contextmanager
+def _open_job(image: Union[str, bytes], save_artifacts: Optional[bool]):
+    """ジョブIDと結果出力用ディレクトリを用意し，ログと画像の保存を設定するコンテキストマネージャ
+    Args:
+        image (str | bytes): 画像へのパス，または画像の内容
+        save_artifacts (bool | None): mainを参照
+    Yields:
+        tuple[str, bool]: (結果出力用ディレクトリへのパス，成果物を残すかどうか)
+    """
+    # 結果出力用ディレクトリの作成(ジョブIDごとに分け，同時刻の実行でも衝突しない)
+    artifact_store = get_default_artifact_store()
+    with contextlib.ExitStack() as stack:
+        # ジョブの外で呼ばれた場合は，呼び出しごとに新しいジョブIDを付ける
+        job_id = current_job_id()
+        if job_id is None:
+            job_id = artifact_store.new_job_id()
+            stack.enter_context(job_context(job_id))
+        result_dir = stack.enter_context(
+            artifact_store.open_job(job_id, enabled=save_artifacts)
+        )
+
+        # ログ設定(成果物を残さない場合はジョブごとのファイルに書き出さないが，
+        # SHIFT_LOG_JSONへの書き込みは行う．ジョブが終わったらログファイルを閉じる)
+        keep = save_artifacts if save_artifacts is not None else artifact_store.enabled
+        set_logging(result_dir if keep else None)
+        if keep:
+            # 成果物を残す場合のみ，アップロードされた画像をresult_dirから参照できるようにする
+            # (可能な限りハードリンクとし，内容は複製しない)
+            try:
+                with metrics.registry.span("copy_image"):
+                    _store_image(image, f"{result_dir}/shift.jpg")
+            except BaseException:
+                close_job_log()
+                raise
+
+        yield result_dir, keep
+
+
+def _store_image(image: Union[str, bytes], path: str) -> None:
+    """画像を成果物としてpathに保存する関数
+    Args:
+        image (str | bytes): 画像へのパス，または画像の内容
+        path (str): 保存先のパス
+    Raises:
+        ValueError: 画像のサイズが上限を超えた場合
+    """
+    if isinstance(image, str):
+        link_or_copy(image, path)
+        return
+    # 上限を超える画像は保存しない
+    content, _ = read_image(image)
+    with open(path, "wb") as f:
+        f.write(content)
+
+
 if __name__ == "__main__":
-    main()
+    import sys
+
+    # フォルダ内の画像をまとめて処理する(python -m src.main --helpを参照)
+    from src.bulk import cli
+
+    sys.exit(cli())
@@ -0,0 +1,395 @@
+"""処理の段階ごとの所要時間や件数をプロセス内で集計し，Prometheusのテキスト形式で出力するモジュール"""
+
+import bisect
+import contextlib
+import logging
+import threading
+import time
+from typing import Iterator
+
+
+# 所要時間(秒)のヒストグラムのバケットの上限
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+# 件数(文字数など)のヒストグラムのバケットの上限
+COUNT_BUCKETS = (10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000)
+
+# 段階ごとの所要時間と失敗回数を記録する指標の名前
+STAGE_DURATION = "shift_stage_duration_seconds"
+STAGE_ERRORS = "shift_stage_errors_total"
+# 外部APIの失敗回数，抽出された文字数，キャッシュの参照回数，作成されたシフトデータの件数，
+# Googleカレンダーへの予定の書き込み件数，流量制限による再試行の回数を記録する指標の名前
+API_ERRORS = "shift_api_errors_total"
+OCR_SYMBOLS = "shift_ocr_symbols"
+OCR_CACHE = "shift_ocr_cache_total"
+SHIFTS_PRODUCED = "shift_shifts_produced_total"
+CALENDAR_EVENTS = "shift_calendar_events_total"
+CALENDAR_THROTTLED = "shift_calendar_throttled_total"
+# Vision APIに送る前に不合格にした画像の件数を記録する指標の名前
+IMAGES_REJECTED = "shift_images_rejected_total"
+# アクセストークンを共有のキャッシュから読んだ回数と，更新した回数を記録する指標の名前
+AUTH_TOKENS = "shift_auth_tokens_total"
+
+
+class Histogram:
+    """ラベルの組み合わせごとに観測値をバケットに数えるクラス
+    Attributes:
+        name (str): 指標の名前
+        help (str): 指標の説明
+        buckets (tuple[float, ...]): バケットの上限(昇順．+Infは含めない)
+        _series (dict[tuple, list]): ラベルの組み合わせと[バケットごとの件数，合計，件数]の対応表
+    """
+
+    def __init__(self, name: str, help: str, buckets: tuple = DURATION_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self._series: dict[tuple, list] = dict()
+
+    def observe(self, value: float, labels: tuple = ()) -> None:
+        """観測値を記録するメソッド(呼び出し側でロックを取得すること)
+        Args:
+            value (float): 観測値
+            labels (tuple): (ラベル名，値)の組
+        Returns:
+            None
+        """
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+        # 観測値が入る最小のバケットのみを数え，出力時に累積する
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[0][index] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> list[str]:
+        """Prometheusのテキスト形式の行を返すメソッド
+        Returns:
+            list[str]: 出力する行
+        """
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(labels + (('le', _format_value(bound)),))} {cumulative}"
+                )
+            lines.append(f"{self.name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+
+        return lines
+
+
+class Counter:
+    """ラベルの組み合わせごとに回数を数えるクラス
+    Attributes:
+        name (str): 指標の名前(末尾は_total)
+        help (str): 指標の説明
+        _series (dict[tuple, float]): ラベルの組み合わせと回数の対応表
+    """
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._series: dict[tuple, float] = dict()
+
+    def inc(self, amount: float = 1, labels: tuple = ()) -> None:
+        """回数を増やすメソッド(呼び出し側でロックを取得すること)
+        Args:
+            amount (float): 増やす回数
+            labels (tuple): (ラベル名，値)の組
+        Returns:
+            None
+        """
+        self._series[labels] = self._series.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        """Prometheusのテキスト形式の行を返すメソッド
+        Returns:
+            list[str]: 出力する行
+        """
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._series.items()):
+            lines.append(f"{self.name}{_format_labels(labels)} {_format_value(value)}")
+
+        return lines
+
+
+class MetricsRegistry:
+    """指標を登録し，プロセス内で集計するクラス
+    Attributes:
+        _metrics (dict[str, Histogram | Counter]): 指標の名前と指標の対応表(登録順)
+        _lock (:obj:`threading.Lock`): 全ての指標を保護するロック
+    """
+
+    def __init__(self):
+        self._metrics: dict[str, "Histogram | Counter"] = dict()
+        self._lock = threading.Lock()
+        self.histogram(STAGE_DURATION, "処理の段階ごとの所要時間(秒)")
+        self.counter(STAGE_ERRORS, "処理の段階ごとの失敗回数")
+
+    def histogram(self, name: str, help: str, buckets: tuple = DURATION_BUCKETS) -> Histogram:
+        """ヒストグラムを登録するメソッド．登録済みの場合はそれを返す
+        Args:
+            name (str): 指標の名前
+            help (str): 指標の説明
+            buckets (tuple): バケットの上限
+        Returns:
+            Histogram: ヒストグラム
+        """
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = Histogram(name, help, buckets)
+
+        return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        """カウンタを登録するメソッド．登録済みの場合はそれを返す
+        Args:
+            name (str): 指標の名前
+            help (str): 指標の説明
+        Returns:
+            Counter: カウンタ
+        """
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = Counter(name, help)
+
+        return metric
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        """登録済みのヒストグラムに観測値を記録するメソッド
+        Args:
+            name (str): 指標の名前
+            value (float): 観測値
+            **labels (str): ラベル
+        Returns:
+            None
+        Raises:
+            KeyError: 指標が登録されていない場合
+        """
+        with self._lock:
+            self._metrics[name].observe(value, tuple(sorted(labels.items())))
+
+    def inc(self, name: str, amount: float = 1, **labels: str) -> None:
+        """登録済みのカウンタの回数を増やすメソッド
+        Args:
+            name (str): 指標の名前
+            amount (float): 増やす回数
+            **labels (str): ラベル
+        Returns:
+            None
+        Raises:
+            KeyError: 指標が登録されていない場合
+        """
+        with self._lock:
+            self._metrics[name].inc(amount, tuple(sorted(labels.items())))
+
+    @contextlib.contextmanager
+    def span(self, stage: str, **labels: str) -> Iterator[None]:
+        """処理の段階の所要時間を計測するコンテキストマネージャ
+        Args:
+            stage (str): 段階の名前(例: ocr，parse，calendar_insert)
+            **labels (str): stage以外のラベル
+        Notes:
+            所要時間は成否によらずSTAGE_DURATIONに記録し，例外が発生した場合は
+            STAGE_ERRORSも増やす．ログにも段階名と所要時間を出力する
+        Examples:
+            >>> test_registry = MetricsRegistry()
+            >>> with test_registry.span("parse"):
+            ...     pass
+            >>> try:
+            ...     with test_registry.span("ocr"):
+            ...         raise RuntimeError("Vision APIに接続できません")
+            ... except RuntimeError:
+            ...     pass
+            >>> test_registry.count(STAGE_DURATION, stage="parse"), test_registry.count(STAGE_ERRORS, stage="ocr")
+            (1, 1)
+        """
+        logger = logging.getLogger("__main__").getChild("metrics")
+        labels = dict(labels, stage=stage)
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            yield
+        except BaseException:
+            status = "error"
+            self.inc(STAGE_ERRORS, **labels)
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            self.observe(STAGE_DURATION, duration, **labels)
+            logger.debug("stage=%s status=%s duration=%.6f", stage, status, duration)
+
+    def count(self, name: str, **labels: str) -> float:
+        """指標の現在の回数を返すメソッド(ヒストグラムの場合は観測した件数)
+        Args:
+            name (str): 指標の名前
+            **labels (str): ラベル
+        Returns:
+            float: 回数．記録がない場合は0
+        Notes:
+            doctestはspanを参照
+        """
+        with self._lock:
+            series = self._metrics[name]._series.get(tuple(sorted(labels.items())))
+        if series is None:
+            return 0
+
+        return series[2] if isinstance(series, list) else series
+
+    def snapshot(self) -> dict:
+        """全ての指標をJSONに変換できる辞書にするメソッド．他のプロセスの指標と合わせて出力するためのもの
+        Returns:
+            dict: 指標の名前と{"type", "help", "buckets", "series"}の対応表
+        Notes:
+            doctestはmergeを参照
+        """
+        with self._lock:
+            return {
+                name: {
+                    "type": "histogram" if isinstance(metric, Histogram) else "counter",
+                    "help": metric.help,
+                    "buckets": list(getattr(metric, "buckets", ())),
+                    "series": [
+                        [[list(label) for label in labels], value]
+                        for labels, value in metric._series.items()
+                    ],
+                }
+                for name, metric in self._metrics.items()
+            }
+
+    def merge(self, snapshot: dict) -> None:
+        """snapshotで出力した他のプロセスの指標を加算するメソッド．未登録の指標は登録する
+        Args:
+            snapshot (dict): snapshotの戻り値(JSONから読み込んだものでもよい)
+        Returns:
+            None
+        Examples:
+            >>> import json
+            >>> workers = [MetricsRegistry() for _ in range(2)]
+            >>> for worker in workers:
+            ...     _ = worker.counter("shift_shifts_produced_total", "作成されたシフトデータの件数")
+            ...     worker.inc("shift_shifts_produced_total", 20)
+            ...     with worker.span("parse"):
+            ...         pass
+            >>> total = MetricsRegistry()
+            >>> for worker in workers:
+            ...     total.merge(json.loads(json.dumps(worker.snapshot())))
+            >>> total.count("shift_shifts_produced_total"), total.count(STAGE_DURATION, stage="parse")
+            (40, 2)
+        """
+        for name, entry in snapshot.items():
+            if entry["type"] == "histogram":
+                metric = self.histogram(name, entry["help"], tuple(entry["buckets"]))
+            else:
+                metric = self.counter(name, entry["help"])
+            with self._lock:
+                for labels, value in entry["series"]:
+                    labels = tuple(tuple(label) for label in labels)
+                    if isinstance(metric, Histogram):
+                        series = metric._series.setdefault(labels, [[0] * len(metric.buckets), 0.0, 0])
+                        series[0] = [a + b for a, b in zip(series[0], value[0])]
+                        series[1] += value[1]
+                        series[2] += value[2]
+                    else:
+                        metric._series[labels] = metric._series.get(labels, 0) + value
+
+    def reset(self) -> None:
+        """全ての指標の記録を消すメソッド(指標の登録は残す)．forkした子プロセスで親プロセスの記録を数えないためのもの
+        Returns:
+            None
+        """
+        with self._lock:
+            for metric in self._metrics.values():
+                metric._series.clear()
+
+    def render(self) -> str:
+        """全ての指標をPrometheusのテキスト形式で出力するメソッド
+        Returns:
+            str: 出力
+        Examples:
+            >>> test_registry = MetricsRegistry()
+            >>> _ = test_registry.counter("shift_api_errors_total", "外部APIの失敗回数")
+            >>> test_registry.inc("shift_api_errors_total", api="calendar", status="429")
+            >>> _ = test_registry.histogram("shift_ocr_symbols", "抽出された文字数", buckets=(10, 100))
+            >>> test_registry.observe("shift_ocr_symbols", 37)
+            >>> print(test_registry.render())
+            # HELP shift_stage_duration_seconds 処理の段階ごとの所要時間(秒)
+            # TYPE shift_stage_duration_seconds histogram
+            # HELP shift_stage_errors_total 処理の段階ごとの失敗回数
+            # TYPE shift_stage_errors_total counter
+            # HELP shift_api_errors_total 外部APIの失敗回数
+            # TYPE shift_api_errors_total counter
+            shift_api_errors_total{api="calendar",status="429"} 1
+            # HELP shift_ocr_symbols 抽出された文字数
+            # TYPE shift_ocr_symbols histogram
+            shift_ocr_symbols_bucket{le="10"} 0
+            shift_ocr_symbols_bucket{le="100"} 1
+            shift_ocr_symbols_bucket{le="+Inf"} 1
+            shift_ocr_symbols_sum 37
+            shift_ocr_symbols_count 1
+            <BLANKLINE>
+        """
+        with self._lock:
+            lines = [line for metric in self._metrics.values() for line in metric.render()]
+
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels: tuple) -> str:
+    """ラベルをPrometheusのテキスト形式に変換する関数
+    Args:
+        labels (tuple): (ラベル名，値)の組
+    Returns:
+        str: {name="value",...}．ラベルがない場合は空文字列
+    Examples:
+        >>> print(_format_labels((("stage", "ocr"), ("error", 'a"b'))))
+        {stage="ocr",error="a\\"b"}
+    """
+    if not labels:
+        return ""
+
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _escape(value) -> str:
+    """ラベルの値のバックスラッシュ・二重引用符・改行をエスケープする関数"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    """数値をPrometheusのテキスト形式に変換する関数(整数値は小数点を付けない)
+    Examples:
+        >>> _format_value(1.0), _format_value(0.025), _format_value(3)
+        ('1', '0.025', '3')
+    """
+    if float(value).is_integer():
+        return str(int(value))
+
+    return repr(float(value))
+
+
+# プロセス内で共有する指標
+registry = MetricsRegistry()
+registry.counter(API_ERRORS, "外部APIの失敗回数")
+registry.histogram(OCR_SYMBOLS, "1枚の画像から抽出された文字数", COUNT_BUCKETS)
+registry.counter(OCR_CACHE, "抽出結果のキャッシュの参照回数")
+registry.counter(SHIFTS_PRODUCED, "作成されたシフトデータの件数")
+registry.counter(CALENDAR_EVENTS, "Googleカレンダーへの予定の書き込み件数")
+registry.counter(CALENDAR_THROTTLED, "Googleカレンダーの流量制限を受けて再試行した回数")
+registry.counter(IMAGES_REJECTED, "Vision APIに送る前に不合格にした画像の件数")
+registry.counter(AUTH_TOKENS, "アクセストークンの取得回数(source: cache / refresh)")
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
@@ -0,0 +1,289 @@
+"""画像処理のパイプラインを常駐させ，起動済みのワーカープロセスでジョブを実行するモジュール
+
+親プロセスでVision API・Googleカレンダー・画像処理のモジュールを1度だけ読み込み(preload)，
+gc.freezeの後にforkしたワーカーがスプールディレクトリ(src/job_queue.py)からジョブを取り出して実行する．
+読み込んだモジュールのメモリは，書き込まれるまで親プロセスと全てのワーカーで共有される(copy-on-write)．
+
+Usage:
+    shift_webディレクトリで実行する
+    $ python manage.py pipeline_daemon --workers 4
+"""
+
+import gc
+import logging
+import os
+import signal
+import time
+from datetime import datetime
+from typing import Callable, Optional
+
+from src import metrics
+from src.dataclass.job import JOB_FAILED, JOB_SUCCEEDED
+from src.dataclass.shift import Shift
+from src.job_queue import SpoolQueue
+from src.utils import flush_logs, job_context
+
+# 起動するワーカープロセスの数
+WORKERS = int(os.getenv("SHIFT_DAEMON_WORKERS", 2))
+# 終了したワーカーを起動し直す前に待つ秒数(起動直後に終了し続ける場合に親プロセスが空回りしない)
+RESPAWN_INTERVAL = 1.0
+
+
+def preload() -> None:
+    """ワーカーで使うモジュールを読み込み，forkしても安全なクライアントを作成する関数
+    Returns:
+        None
+    Notes:
+        - gRPCのチャネルはforkした子プロセスでは使えないため，Vision APIはモジュールの読み込みのみ行い，
+          クライアントは各ワーカーの起動時に作成する(init_worker)
+        - Googleカレンダーのクライアント(ディスカバリ文書の解析)は親プロセスで作成して全てのワーカーで共有する．
+          HTTPの接続はワーカーごとに最初のリクエストで作成される
+        - 認証情報がないなどの理由でクライアントを作成できない場合は，各ワーカーの最初のジョブで作成する
+    """
+    logger = logging.getLogger("__main__").getChild("pipeline_daemon")
+    # gRPCとprotobuf・googleapiclient・numpyとPillowを含む
+    from google.cloud import vision  # noqa: F401
+
+    import src.calendar_client  # noqa: F401
+    import src.controller  # noqa: F401
+    import src.main  # noqa: F401
+    from src.client_registry import registry
+
+    try:
+        registry.get("calendar")
+    except Exception as e:
+        logger.warning("Googleカレンダーのクライアントを作成できませんでした。: %s", e)
+
+
+def init_worker() -> None:
+    """forkしたワーカーで，ジョブを受け付ける前にVision APIのクライアントを作成する関数
+    Returns:
+        None
+    """
+    logger = logging.getLogger("__main__").getChild("pipeline_daemon")
+    from src.client_registry import registry
+
+    try:
+        registry.get("vision")
+    except Exception as e:
+        logger.warning("Vision APIのクライアントを作成できませんでした。: %s", e)
+
+
+def work(
+    queue: SpoolQueue,
+    runner: Callable[[str], list[Shift]],
+    should_stop: Callable[[], bool],
+) -> int:
+    """should_stopがTrueを返すまで，キューからジョブを取り出して実行する関数
+    Args:
+        queue (SpoolQueue): ジョブを取り出すキュー
+        runner (Callable[[str], list[Shift]]): 画像へのパスを受け取りシフトデータを返す関数
+        should_stop (Callable[[], bool]): ジョブを取り出す前に呼び，Trueを返したら終了する関数
+    Returns:
+        int: 実行したジョブの数
+    Examples:
+        >>> import tempfile
+        >>> def runner(path):
+        ...     if path.endswith(".txt"):
+        ...         raise ValueError("画像ではありません")
+        ...     return []
+        >>> test_queue = SpoolQueue(tempfile.mkdtemp(), poll_interval=0.01)
+        >>> job_ids = [test_queue.submit(path) for path in ("images/1.jpg", "images/2.txt", "images/3.jpg")]
+        >>> work(test_queue, runner, should_stop=lambda: test_queue.pending() == 0)
+        3
+        >>> [(job.status, job.error) for job in map(test_queue.get, job_ids)]
+        [('succeeded', None), ('failed', '画像ではありません'), ('succeeded', None)]
+        >>> # 記録した指標はWebアプリケーションが読み込めるよう書き出される
+        >>> [snapshot[metrics.STAGE_DURATION]["type"] for snapshot in test_queue.collect_metrics()]
+        ['histogram']
+    """
+    logger = logging.getLogger("__main__").getChild("pipeline_daemon")
+    count = 0
+    while not should_stop():
+        job = queue.claim()
+        if job is None:
+            time.sleep(queue.poll_interval)
+            continue
+        # ジョブ内で出力したログにはジョブIDを付ける
+        with job_context(job.job_id):
+            try:
+                job.shifts = runner(job.image_file_path)
+                job.status = JOB_SUCCEEDED
+            except Exception as e:
+                logger.exception("ジョブ%sの実行に失敗しました。", job.job_id)
+                job.error = str(e)
+                job.status = JOB_FAILED
+        job.finished_at = datetime.now()
+        queue.complete(job)
+        # Webアプリケーションの/shift_app/metrics/で出力できるよう，ジョブごとに指標を書き出す
+        queue.publish_metrics(metrics.registry.snapshot())
+        count += 1
+
+    return count
+
+
+class PipelineDaemon:
+    """ワーカープロセスをforkし，終了したワーカーを起動し直しながら常駐するクラス
+    Attributes:
+        queue (SpoolQueue): ジョブを取り出すキュー
+        runner (Callable[[str], list[Shift]]): 画像へのパスを受け取りシフトデータを返す関数
+        workers (int): ワーカープロセスの数
+        _preload (Callable[[], None] | None): forkする前に親プロセスで1度だけ呼ぶ関数
+        _init_worker (Callable[[], None] | None): ワーカーでジョブを受け付ける前に呼ぶ関数
+        _children (set[int]): 実行中のワーカーのプロセスID
+        _stopping (bool): 停止中かどうか(ワーカーでは現在のジョブの後に終了するかどうか)
+    Examples:
+        >>> import tempfile
+        >>> import threading
+        >>> def runner(path):
+        ...     time.sleep(0.1)
+        ...     return [Shift(summary=str(os.getpid()), start_datetime="2025-04-02T17:00:00+09:00:00", end_datetime="2025-04-02T21:30:00+09:00:00", timezone="Asia/Tokyo")]
+        >>> test_queue = SpoolQueue(tempfile.mkdtemp(), poll_interval=0.01)
+        >>> job_ids = [test_queue.submit(f"images/{i}.jpg") for i in range(8)]
+        >>> daemon = PipelineDaemon(test_queue, runner, workers=2, preload=None, init_worker=None)
+        >>> def stop_when_finished():
+        ...     for job_id in job_ids:
+        ...         test_queue.wait(job_id, timeout=10)
+        ...     daemon.stop()
+        >>> threading.Thread(target=stop_when_finished).start()
+        >>> daemon.run()
+        >>> # ジョブは親プロセスではなく，2つのワーカーに分かれて実行される
+        >>> jobs = [test_queue.get(job_id) for job_id in job_ids]
+        >>> [job.status for job in jobs] == ["succeeded"] * 8
+        True
+        >>> pids = {job.shifts[0].summary for job in jobs}
+        >>> len(pids), str(os.getpid()) in pids
+        (2, False)
+        >>>
+        >>> # ジョブの実行中にワーカーが終了した場合，そのジョブは失敗として記録し，ワーカーを起動し直す
+        >>> def crashing_runner(path):
+        ...     if path.endswith("crash.jpg"):
+        ...         os._exit(9)
+        ...     return []
+        >>> job_ids = [test_queue.submit(path) for path in ("images/crash.jpg", "images/ok.jpg")]
+        >>> daemon = PipelineDaemon(test_queue, crashing_runner, workers=1, preload=None, init_worker=None)
+        >>> threading.Thread(target=stop_when_finished).start()
+        >>> daemon.run()
+        >>> [test_queue.get(job_id).status for job_id in job_ids]
+        ['failed', 'succeeded']
+    """
+
+    def __init__(
+        self,
+        queue: SpoolQueue,
+        runner: Callable[[str], list[Shift]],
+        workers: Optional[int] = None,
+        preload: Optional[Callable[[], None]] = preload,
+        init_worker: Optional[Callable[[], None]] = init_worker,
+    ):
+        self.queue = queue
+        self.runner = runner
+        self.workers = workers if workers is not None else WORKERS
+        self._preload = preload
+        self._init_worker = init_worker
+        self._children: set[int] = set()
+        self._stopping = False
+
+    def run(self) -> None:
+        """モジュールを読み込んでからワーカーをforkし，stopが呼ばれて全てのワーカーが終了するまで待つメソッド
+        Returns:
+            None
+        Notes:
+            - 読み込み中に解放された領域がメモリのページに散らばらないよう，読み込みの前にGCを止める．
+              forkの直前にgc.freezeで全てのオブジェクトを永続世代に移し，ワーカーのGCが参照カウント以外で
+              共有しているページに書き込まないようにする(ワーカーではGCを再開する)
+            - doctestはクラスを参照
+        """
+        logger = logging.getLogger("__main__").getChild("pipeline_daemon")
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            if self._preload is not None:
+                self._preload()
+            # 前回のデーモンが実行中に止まったジョブを実行し直す
+            requeued = self.queue.requeue_running()
+            if requeued:
+                logger.warning("実行中に止まったジョブ%d件をキューに戻しました。", requeued)
+            # 指標はデーモンを起動してからの合計とし，読み込み中に記録したものは親プロセスの分として書き出す
+            self.queue.clear_metrics()
+            self.queue.publish_metrics(metrics.registry.snapshot())
+            while True:
+                while not self._stopping and len(self._children) < self.workers:
+                    self._spawn()
+                if not self._children:
+                    break
+                try:
+                    pid, status = os.wait()
+                except ChildProcessError:
+                    break
+                self._children.discard(pid)
+                # ジョブの実行中に終了した場合，そのジョブは結果が記録されないまま残るため失敗として記録する
+                failed = self.queue.fail_running(
+                    pid, f"ワーカー(pid={pid})がジョブの実行中に終了しました(status={status})。"
+                )
+                if failed:
+                    logger.error("ワーカー(pid=%d)が実行していたジョブ%d件を失敗として記録しました。", pid, failed)
+                if not self._stopping:
+                    logger.warning("ワーカー(pid=%d)が終了しました(status=%d)。起動し直します。", pid, status)
+                    time.sleep(RESPAWN_INTERVAL)
+        finally:
+            gc.unfreeze()
+            if gc_enabled:
+                gc.enable()
+
+    def stop(self) -> None:
+        """全てのワーカーに，実行中のジョブの後で終了するよう伝えるメソッド．シグナルハンドラからも呼べる
+        Returns:
+            None
+        """
+        self._stopping = True
+        for pid in list(self._children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def _spawn(self) -> None:
+        """ワーカーをforkするメソッド．ワーカーではジョブを実行し続け，戻らずに終了する
+        Returns:
+            None
+        """
+        gc.freeze()
+        pid = os.fork()
+        if pid:
+            self._children.add(pid)
+            return
+
+        # ここからはワーカー
+        exit_code = 1
+        try:
+            gc.enable()
+            # 端末のCtrl+Cは親プロセスがSIGTERMとして伝えるため，ワーカーは実行中のジョブを終えてから終了する
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, lambda signum, frame: self._request_stop())
+            self._children = set()
+            # 親プロセスから複製した指標は親プロセスが書き出しているため，二重に数えないよう消す
+            metrics.registry.reset()
+            if self._init_worker is not None:
+                self._init_worker()
+            work(self.queue, self.runner, should_stop=lambda: self._stopping)
+            exit_code = 0
+        except BaseException:
+            logging.getLogger("__main__").getChild("pipeline_daemon").exception(
+                "ワーカー(pid=%d)が異常終了しました。", os.getpid()
+            )
+        finally:
+            # 親プロセスから複製した後処理(atexitなど)は実行せずに終了するため，
+            # キューに残っているログ(異常終了のログや最後のジョブのログ)はここで書き込む
+            flush_logs()
+            os._exit(exit_code)
+
+    def _request_stop(self) -> None:
+        """ワーカーでSIGTERMを受け取ったときに呼ぶメソッド"""
+        self._stopping = True
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
@@ -0,0 +1,239 @@
+"""GoogleカレンダーAPIの代わりに応答するテスト用のHTTPトランスポートを定義するモジュール"""
+
+import email.parser
+import json
+import threading
+import time
+import urllib.parse
+import uuid
+from datetime import datetime
+from typing import Callable, Optional
+
+import httplib2
+
+
+class FakeCalendarHttp:
+    """GoogleカレンダーAPIを模した応答を返すhttplib2.Http互換のクラス
+    Attributes:
+        round_trips (int): 受け付けたHTTPリクエストの回数(バッチは1回と数える)
+        events (dict[str, dict]): 登録された予定(予定IDと予定の対応表)
+        fail_when (Callable[[dict], int | None] | None): 予定を受け取り，失敗させる場合はHTTPステータスを返す関数
+        latency (float): 1回のHTTPリクエストごとに待機する秒数(通信の遅延を模す)
+        max_concurrency (int | None): 同時に処理するリクエストの上限(流量制限を模す)．
+            超えたリクエストはthrottle_statusで失敗させる．Noneの場合は制限しない
+        throttle_status (int): 流量制限で失敗させる場合のHTTPステータス(403はrateLimitExceeded)
+        throttled (int): 流量制限で失敗させたリクエストの数
+        max_in_flight (int): 同時に処理したリクエストの数の最大値(流量制限で失敗させたものを除く)
+        timeout (None): httplib2.Http互換の属性
+        _in_flight (int): 処理中のリクエストの数
+        _lock (:obj:`threading.Lock`): round_trips・events・流量制限の状態を保護するロック
+    """
+
+    def __init__(
+        self,
+        fail_when: Optional[Callable[[dict], Optional[int]]] = None,
+        latency: float = 0.0,
+        max_concurrency: Optional[int] = None,
+        throttle_status: int = 403,
+    ):
+        self.round_trips = 0
+        self.events: dict[str, dict] = dict()
+        self.fail_when = fail_when
+        self.latency = latency
+        self.max_concurrency = max_concurrency
+        self.throttle_status = throttle_status
+        self.throttled = 0
+        self.max_in_flight = 0
+        self.timeout = None
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def request(
+        self,
+        uri: str,
+        method: str = "GET",
+        body: Optional[str] = None,
+        headers: Optional[dict] = None,
+        redirections: int = 5,
+        connection_type=None,
+    ) -> tuple[httplib2.Response, bytes]:
+        """HTTPリクエストを受け取り，応答を返すメソッド
+        Args:
+            uri (str): リクエスト先のURI
+            method (str): HTTPメソッド
+            body (str | None): リクエストボディ
+            headers (dict | None): リクエストヘッダ
+        Returns:
+            tuple[httplib2.Response, bytes]: 応答ヘッダと応答ボディ
+        Examples:
+            >>> # 同時に2件までしか受け付けない場合，同時に送った5件のうち3件は流量制限で失敗する
+            >>> from concurrent.futures import ThreadPoolExecutor
+            >>> fake_http = FakeCalendarHttp(latency=0.1, max_concurrency=2)
+            >>> with ThreadPoolExecutor(max_workers=5) as executor:
+            ...     responses = list(executor.map(lambda _: fake_http.request("https://example.com/calendars/c/events"), range(5)))
+            >>> sorted(response.status for response, _ in responses)
+            [200, 200, 403, 403, 403]
+            >>> throttled_body = next(content for response, content in responses if response.status == 403)
+            >>> json.loads(throttled_body)["error"]["errors"][0]["reason"]
+            'rateLimitExceeded'
+            >>> fake_http.throttled, fake_http.max_in_flight
+            (3, 2)
+        """
+        with self._lock:
+            self.round_trips += 1
+            throttled = self.max_concurrency is not None and self._in_flight >= self.max_concurrency
+            if throttled:
+                self.throttled += 1
+            else:
+                self._in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self._in_flight)
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            if throttled:
+                status, content = _error(
+                    self.throttle_status, "Rate Limit Exceeded", reason="rateLimitExceeded"
+                )
+            elif "/batch/" in uri:
+                return self._handle_batch(body, headers or dict())
+            else:
+                status, content = self._handle_single(method, uri, body)
+        finally:
+            if not throttled:
+                with self._lock:
+                    self._in_flight -= 1
+
+        return (
+            httplib2.Response({"status": status, "content-type": "application/json"}),
+            content.encode("utf-8"),
+        )
+
+    def _handle_single(self, method: str, uri: str, body: Optional[str]) -> tuple[int, str]:
+        """バッチに含まれない1件分のリクエストを処理するメソッド
+        Args:
+            method (str): HTTPメソッド
+            uri (str): リクエスト先のURI
+            body (str | None): リクエストボディ
+        Returns:
+            tuple[int, str]: HTTPステータスとJSON形式の応答ボディ
+        """
+        url = urllib.parse.urlsplit(uri)
+        query = urllib.parse.parse_qs(url.query)
+        path = url.path.split("/events", 1)
+        if len(path) != 2:
+            return _error(404, "Not Found")
+        event_id = urllib.parse.unquote(path[1].lstrip("/")) or None
+        event = json.loads(body) if body else dict()
+
+        if method in ("POST", "PATCH", "PUT"):
+            status = self.fail_when(event) if self.fail_when is not None else None
+            if status is not None:
+                return _error(status, "Injected failure")
+
+        with self._lock:
+            if method == "GET" and event_id is None:
+                return 200, json.dumps({"items": self._list_events(query)})
+            if method == "POST" and event_id is None:
+                event_id = event.get("id") or uuid.uuid4().hex
+                if event_id in self.events:
+                    return _error(409, "The requested identifier already exists.")
+                self.events[event_id] = dict(event, id=event_id)
+                return 200, json.dumps({"id": event_id})
+            if event_id not in self.events:
+                return _error(404, "Not Found")
+            if method == "PATCH":
+                self.events[event_id].update(event)
+                return 200, json.dumps({"id": event_id})
+            if method == "PUT":
+                self.events[event_id] = dict(event, id=event_id)
+                return 200, json.dumps({"id": event_id})
+            if method == "DELETE":
+                del self.events[event_id]
+                return 204, ""
+
+        return _error(405, "Method Not Allowed")
+
+    def _list_events(self, query: dict) -> list[dict]:
+        """events.listの条件に一致する予定を返すメソッド
+        Args:
+            query (dict): クエリパラメータ
+        Returns:
+            list[dict]: 予定
+        Notes:
+            呼び出し側で_lockを取得していること
+        """
+        time_min = query.get("timeMin", [None])[0]
+        time_max = query.get("timeMax", [None])[0]
+        private_filters = query.get("privateExtendedProperty", list())
+        items = list()
+        for event in self.events.values():
+            start = datetime.fromisoformat(event["start"]["dateTime"])
+            if time_max is not None and start >= datetime.fromisoformat(time_max):
+                continue
+            end = datetime.fromisoformat(event["end"]["dateTime"])
+            if time_min is not None and end <= datetime.fromisoformat(time_min):
+                continue
+            private = event.get("extendedProperties", dict()).get("private", dict())
+            if any(
+                private.get(key) != value
+                for key, _, value in (f.partition("=") for f in private_filters)
+            ):
+                continue
+            items.append(event)
+
+        return items
+
+    def _handle_batch(self, body: str, headers: dict) -> tuple[httplib2.Response, bytes]:
+        """multipart/mixed形式のバッチリクエストを処理するメソッド
+        Args:
+            body (str): リクエストボディ
+            headers (dict): リクエストヘッダ
+        Returns:
+            tuple[httplib2.Response, bytes]: 応答ヘッダと応答ボディ
+        """
+        content_type = headers.get("content-type") or headers.get("Content-Type")
+        message = email.parser.Parser().parsestr(
+            f"Content-Type: {content_type}\r\n\r\n{body}"
+        )
+
+        boundary = "batch_" + uuid.uuid4().hex
+        parts = list()
+        for part in message.get_payload():
+            request_text = part.get_payload()
+            request_line, _, rest = request_text.partition("\n")
+            method, uri, _ = request_line.split(" ", 2)
+            _, _, part_body = rest.replace("\r\n", "\n").partition("\n\n")
+            status, content = self._handle_single(method, uri, part_body or None)
+            content_id = part["Content-ID"].replace("<", "<response-", 1)
+            parts.append(
+                f"--{boundary}\r\n"
+                "Content-Type: application/http\r\n"
+                f"Content-ID: {content_id}\r\n\r\n"
+                f"HTTP/1.1 {status} {'OK' if status < 300 else 'Error'}\r\n"
+                "Content-Type: application/json; charset=UTF-8\r\n\r\n"
+                f"{content}\r\n"
+            )
+        response_body = "".join(parts) + f"--{boundary}--\r\n"
+
+        return (
+            httplib2.Response(
+                {"status": 200, "content-type": f"multipart/mixed; boundary={boundary}"}
+            ),
+            response_body.encode("utf-8"),
+        )
+
+
+def _error(status: int, message: str, reason: Optional[str] = None) -> tuple[int, str]:
+    """GoogleカレンダーAPIのエラー応答を作成する関数
+    Args:
+        status (int): HTTPステータス
+        message (str): エラーメッセージ
+        reason (str | None): エラーの理由(例: rateLimitExceeded)．Noneの場合は含めない
+    Returns:
+        tuple[int, str]: HTTPステータスとJSON形式の応答ボディ
+    """
+    error = {"code": status, "message": message}
+    if reason is not None:
+        error["errors"] = [{"domain": "usageLimits", "reason": reason, "message": message}]
+
+    return status, json.dumps({"error": error})
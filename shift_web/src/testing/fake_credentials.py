@@ -0,0 +1,66 @@
+"""OAuthのトークンエンドポイントの代わりにアクセストークンを発行するテスト用の認証情報を定義するモジュール"""
+
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import google.auth.credentials
+
+
+class FakeServiceAccountCredentials(google.auth.credentials.Credentials):
+    """service_account.Credentialsのrefreshを模したクラス
+    Attributes:
+        refresh_count (int): refreshが呼ばれた(トークンを発行した)回数
+        latency (float): 1回の発行ごとに待機する秒数(トークンエンドポイントとの通信を模す)
+        lifetime (float): 発行するトークンの有効期間(秒)
+        service_account_email (str): サービスアカウントのメールアドレス
+        scopes (tuple[str, ...]): スコープ
+        _lock (:obj:`threading.Lock`): refresh_countを保護するロック
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        lifetime: float = 3600.0,
+        service_account_email: str = "shift@example.iam.gserviceaccount.com",
+        scopes: tuple[str, ...] = ("https://www.googleapis.com/auth/calendar",),
+    ):
+        super().__init__()
+        self.refresh_count = 0
+        self.latency = latency
+        self.lifetime = lifetime
+        self.service_account_email = service_account_email
+        self.scopes = scopes
+        self._lock = threading.Lock()
+
+    def refresh(self, request) -> None:
+        """新しいアクセストークンを発行するメソッド
+        Args:
+            request (google.auth.transport.Request | None): 使わない
+        Returns:
+            None
+        Examples:
+            >>> fake_credentials = FakeServiceAccountCredentials()
+            >>> fake_credentials.valid
+            False
+            >>> fake_credentials.refresh(request=None)
+            >>> fake_credentials.refresh_count, fake_credentials.valid, fake_credentials.token.startswith("ya29.fake-")
+            (1, True, True)
+        """
+        with self._lock:
+            self.refresh_count += 1
+            count = self.refresh_count
+        if self.latency:
+            time.sleep(self.latency)
+        # プロセスをまたいでも重複しないトークン
+        self.token = f"ya29.fake-{os.getpid()}-{count}"
+        self.expiry = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(
+            seconds=self.lifetime
+        )
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
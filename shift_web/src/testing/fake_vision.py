@@ -0,0 +1,102 @@
+"""Vision APIの代わりに応答するテスト用のクライアントを定義するモジュール"""
+
+import asyncio
+import threading
+import time
+from typing import Callable
+
+
+class FakeImageAnnotatorClient:
+    """vision.ImageAnnotatorClientのdocument_text_detectionを模したクラス
+    Attributes:
+        calls (int): document_text_detectionが呼ばれた回数
+        response_factory (Callable[[bytes], vision.AnnotateImageResponse]): 画像の内容を受け取りレスポンスを返す関数
+        latency (float): 1回の呼び出しごとに待機する秒数(通信と文字認識の時間を模す)
+        _lock (:obj:`threading.Lock`): callsを保護するロック
+    """
+
+    def __init__(
+        self,
+        response_factory: Callable[[bytes], "vision.AnnotateImageResponse"],
+        latency: float = 0.0,
+    ):
+        self.calls = 0
+        self.response_factory = response_factory
+        self.latency = latency
+        self._lock = threading.Lock()
+
+    def document_text_detection(self, image, **kwargs) -> "vision.AnnotateImageResponse":
+        """画像から文字を抽出したレスポンスを返すメソッド
+        Args:
+            image (:obj:`vision.Image`): 画像
+        Returns:
+            vision.AnnotateImageResponse: response_factoryが返したレスポンス
+        Examples:
+            >>> from google.cloud import vision
+            >>> fake_client = FakeImageAnnotatorClient(lambda content: vision.AnnotateImageResponse(), latency=0.01)
+            >>> response = fake_client.document_text_detection(image=vision.Image(content=b"dummy image data"))
+            >>> fake_client.calls, response.error.message
+            (1, '')
+        """
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        return self.response_factory(image.content)
+
+
+
+class FakeImageAnnotatorAsyncClient(FakeImageAnnotatorClient):
+    """vision.ImageAnnotatorAsyncClientのdocument_text_detectionを模したクラス
+    Attributes:
+        max_in_flight (int): 同時に応答を待っていた呼び出しの数の最大値
+        _in_flight (int): 応答を待っている呼び出しの数
+    Notes:
+        その他の属性はFakeImageAnnotatorClientを参照．待機はasyncio.sleepで行うため，
+        待っている間も同じイベントループで他の処理が進む
+    """
+
+    def __init__(
+        self,
+        response_factory: Callable[[bytes], "vision.AnnotateImageResponse"],
+        latency: float = 0.0,
+    ):
+        super().__init__(response_factory, latency)
+        self.max_in_flight = 0
+        self._in_flight = 0
+
+    async def document_text_detection(self, image, **kwargs) -> "vision.AnnotateImageResponse":
+        """画像から文字を抽出したレスポンスを返すメソッド
+        Args:
+            image (:obj:`vision.Image`): 画像
+        Returns:
+            vision.AnnotateImageResponse: response_factoryが返したレスポンス
+        Examples:
+            >>> from google.cloud import vision
+            >>> fake_client = FakeImageAnnotatorAsyncClient(lambda content: vision.AnnotateImageResponse(), latency=0.05)
+            >>> async def detect_all():
+            ...     return await asyncio.gather(*[fake_client.document_text_detection(image=vision.Image(content=b"dummy image data")) for _ in range(10)])
+            >>> start = time.perf_counter()
+            >>> responses = asyncio.run(detect_all())
+            >>> fake_client.calls, fake_client.max_in_flight, time.perf_counter() - start < 0.5
+            (10, 10, True)
+        """
+        with self._lock:
+            self.calls += 1
+            self._in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self._in_flight)
+        try:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+        return self.response_factory(image.content)
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
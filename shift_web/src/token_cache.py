@@ -0,0 +1,377 @@
+"""Google APIのアクセストークンをプロセス間で共有し，期限が切れる前に更新するモジュール"""
+
+import contextlib
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+import weakref
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, Optional
+
+import google.auth.credentials
+
+from src import metrics
+
+# トークンを保存するファイル(同じファイルを使うワーカーの間で共有する)
+CACHE_PATH = os.getenv("SHIFT_TOKEN_CACHE") or os.path.join(
+    tempfile.gettempdir(), "shift_token_cache.json"
+)
+# 期限のこの秒数前になったらバックグラウンドで更新する
+REFRESH_MARGIN = float(os.getenv("SHIFT_TOKEN_REFRESH_MARGIN", 600))
+# ワーカーが同時に更新しないよう，更新する時刻をずらす最大の秒数
+REFRESH_JITTER = 60.0
+# 保存されたトークンを使う場合に残っているべき秒数(google-authが期限切れとみなす3分45秒より長くする)
+MIN_REMAINING = 300.0
+# バックグラウンドでの更新に失敗した場合に再試行するまでの秒数
+RETRY_INTERVAL = 30.0
+# Vision APIとGoogleカレンダーのスコープ
+VISION_SCOPES = ("https://www.googleapis.com/auth/cloud-vision",)
+CALENDAR_SCOPES = ("https://www.googleapis.com/auth/calendar",)
+
+
+class TokenCache:
+    """アクセストークンをJSONファイルに保存し，ファイルロックで更新を直列化するクラス
+    Attributes:
+        path (str): トークンを保存するファイルへのパス(所有者のみ読み書きできる)
+        _lock_path (str): 更新を直列化するためのロックファイルへのパス
+        _thread_lock (:obj:`threading.Lock`): fcntlを使えない環境でプロセス内の更新を直列化するロック
+    Examples:
+        >>> test_cache = TokenCache(os.path.join(tempfile.mkdtemp(), "tokens.json"))
+        >>> test_cache.get("bot@example.com|calendar") is None
+        True
+        >>> with test_cache.locked():
+        ...     test_cache.put("bot@example.com|calendar", "ya29.token", datetime(2030, 1, 1))
+        >>> test_cache.get("bot@example.com|calendar")
+        ('ya29.token', datetime.datetime(2030, 1, 1, 0, 0))
+        >>> oct(os.stat(test_cache.path).st_mode & 0o777)
+        '0o600'
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock_path = f"{path}.lock"
+        self._thread_lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[tuple[str, datetime]]:
+        """保存されたトークンを取得するメソッド
+        Args:
+            key (str): サービスアカウントとスコープを表すキー
+        Returns:
+            tuple[str, datetime] | None: (トークン，期限(UTC))．保存されていない場合はNone
+        Notes:
+            書き込みはos.replaceで置き換えるため，ロックを取得しなくても書きかけの内容は読まない
+        """
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                entry = json.load(f).get(key)
+        except (OSError, ValueError):
+            return None
+        if not entry:
+            return None
+
+        return entry["token"], datetime.fromisoformat(entry["expiry"])
+
+    def put(self, key: str, token: str, expiry: datetime) -> None:
+        """トークンを保存するメソッド
+        Args:
+            key (str): サービスアカウントとスコープを表すキー
+            token (str): アクセストークン
+            expiry (datetime): 期限(UTC，タイムゾーンなし)
+        Returns:
+            None
+        Notes:
+            lockedの中で呼ぶこと
+        """
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            entries = dict()
+        entries[key] = {"token": token, "expiry": expiry.isoformat()}
+        directory = os.path.dirname(self.path) or "."
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tokens-")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+            raise
+
+    @contextlib.contextmanager
+    def locked(self) -> Iterator[None]:
+        """トークンを更新する間，他のプロセス・スレッドの更新を待たせるコンテキストマネージャ"""
+        with self._thread_lock:
+            try:
+                import fcntl
+            except ImportError:
+                yield
+                return
+            fd = os.open(self._lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                yield
+            finally:
+                os.close(fd)
+
+
+class CachedCredentials(google.auth.credentials.Credentials):
+    """アクセストークンの取得をTokenCacheと共有する認証情報のクラス
+    Attributes:
+        token (str | None): アクセストークン
+        expiry (datetime | None): トークンの期限(UTC)
+        _inner (:obj:`google.auth.credentials.Credentials`): 実際にトークンを取得する認証情報
+        _cache (:obj:`TokenCache`): トークンを共有するキャッシュ
+        _key (str): キャッシュのキー
+        _lock (:obj:`threading.Lock`): プロセス内の更新を直列化するロック
+        _refresher (:obj:`threading.Thread` | None): 期限の前にトークンを更新するスレッド
+        _auto_refresh (bool): 最初にトークンを取得したときに_refresherを起動するかどうか
+    Notes:
+        - トークンが必要になると，まずキャッシュを読み，有効なトークンがあればそれを使う
+        - キャッシュのトークンが期限に近い場合は，ファイルロックを取得したワーカーのみが更新し，
+          ロックを待っていた他のワーカーは更新されたトークンを使う
+        - 1度トークンを取得した後は，期限のREFRESH_MARGIN秒前にバックグラウンドで更新するため，
+          リクエストの送信時に更新を待つことはない
+        - forkした子プロセスではロックを作り直し，更新スレッドを起動し直す(_after_fork_in_child)
+    Examples:
+        >>> from src.testing.fake_credentials import FakeServiceAccountCredentials
+        >>> cache_path = os.path.join(tempfile.mkdtemp(), "tokens.json")
+        >>> # 2つのワーカーが同じキャッシュを使う場合，トークンの取得は1回だけ行われる
+        >>> inner = FakeServiceAccountCredentials()
+        >>> workers = [CachedCredentials(inner, TokenCache(cache_path), auto_refresh=False) for _ in range(2)]
+        >>> for worker in workers:
+        ...     worker.refresh(request=None)
+        >>> inner.refresh_count, workers[0].token == workers[1].token, workers[1].valid
+        (1, True, True)
+        >>> # 期限が近いトークンは1つのワーカーだけが更新し，他のワーカーは更新されたトークンを使う
+        >>> inner.lifetime = 7200
+        >>> for worker in workers:
+        ...     worker._refresh_shared(None, margin=3601)
+        >>> inner.refresh_count, workers[0].token == workers[1].token
+        (2, True)
+    """
+
+    def __init__(
+        self,
+        inner: google.auth.credentials.Credentials,
+        cache: TokenCache,
+        auto_refresh: bool = True,
+    ):
+        super().__init__()
+        self._inner = inner
+        self._cache = cache
+        scopes = getattr(inner, "scopes", None) or ()
+        email = getattr(inner, "service_account_email", None) or type(inner).__name__
+        self._key = f"{email}|{' '.join(sorted(scopes))}"
+        self._lock = threading.Lock()
+        self._refresher: Optional[threading.Thread] = None
+        self._auto_refresh = auto_refresh
+        _instances.add(self)
+
+    @property
+    def service_account_email(self) -> Optional[str]:
+        """サービスアカウントのメールアドレス"""
+        return getattr(self._inner, "service_account_email", None)
+
+    def refresh(self, request) -> None:
+        """トークンが無効な場合にgoogle-authから呼ばれるメソッド
+        Args:
+            request (google.auth.transport.Request): トークンを取得するためのHTTPリクエストを送るオブジェクト
+        Returns:
+            None
+        """
+        self._refresh_shared(request, margin=MIN_REMAINING)
+        if self._auto_refresh:
+            self.start_refresher()
+
+    def start_refresher(self) -> None:
+        """期限の前にトークンを更新するスレッドを起動するメソッド(起動済みの場合は何もしない)
+        Notes:
+            - トークンをまだ取得していない場合は最初に取得するため，クライアントの作成時に呼ぶと
+              最初のリクエストまでにトークンを用意できる
+            - 更新スレッドでモジュールを読み込むと，読み込みの途中でforkされた子プロセスに
+              初期化途中のモジュールが複製されるため，読み込みは呼び出したスレッドで行う
+        """
+        from google.auth.transport.requests import Request
+
+        with self._lock:
+            if self._refresher is not None:
+                return
+            # スレッドからは弱参照のみを持ち，クライアントが作り直されたら終了させる
+            self._refresher = threading.Thread(
+                target=_refresh_loop,
+                args=(weakref.ref(self), Request()),
+                name="shift-token-refresher",
+                daemon=True,
+            )
+            self._refresher.start()
+
+    def _refresh_shared(self, request, margin: float) -> None:
+        """残り時間がmargin秒未満の場合のみ，キャッシュを確かめてからトークンを更新するメソッド
+        Args:
+            request (google.auth.transport.Request | None): トークンを取得するためのオブジェクト
+            margin (float): 期限までに残っているべき秒数
+        Returns:
+            None
+        """
+        # 更新の途中でforkされないよう，_refresh_guardも取得する
+        with _refresh_guard, self._lock:
+            if self._is_fresh((self.token, self.expiry), margin):
+                return
+            cached = self._cache.get(self._key)
+            if not self._is_fresh(cached, margin):
+                with self._cache.locked():
+                    # ロックを待つ間に他のワーカーが更新した場合はそのトークンを使う
+                    cached = self._cache.get(self._key)
+                    if not self._is_fresh(cached, margin):
+                        self._inner.refresh(request)
+                        cached = (self._inner.token, self._inner.expiry)
+                        self._cache.put(self._key, *cached)
+                        metrics.registry.inc(metrics.AUTH_TOKENS, source="refresh")
+            else:
+                metrics.registry.inc(metrics.AUTH_TOKENS, source="cache")
+            self.token, self.expiry = cached
+
+    @staticmethod
+    def _is_fresh(entry: Optional[tuple[Optional[str], Optional[datetime]]], margin: float) -> bool:
+        """トークンの期限までmargin秒以上残っているかを判定するメソッド"""
+        if entry is None or entry[0] is None or entry[1] is None:
+            return False
+
+        return entry[1] - _utcnow() >= timedelta(seconds=margin)
+
+
+# トークンの更新中は保持し，forkの前に取得するロック(ロックを保持したまま子プロセスに複製されないようにする)
+_refresh_guard = threading.Lock()
+# プロセス内の認証情報(forkした子プロセスで更新スレッドを起動し直す)
+_instances: "weakref.WeakSet[CachedCredentials]" = weakref.WeakSet()
+
+
+def _before_fork() -> None:
+    """forkの前に，他のスレッドでのトークンの更新が終わるのを待つ関数"""
+    _refresh_guard.acquire()
+
+
+def _after_fork_in_parent() -> None:
+    """forkした後に，親プロセスで_before_forkのロックを解放する関数"""
+    _refresh_guard.release()
+
+
+def _after_fork_in_child() -> None:
+    """forkした子プロセスで，ロックを作り直して更新スレッドを起動し直す関数
+    Notes:
+        子プロセスには，forkを呼んだスレッド以外のスレッド(更新スレッド)は複製されない
+    Examples:
+        >>> from src.testing.fake_credentials import FakeServiceAccountCredentials
+        >>> credentials = CachedCredentials(FakeServiceAccountCredentials(), TokenCache(os.path.join(tempfile.mkdtemp(), "tokens.json")))
+        >>> credentials.refresh(request=None)
+        >>> pid = os.fork()
+        >>> if pid == 0:
+        ...     os._exit(0 if credentials._refresher.is_alive() else 1)
+        >>> os.waitpid(pid, 0)[1]
+        0
+    """
+    global _refresh_guard
+    _refresh_guard = threading.Lock()
+    for credentials in list(_instances):
+        credentials._lock = threading.Lock()
+        if credentials._refresher is not None:
+            credentials._refresher = None
+            credentials.start_refresher()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(
+        before=_before_fork,
+        after_in_parent=_after_fork_in_parent,
+        after_in_child=_after_fork_in_child,
+    )
+
+
+_default_cache: Optional[TokenCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_token_cache() -> TokenCache:
+    """プロセス内で共有するTokenCacheを取得する関数
+    Returns:
+        TokenCache: CACHE_PATH(環境変数SHIFT_TOKEN_CACHE)に保存するキャッシュ
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = TokenCache(CACHE_PATH)
+
+        return _default_cache
+
+
+def load_credentials(
+    key_path: str, scopes: tuple[str, ...]
+) -> google.auth.credentials.Credentials:
+    """サービスアカウントの鍵ファイルから，トークンをプロセス間で共有する認証情報を作成する関数
+    Args:
+        key_path (str): 鍵ファイルへのパス
+        scopes (tuple[str, ...]): スコープ
+    Returns:
+        google.auth.credentials.Credentials: サービスアカウントの場合はCachedCredentials．
+            それ以外(テスト用の認証情報など)の場合は読み込んだ認証情報をそのまま返す
+    Notes:
+        トークンの取得はバックグラウンドで始めるため，最初のリクエストまでに用意できる
+    """
+    # 鍵の解析にRSAとASN.1のライブラリを使うため，認証情報を作成する時点で読み込む
+    from google.oauth2 import service_account
+
+    credentials = service_account.Credentials.from_service_account_file(key_path)
+    credentials = google.auth.credentials.with_scopes_if_required(credentials, scopes)
+    if not isinstance(credentials, service_account.Credentials):
+        return credentials
+    cached = CachedCredentials(credentials, get_default_token_cache())
+    cached.start_refresher()
+
+    return cached
+
+
+def _refresh_loop(ref: "weakref.ref[CachedCredentials]", request) -> None:
+    """期限のREFRESH_MARGIN秒前(ワーカーごとにずらす)になるたびにトークンを更新する関数
+    Args:
+        ref (weakref.ref[CachedCredentials]): 更新する認証情報への弱参照
+        request (google.auth.transport.Request): トークンを取得するためのHTTPリクエストを送るオブジェクト
+    Returns:
+        None
+    Notes:
+        更新に失敗しても再試行を続ける．想定外の例外でスレッドが終了する場合はログに残す
+        (以降はリクエストの送信時にgoogle-authが更新する)
+    """
+    logger = logging.getLogger("__main__").getChild("token_cache")
+    try:
+        while True:
+            credentials = ref()
+            if credentials is None:
+                return
+            try:
+                credentials._refresh_shared(request, margin=REFRESH_MARGIN)
+                wait = (credentials.expiry - _utcnow()).total_seconds() - REFRESH_MARGIN
+                wait -= random.uniform(0.0, REFRESH_JITTER)
+            except Exception as e:
+                logger.warning("アクセストークンの更新に失敗しました。: %s", e)
+                wait = RETRY_INTERVAL
+            del credentials
+            time.sleep(max(1.0, wait))
+    except Exception:
+        logger.exception("アクセストークンの更新スレッドが終了しました。")
+
+
+def _utcnow() -> datetime:
+    """google-authと同じ形式(UTC，タイムゾーンなし)の現在時刻を返す関数"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
@@ -1,32 +1,314 @@
 """便利な関数群"""
 
+import atexit
+import collections
+import contextlib
+import contextvars
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Iterator, Optional
 
 
-def set_logging(result_dir: str) -> "logging.Logger":
+LOG_FORMAT = "%(asctime)s - %(job_id)s - %(name)s - %(levelname)s - %(message)s"
+# 同時に開いておくジョブごとのログファイルの上限(超えた場合は古いものから閉じる)
+MAX_OPEN_LOG_FILES = 32
+# 記録しておくジョブIDとログファイルの対応の上限
+MAX_LOG_ROUTES = 1000
+
+# 実行中のジョブのID．ログにジョブIDを付け，ジョブごとのファイルに振り分けるために使う
+_current_job_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "job_id", default=None
+)
+
+
+@contextlib.contextmanager
+def job_context(job_id: str) -> Iterator[None]:
+    """ブロック内で出力したログにジョブIDを付けるコンテキストマネージャ
+    Args:
+        job_id (str): ジョブID
+    Examples:
+        >>> with job_context("abc"):
+        ...     current_job_id()
+        'abc'
+        >>> current_job_id() is None
+        True
+    """
+    token = _current_job_id.set(job_id)
+    try:
+        yield
+    finally:
+        _current_job_id.reset(token)
+
+
+def current_job_id() -> Optional[str]:
+    """実行中のジョブのIDを返す関数
+    Returns:
+        str | None: ジョブID．ジョブの外ではNone
+    """
+    return _current_job_id.get()
+
+
+class _JobQueueHandler(logging.handlers.QueueHandler):
+    """ログにジョブIDを付けてキューに入れるハンドラ
+    Notes:
+        呼び出し元のスレッドではファイルへの書き込みを行わず，メッセージの整形のみを行う
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.job_id = _current_job_id.get() or "-"
+
+        return super().prepare(record)
+
+
+class _JobRoutingHandler(logging.Handler):
+    """ログをジョブごとのファイルに振り分けて書き込むハンドラ(QueueListenerのスレッドでのみ使う)
+    Attributes:
+        _routes (OrderedDict[str, str]): ジョブIDとログファイルへのパスの対応表(登録順)
+        _files (OrderedDict[str, TextIO]): ジョブIDと開いているログファイルの対応表(利用順)
+        _routes_lock (:obj:`threading.Lock`): _routesを保護するロック
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._routes: "collections.OrderedDict[str, str]" = collections.OrderedDict()
+        self._files: "collections.OrderedDict[str, object]" = collections.OrderedDict()
+        self._routes_lock = threading.Lock()
+
+    def add_route(self, job_id: str, path: str) -> None:
+        """ジョブIDのログの書き込み先を登録するメソッド
+        Args:
+            job_id (str): ジョブID
+            path (str): ログファイルへのパス
+        Returns:
+            None
+        """
+        with self._routes_lock:
+            self._routes[job_id] = path
+            self._routes.move_to_end(job_id)
+            while len(self._routes) > MAX_LOG_ROUTES:
+                self._routes.popitem(last=False)
+
+    def emit(self, record: logging.LogRecord) -> None:
+        with self._routes_lock:
+            path = self._routes.get(record.job_id)
+        if path is None:
+            return
+        try:
+            f = self._files.get(record.job_id)
+            if f is None:
+                f = self._files[record.job_id] = open(path, "a", encoding="utf-8")
+                while len(self._files) > MAX_OPEN_LOG_FILES:
+                    self._files.popitem(last=False)[1].close()
+            else:
+                self._files.move_to_end(record.job_id)
+            f.write(self.format(record) + "\n")
+            f.flush()
+        except Exception:
+            self.handleError(record)
+
+    def close_job(self, job_id: str) -> None:
+        """ジョブのログファイルを閉じるメソッド"""
+        f = self._files.pop(job_id, None)
+        if f is not None:
+            f.close()
+
+    def close(self) -> None:
+        for f in self._files.values():
+            f.close()
+        self._files.clear()
+        super().close()
+
+
+class _JobQueueListener(logging.handlers.QueueListener):
+    """キューからログを取り出して書き込むクラス．ジョブの終了と書き込み待ちの通知も受け取る"""
+
+    def handle(self, record: logging.LogRecord) -> None:
+        if getattr(record, "close_job_log", False):
+            if _router is not None:
+                _router.close_job(record.job_id)
+        elif getattr(record, "flushed", None) is not None:
+            record.flushed.set()
+        else:
+            super().handle(record)
+
+
+class _JsonFormatter(logging.Formatter):
+    """ログを1行のJSONに整形するフォーマッタ"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": self.formatTime(record),
+            "job_id": getattr(record, "job_id", "-"),
+            "name": record.name,
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        if record.exc_text:
+            data["exc_info"] = record.exc_text
+
+        return json.dumps(data, ensure_ascii=False)
+
+
+# ログを書き込むスレッドとハンドラ(初回のset_loggingで作成する)
+_listener: Optional[logging.handlers.QueueListener] = None
+_router: Optional[_JobRoutingHandler] = None
+_queue_handler: Optional[_JobQueueHandler] = None
+_logging_lock = threading.Lock()
+
+
+def _start_listener() -> None:
+    """ログを書き込むスレッドを開始し，rootのloggerにキューへのハンドラを1つだけ追加する関数
+    Notes:
+        環境変数SHIFT_LOG_JSONにパスが設定されている場合は，ジョブごとのファイルの代わりに
+        全てのログをそのファイルにJSON Lines形式で書き込む
     """
-    ログをファイルに書き出すよう設定する関数．
+    global _listener, _router, _queue_handler
+    with _logging_lock:
+        if _listener is not None:
+            return
+        log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+        json_path = os.getenv("SHIFT_LOG_JSON")
+        if json_path:
+            target = logging.FileHandler(json_path, "a", encoding="utf-8")
+            target.setFormatter(_JsonFormatter())
+        else:
+            _router = _JobRoutingHandler()
+            _router.setFormatter(logging.Formatter(LOG_FORMAT))
+            target = _router
+        _listener = _JobQueueListener(log_queue, target)
+        _listener.start()
+        _queue_handler = _JobQueueHandler(log_queue)
+        _queue_handler.setLevel(logging.DEBUG)
+
+        root = logging.getLogger()
+        root.setLevel(logging.DEBUG)
+        root.addHandler(_queue_handler)
+        atexit.register(_stop_listener)
+
+
+def _stop_listener() -> None:
+    """キューに残ったログを書き込んでからスレッドを停止する関数"""
+    global _listener
+    with _logging_lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+def set_logging(result_dir: Optional[str]) -> "logging.Logger":
+    """
+    実行中のジョブのログをresult_dir/log.logに書き出すよう設定する関数．
     Args:
-        result_dir (str): ログの出力先
+        result_dir (str | None): ログの出力先．Noneの場合はジョブごとのファイルには書き出さず，
+            ログを書き込むスレッドの開始(環境変数SHIFT_LOG_JSONのファイルへの書き込み)のみ行う
     Returns:
         設定済みのrootのlogger
+    Notes:
+        rootのloggerにはキューへのハンドラを1度だけ追加し，ファイルへの書き込みは
+        1つのスレッドがまとめて行う．ジョブの外で呼ばれた場合はresult_dirの名前をジョブIDとする．
+        ジョブの終了時にはclose_job_logを呼ぶこと
 
     Example:
-    >>> logger = logging.getLogger(__name__)
-    >>> set_logging(result_dir)
-    >>> logger.info('log message...')
-    """
-    logger = logging.getLogger()
-    logger.setLevel(logging.DEBUG)  # ログレベル
-    formatter = logging.Formatter(
-        "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    >>> import tempfile
+    >>> result_dir = tempfile.mkdtemp()
+    >>> with job_context("job-1"):
+    ...     logger = set_logging(result_dir)
+    ...     logging.getLogger("__main__").info("log message...")
+    ...     close_job_log()
+    >>> flush_logs()
+    True
+    >>> with open(f"{result_dir}/log.log") as f:
+    ...     print(f.read().split(" - ", 2)[2].strip())
+    __main__ - INFO - log message...
+    >>> # 何度呼んでもrootのloggerのハンドラは増えない
+    >>> sum(isinstance(h, _JobQueueHandler) for h in set_logging(result_dir).handlers)
+    1
+    """
+    _start_listener()
+    if result_dir is None:
+        return logging.getLogger()
+    job_id = _current_job_id.get()
+    if job_id is None:
+        job_id = os.path.basename(os.path.normpath(result_dir))
+        _current_job_id.set(job_id)
+    if _router is not None:
+        _router.add_route(job_id, f"{result_dir}/log.log")
+
+    return logging.getLogger()
+
+
+def close_job_log() -> None:
+    """実行中のジョブのログファイルを閉じる関数．それまでのログを書き込んだ後に閉じる
+    Returns:
+        None
+    Notes:
+        閉じた後に同じジョブのログが出力された場合は，ファイルを開き直して追記する
+    """
+    job_id = _current_job_id.get()
+    if _queue_handler is None or job_id is None:
+        return
+    _queue_handler.enqueue(logging.makeLogRecord({"close_job_log": True, "job_id": job_id}))
+
+
+def flush_logs(timeout: Optional[float] = 5.0) -> bool:
+    """それまでに出力したログが全てファイルに書き込まれるまで待つ関数
+    Args:
+        timeout (float | None): 待機する最大秒数
+    Returns:
+        bool: 書き込みが終わった場合はTrue
+    Notes:
+        doctestはset_loggingを参照
+    """
+    if _queue_handler is None:
+        return True
+    flushed = threading.Event()
+    _queue_handler.enqueue(logging.makeLogRecord({"flushed": flushed}))
+
+    return flushed.wait(timeout)
+
+
+# 結果ファイルの書き出しなど，処理の完了を待つ必要のない作業を実行するスレッド
+_background_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="background")
+
+
+def run_in_background(func: Callable, *args, **kwargs) -> Future:
+    """処理の完了を待つ必要のない作業をバックグラウンドのスレッドで実行する関数．
+    Args:
+        func (Callable): 実行する関数
+        *args: funcに渡す位置引数
+        **kwargs: funcに渡すキーワード引数
+    Returns:
+        Future: 実行結果を取得するためのオブジェクト
+
+    Example:
+    >>> future = run_in_background(sum, [1, 2, 3])
+    >>> future.result()
+    6
+    """
+    # ログにジョブIDが付くよう，呼び出し元のコンテキストで実行する
+    return _background_executor.submit(
+        contextvars.copy_context().run, func, *args, **kwargs
     )
-    # ログのフォーマット
-
-    # ファイル出力へのログ出力設定
-    file_handler = logging.FileHandler(f"{result_dir}/log.log", "w")
-    # ログ出力ファイル
-    file_handler.setLevel(logging.DEBUG)  # 出力ログレベル
-    file_handler.setFormatter(formatter)  # フォーマットを指定
-    logger.addHandler(file_handler)
-    return logger
+
+
+def wait_for_background() -> None:
+    """それまでにrun_in_backgroundで登録した作業が全て終わるまで待つ関数．
+    Returns:
+        None
+    """
+    # 作業は登録順に1つずつ実行されるため，最後に登録した作業の終了を待てばよい
+    _background_executor.submit(lambda: None).result()
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()